@@ -0,0 +1,625 @@
+# MIT License
+
+# Copyright 2022 Svetlana Ankundinov
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import hashlib
+import hmac
+import ipaddress
+import json
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+from collections import OrderedDict
+from .Backend import Backend, getbackend
+from .TimeLine import TimeLine
+from .EventFile import checkheader, iterevents, dumps
+
+
+# Every message is a frame header followed by its payload. SUBMIT carries a whole binary
+# timeline file, RUN the SHA-256 digest of one submitted before, BATCH any number of SUBMIT
+# and RUN frames, STATUS a JSON object describing the progress of a job, and HELLO the
+# shared token, which must be the first frame on a connection to an agent that has one.
+FRAME = struct.Struct("<BII")
+
+MSG_SUBMIT = 1
+MSG_RUN = 2
+MSG_BATCH = 3
+MSG_STATUS = 4
+MSG_HELLO = 5
+
+QUEUED = "queued"
+STARTED = "started"
+DONE = "done"
+ERROR = "error"
+UNKNOWN = "unknown"
+FINAL = (DONE, ERROR, UNKNOWN)
+
+
+class ProtocolError(Exception):
+    """Exception raised when a peer sends a malformed frame."""
+
+
+    def __init__(self, message : str = "Malformed frame."):
+        self.message = message
+        super().__init__(self.message)
+
+
+def frame(kind : int, job : int, payload : bytes = b"") -> bytes:
+    """Builds a frame.
+
+    Args:
+        kind (int): One of the MSG_ constants.
+        job (int): The job the frame belongs to, chosen by the client.
+        payload (bytes, optional): The payload. Defaults to b"".
+
+    Returns:
+        bytes: The frame.
+    """
+    return FRAME.pack(kind, job, len(payload)) + payload
+
+
+def readframe(file : object, maxsize : int = 1 << 26) -> tuple:
+    """Reads a frame from a binary file, such as a socket's makefile("rb").
+
+    Args:
+        file (object): The file.
+        maxsize (int, optional): Largest payload accepted, in bytes. Defaults to 64 MiB.
+
+    Raises:
+        ProtocolError: Raised if the frame is truncated or too large.
+
+    Returns:
+        tuple: The kind, job and payload, or None at the end of the stream.
+    """
+    header = file.read(FRAME.size)
+    if not header:
+        return None
+    if len(header) < FRAME.size:
+        raise ProtocolError("Truncated frame header.")
+    kind, job, size = FRAME.unpack(header)
+    if size > maxsize:
+        raise ProtocolError(f"Frame of {size} bytes exceeds the limit of {maxsize}.")
+    payload = file.read(size)
+    if len(payload) < size:
+        raise ProtocolError("Truncated frame payload.")
+    return kind, job, payload
+
+
+def iterframes(payload : bytes):
+    """Splits the payload of a BATCH frame into its frames.
+
+    Args:
+        payload (bytes): The payload.
+
+    Raises:
+        ProtocolError: Raised if a frame is truncated.
+
+    Yields:
+        tuple: The kind, job and payload of each frame.
+    """
+    offset = 0
+    while offset < len(payload):
+        if offset + FRAME.size > len(payload):
+            raise ProtocolError("Truncated frame header in batch.")
+        kind, job, size = FRAME.unpack_from(payload, offset)
+        offset += FRAME.size
+        if offset + size > len(payload):
+            raise ProtocolError("Truncated frame payload in batch.")
+        yield kind, job, payload[offset:offset + size]
+        offset += size
+
+
+def _token(token : object) -> bytes:
+    return token.encode("utf-8") if isinstance(token, str) else token
+
+
+def isloopback(host : str) -> bool:
+    """Tells whether every address a host name resolves to is a loopback address.
+
+    Args:
+        host (str): A host name or IP address. The empty string stands for every interface.
+
+    Returns:
+        bool: True if only this machine can reach the host.
+    """
+    if not host:
+        return False
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, None)}
+    except OSError:
+        return False
+    return all(ipaddress.ip_address(address.split("%")[0]).is_loopback for address in addresses)
+
+
+class Compiled:
+    """A submitted timeline, parsed and compiled once and kept in the cache of an Agent.
+
+    Args:
+        timeline (TimeLine): The TimeLine, which runs once without a start pause.
+        events (int): Number of top level events.
+    """
+
+    __slots__ = ("timeline", "plan", "events", "runs")
+
+
+    def __init__(self, timeline : TimeLine, events : int):
+        self.timeline = timeline
+        self.plan = timeline.compile()
+        self.events = events
+        self.runs = 0
+
+
+class Connection(socketserver.StreamRequestHandler):
+    """Handles one client of an Agent: reads its frames, queues its jobs and streams their
+    status back. The connection is kept open until every job it submitted has finished.
+    """
+
+
+    def setup(self):
+        super().setup()
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.finished = threading.Condition(self.lock)
+
+
+    def send(self, job : int, status : dict, tracked : bool = True):
+        """Sends the status of a job to the client. A client which went away is ignored.
+
+        Args:
+            job (int): The job.
+            status (dict): The status.
+            tracked (bool, optional): The status belongs to a job the connection waits for. Defaults to True.
+        """
+        data = frame(MSG_STATUS, job, json.dumps(status).encode("utf-8"))
+        with self.lock:
+            if tracked and status["state"] in FINAL:
+                self.pending -= 1
+                self.finished.notify_all()
+            try:
+                self.wfile.write(data)
+                self.wfile.flush()
+            except OSError:
+                pass
+
+
+    def handle(self):
+        agent = self.server.agent
+        authenticated = agent.token is None
+        try:
+            while True:
+                message = readframe(self.rfile, agent.maxframe)
+                if message is None:
+                    break
+                kind, job, payload = message
+                if kind == MSG_HELLO:
+                    if agent.token is not None and not hmac.compare_digest(payload, agent.token):
+                        raise ProtocolError("Authentication failed.")
+                    authenticated = True
+                elif not authenticated:
+                    raise ProtocolError("Authentication required.")
+                elif kind == MSG_BATCH:
+                    for message in list(iterframes(payload)):
+                        self.submit(agent, *message)
+                else:
+                    self.submit(agent, kind, job, payload)
+        except (ProtocolError, OSError) as e:
+            agent.errors += 1
+            self.send(0, {"job" : 0, "state" : ERROR, "error" : str(e)}, tracked=False)
+        with self.lock:
+            while self.pending > 0:
+                self.finished.wait()
+
+
+    def submit(self, agent : "Agent", kind : int, job : int, payload : bytes):
+        with self.lock:
+            self.pending += 1
+        agent.submit(self, kind, job, payload)
+
+
+class Agent:
+    """Long running process which plays timelines sent to it over a socket.
+
+    Clients send binary timeline files, as written by EventFile.dumps(), in length-prefixed
+    frames. Each one is parsed and compiled once and cached by its SHA-256 digest, so sending
+    the same file again, or only its digest, skips straight to playing it. Jobs from every
+    client run one at a time on a single worker thread, through a backend resolved when the
+    agent starts, and their progress is streamed back to the client as JSON status frames.
+
+    Anyone who can connect to an agent can send input to this machine. A Unix socket is only
+    accessible to the user running the agent, and TCP is only served on loopback addresses
+    unless allowremote is set, which also requires a token. With a token, every client must
+    open its connection with a HELLO frame holding the same token.
+
+    Args:
+        address (object): A path for a Unix socket, or a (host, port) tuple for TCP. Port 0 picks a free port.
+        backend (Backend, optional): Backend the input is sent through. Defaults to the backend returned by getbackend().
+        cachesize (int, optional): Maximum number of compiled timelines kept. Defaults to 64.
+        maxframe (int, optional): Largest frame payload accepted, in bytes. Defaults to 64 MiB.
+        token (str, optional): Shared secret clients must send before anything else. Defaults to None.
+        allowremote (bool, optional): Allow binding TCP to addresses other machines can reach. Defaults to False.
+
+    Raises:
+        ValueError: Raised if allowremote is set without a token.
+    """
+
+
+    def __init__(self, address : object, backend : Backend = None, cachesize : int = 64, maxframe : int = 1 << 26, token : str = None, allowremote : bool = False):
+        if allowremote and not token:
+            raise ValueError("A token is required to accept remote connections.")
+        self.address = address
+        self.token = _token(token) if token else None
+        self.allowremote = allowremote
+        self.backend = backend
+        self.cachesize = cachesize
+        self.maxframe = maxframe
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.jobs = queue.Queue()
+        self.server = None
+        self.threads = ()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+
+    def start(self):
+        """Resolves the backend, binds the socket and starts serving. Returns immediately.
+
+        Raises:
+            ValueError: Raised if a TCP address other machines can reach is given without allowremote.
+        """
+        if not isinstance(self.address, str) and not self.allowremote and not isloopback(self.address[0]):
+            raise ValueError(f"Refusing to accept input from other machines on {self.address[0]!r}; pass allowremote and a token to allow it.")
+        if self.backend is None:
+            self.backend = getbackend()
+        self.backend.position()
+        if isinstance(self.address, str):
+            umask = os.umask(0o177)
+            try:
+                server = socketserver.ThreadingUnixStreamServer(self.address, Connection)
+            finally:
+                os.umask(umask)
+        else:
+            server = socketserver.ThreadingTCPServer(self.address, Connection, bind_and_activate=False)
+            server.allow_reuse_address = True
+            server.server_bind()
+            server.server_activate()
+            self.address = server.server_address[:2]
+        server.daemon_threads = True
+        server.agent = self
+        self.server = server
+        self.threads = (
+            threading.Thread(target=server.serve_forever, args=(.05,), name="RsClick agent", daemon=True),
+            threading.Thread(target=self.work, name="RsClick agent worker", daemon=True),
+        )
+        for thread in self.threads:
+            thread.start()
+
+
+    def stop(self):
+        """Stops serving once the current job has finished, and closes the socket."""
+        if self.server is None:
+            return
+        self.server.shutdown()
+        self.jobs.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.server.server_close()
+        self.server = None
+        if isinstance(self.address, str):
+            try:
+                os.remove(self.address)
+            except OSError:
+                pass
+
+
+    def serve(self):
+        """Starts serving and blocks until interrupted."""
+        self.start()
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+
+    def __enter__(self):
+        self.start()
+        return self
+
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+    def load(self, data : bytes) -> tuple:
+        """Returns the compiled timeline for the contents of a timeline file, from the cache if it was submitted before.
+
+        Args:
+            data (bytes): The file contents.
+
+        Raises:
+            InvalidFileError: Raised if the data is not a valid timeline file.
+
+        Returns:
+            tuple: The hex digest of the data, the Compiled timeline, and whether it came from the cache.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        compiled = self.lookup(digest)
+        if compiled is not None:
+            return digest, compiled, True
+        record = checkheader(data)
+        events = tuple(iterevents(data, record=record))
+        timeline = TimeLine(*events, startpause=0, repeat=False, verbose=False, printloops=False, backend=self.backend)
+        compiled = Compiled(timeline, len(events))
+        with self.lock:
+            self.misses += 1
+            self.cache[digest] = compiled
+            while len(self.cache) > self.cachesize:
+                self.cache.popitem(last=False)
+        return digest, compiled, False
+
+
+    def lookup(self, digest : str) -> Compiled:
+        """Returns a cached timeline by its hex digest.
+
+        Args:
+            digest (str): The digest.
+
+        Returns:
+            Compiled: The timeline, or None if it is not cached.
+        """
+        with self.lock:
+            compiled = self.cache.get(digest)
+            if compiled is not None:
+                self.cache.move_to_end(digest)
+                self.hits += 1
+            return compiled
+
+
+    def submit(self, connection : Connection, kind : int, job : int, payload : bytes):
+        """Parses a SUBMIT or RUN frame and queues its job, reporting it as queued, unknown or failed.
+
+        Args:
+            connection (Connection): The client.
+            kind (int): MSG_SUBMIT or MSG_RUN.
+            job (int): The job.
+            payload (bytes): The payload.
+        """
+        status = {"job" : job}
+        try:
+            if kind == MSG_SUBMIT:
+                digest, compiled, cached = self.load(payload)
+            elif kind == MSG_RUN:
+                digest = payload.hex()
+                compiled = self.lookup(digest)
+                cached = True
+                if compiled is None:
+                    status.update(state=UNKNOWN, hash=digest)
+                    connection.send(job, status)
+                    return
+            else:
+                raise ProtocolError(f"Unexpected frame type {kind}.")
+        except Exception as e:
+            self.errors += 1
+            status.update(state=ERROR, error=f"{type(e).__name__}: {e}")
+            connection.send(job, status)
+            return
+        status.update(hash=digest, cached=cached, events=compiled.events)
+        connection.send(job, dict(status, state=QUEUED))
+        self.jobs.put((connection, job, status, compiled))
+
+
+    def work(self):
+        """Runs queued jobs one at a time until the agent stops."""
+        while True:
+            item = self.jobs.get()
+            if item is None:
+                return
+            connection, job, status, compiled = item
+            connection.send(job, dict(status, state=STARTED))
+            timeline = compiled.timeline
+            start = time.perf_counter()
+            try:
+                timeline.random.reset()
+                timeline.scheduler.reset()
+                timeline.play(compiled.plan, self.backend)
+            except Exception as e:
+                self.errors += 1
+                status.update(state=ERROR, error=f"{type(e).__name__}: {e}")
+            else:
+                compiled.runs += 1
+                status.update(state=DONE)
+            status["seconds"] = time.perf_counter() - start
+            connection.send(job, status)
+
+
+    def report(self) -> dict:
+        """Summarises the cache.
+
+        Returns:
+            dict: The number of cached timelines, cache hits and misses, and failed jobs.
+        """
+        with self.lock:
+            return {"cached" : len(self.cache), "hits" : self.hits, "misses" : self.misses, "errors" : self.errors}
+
+
+class Client:
+    """Submits timelines to an Agent and follows their progress.
+
+    Timelines the agent has already finished once are sent by digest only. If the agent has
+    since evicted one from its cache, it is sent again in full automatically.
+
+    Args:
+        address (object): The agent's Unix socket path or (host, port) tuple.
+        timeout (float, optional): Socket timeout in seconds. Defaults to None.
+        token (str, optional): The agent's shared token. Defaults to None.
+    """
+
+
+    def __init__(self, address : object, timeout : float = None, token : str = None):
+        family = socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+        self.socket = socket.socket(family, socket.SOCK_STREAM)
+        self.socket.settimeout(timeout)
+        self.socket.connect(address)
+        if token:
+            self.socket.sendall(frame(MSG_HELLO, 0, _token(token)))
+        self.file = self.socket.makefile("rb")
+        self.known = set()
+        self.payloads = {}
+        self.next = 1
+
+
+    def close(self):
+        """Closes the connection."""
+        self.file.close()
+        self.socket.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+    def message(self, job : int, data : bytes) -> bytes:
+        digest = hashlib.sha256(data).digest()
+        self.payloads[job] = (digest, data)
+        if digest in self.known:
+            return frame(MSG_RUN, job, digest)
+        return frame(MSG_SUBMIT, job, data)
+
+
+    def submit(self, *timelines) -> list:
+        """Sends timelines to the agent in a single batch.
+
+        Args:
+            *timelines: Contents of binary timeline files, or iterables of events which are encoded first.
+
+        Returns:
+            list: The job number of each timeline, in order.
+        """
+        jobs = []
+        frames = []
+        for timeline in timelines:
+            data = timeline if isinstance(timeline, (bytes, bytearray)) else dumps(timeline)
+            job = self.next
+            self.next += 1
+            jobs.append(job)
+            frames.append(self.message(job, bytes(data)))
+        if len(frames) == 1:
+            self.socket.sendall(frames[0])
+        else:
+            self.socket.sendall(frame(MSG_BATCH, len(frames), b"".join(frames)))
+        return jobs
+
+
+    def status(self) -> dict:
+        """Reads the next status sent by the agent.
+
+        Raises:
+            ProtocolError: Raised if the connection closes or a frame is malformed.
+
+        Returns:
+            dict: The status.
+        """
+        message = readframe(self.file)
+        if message is None:
+            raise ProtocolError("Connection closed by the agent.")
+        kind, job, payload = message
+        if kind != MSG_STATUS:
+            raise ProtocolError(f"Unexpected frame type {kind}.")
+        status = json.loads(payload)
+        if status["state"] == DONE and job in self.payloads:
+            self.known.add(self.payloads[job][0])
+        return status
+
+
+    def wait(self, jobs : list):
+        """Streams the status of jobs until each one has finished. Jobs sent by digest which
+        the agent no longer knows are sent again in full.
+
+        Args:
+            jobs (list): Job numbers returned by submit().
+
+        Yields:
+            dict: Every status received, including the final one of each job.
+        """
+        remaining = set(jobs)
+        while remaining:
+            status = self.status()
+            job = status["job"]
+            if status["state"] == UNKNOWN and job in self.payloads:
+                digest, data = self.payloads[job]
+                self.known.discard(digest)
+                self.socket.sendall(frame(MSG_SUBMIT, job, data))
+                continue
+            if job == 0 and status["state"] == ERROR:
+                raise ProtocolError(status.get("error", "Malformed frame."))
+            yield status
+            if status["state"] in FINAL:
+                remaining.discard(job)
+                self.payloads.pop(job, None)
+
+
+    def run(self, *timelines) -> list:
+        """Submits timelines and waits for them to finish.
+
+        Args:
+            *timelines: Contents of binary timeline files, or iterables of events.
+
+        Returns:
+            list: The final status of each timeline, in order.
+        """
+        jobs = self.submit(*timelines)
+        final = {}
+        for status in self.wait(jobs):
+            if status["state"] in FINAL:
+                final[status["job"]] = status
+        return [final[job] for job in jobs]
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Plays RsClick timelines sent over a socket.")
+    parser.add_argument("address", help="Unix socket path, or host:port for TCP")
+    parser.add_argument("--cachesize", type=int, default=64, help="Maximum number of compiled timelines kept")
+    parser.add_argument("--token", default=os.environ.get("RSCLICK_AGENT_TOKEN"), help="Shared token clients must send, defaults to $RSCLICK_AGENT_TOKEN")
+    parser.add_argument("--allow-remote", action="store_true", help="Accept TCP connections from other machines, requires a token")
+    arguments = parser.parse_args()
+    address = arguments.address
+    if ":" in address and not address.startswith(("/", ".")):
+        host, port = address.rsplit(":", 1)
+        address = (host, int(port))
+    try:
+        agent = Agent(address, cachesize=arguments.cachesize, token=arguments.token, allowremote=arguments.allow_remote)
+        agent.serve()
+    except ValueError as e:
+        parser.error(str(e))
@@ -0,0 +1,305 @@
+# MIT License
+
+# Copyright 2022 Svetlana Ankundinov
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import heapq
+import threading
+import time
+from .Backend import Backend, getbackend
+
+
+MOUSE = "mouse"
+KEYBOARD = "keyboard"
+
+
+class DeviceLock:
+    """Exclusive lock on one input device, granted to waiters by priority.
+
+    Waiters with a higher priority are served first, and waiters of equal priority in the
+    order they arrived. The time the lock is held is accumulated to measure utilization.
+
+    Args:
+        name (str): Name of the device, e.g. "mouse".
+    """
+
+
+    def __init__(self, name : str):
+        self.name = name
+        self.condition = threading.Condition()
+        self.owner = None
+        self.waiting = []
+        self.sequence = 0
+        self.busy = 0.0
+        self.since = None
+        self.started = time.perf_counter()
+
+
+    def reset(self):
+        """Restarts the utilization measurement."""
+        with self.condition:
+            self.busy = 0.0
+            self.started = time.perf_counter()
+            if self.since is not None:
+                self.since = self.started
+
+
+    def acquire(self, owner : object, priority : int = 0, blocking : bool = True) -> float:
+        """Waits until the device is free and no waiter with a higher priority is queued, then takes it.
+
+        Args:
+            owner (object): The object taking the lock.
+            priority (int, optional): Priority of the request, higher is served first. Defaults to 0.
+            blocking (bool, optional): Wait for the lock. If False, it is only taken if it is free and nobody is waiting for it. Defaults to True.
+
+        Returns:
+            float: Time in seconds spent waiting for the lock, or None if it was not taken.
+        """
+        start = time.perf_counter()
+        with self.condition:
+            if self.owner is not None or self.waiting:
+                if not blocking:
+                    return None
+                entry = (-priority, self.sequence, owner)
+                self.sequence += 1
+                heapq.heappush(self.waiting, entry)
+                while self.owner is not None or self.waiting[0] is not entry:
+                    self.condition.wait()
+                heapq.heappop(self.waiting)
+            self.owner = owner
+            self.since = time.perf_counter()
+            return self.since - start
+
+
+    def release(self):
+        """Gives the device up and wakes the waiters."""
+        with self.condition:
+            self.busy += time.perf_counter() - self.since
+            self.owner = None
+            self.since = None
+            self.condition.notify_all()
+
+
+    def utilization(self) -> float:
+        """Returns the fraction of time the device has been held since the last reset."""
+        with self.condition:
+            now = time.perf_counter()
+            busy = self.busy + (now - self.since if self.since is not None else 0.0)
+            elapsed = now - self.started
+        return busy / elapsed if elapsed > 0 else 0.0
+
+
+class ArbitratedBackend(Backend):
+    """Backend which takes the device locks of an Arbiter around the input of one TimeLine.
+
+    A pressed button or key holds its device until every button or key pressed on it has been
+    released again, so a press-hold-release, e.g. a drag, is never interleaved with input from
+    another TimeLine. Any other single input holds its device only while it is being sent.
+
+    The mouse is always locked before the keyboard, so two TimeLines holding one device each
+    can never wait for each other. A TimeLine holding the keyboard takes the mouse only if it
+    is free; otherwise it gives the keyboard up and waits for the mouse and then the keyboard.
+
+    Args:
+        backend (Backend): Backend the input is passed on to.
+        arbiter (Arbiter): Arbiter owning the device locks.
+        priority (int, optional): Priority of the requests for the locks, higher is served first. Defaults to 0.
+    """
+
+
+    def __init__(self, backend : Backend, arbiter : "Arbiter", priority : int = 0):
+        self.backend = backend
+        self.arbiter = arbiter
+        self.priority = priority
+        self.held = {MOUSE : set(), KEYBOARD : set()}
+        self.stats = [0, 0.0, 0.0]
+
+
+    def acquire(self, device : str):
+        """Takes the lock on a device unless this backend already holds it, recording the wait."""
+        if self.held[device]:
+            return
+        locks = self.arbiter.locks
+        if device == MOUSE and self.held[KEYBOARD]:
+            waited = locks[MOUSE].acquire(self, self.priority, blocking=False)
+            if waited is None:
+                locks[KEYBOARD].release()
+                waited = locks[MOUSE].acquire(self, self.priority)
+                waited += locks[KEYBOARD].acquire(self, self.priority)
+        else:
+            waited = locks[device].acquire(self, self.priority)
+        stats = self.stats
+        stats[0] += 1
+        stats[1] += waited
+        if waited > stats[2]:
+            stats[2] = waited
+
+
+    def up(self, device : str, item : object):
+        """Marks a button or key as released, giving the device up once nothing on it is held."""
+        held = self.held[device]
+        if item in held:
+            held.discard(item)
+            if not held:
+                self.arbiter.locks[device].release()
+
+
+    def down(self, device : str, item : object):
+        """Marks a button or key as held, taking the device first."""
+        self.acquire(device)
+        self.held[device].add(item)
+
+
+    def send(self, device : str, method : object, *args):
+        """Calls a backend method while holding the device."""
+        if self.held[device]:
+            method(*args)
+            return
+        self.acquire(device)
+        try:
+            method(*args)
+        finally:
+            self.arbiter.locks[device].release()
+
+
+    def position(self) -> tuple:
+        return self.backend.position()
+
+
+    def moveto(self, x : int, y : int):
+        self.send(MOUSE, self.backend.moveto, x, y)
+
+
+    def moveby(self, dx : int, dy : int):
+        self.send(MOUSE, self.backend.moveby, dx, dy)
+
+
+    def press(self, button : object):
+        self.down(MOUSE, button)
+        self.backend.press(button)
+
+
+    def release(self, button : object):
+        self.backend.release(button)
+        self.up(MOUSE, button)
+
+
+    def click(self, button : object, count : int = 1):
+        self.send(MOUSE, self.backend.click, button, count)
+
+
+    def scroll(self, dx : int, dy : int):
+        self.send(MOUSE, self.backend.scroll, dx, dy)
+
+
+    def keydown(self, key : object):
+        self.down(KEYBOARD, key)
+        self.backend.keydown(key)
+
+
+    def keyup(self, key : object):
+        self.backend.keyup(key)
+        self.up(KEYBOARD, key)
+
+
+    def type(self, text : str):
+        self.send(KEYBOARD, self.backend.type, text)
+
+
+class Arbiter:
+    """Runs several TimeLines at once, each on its own thread, arbitrating the mouse and keyboard between them.
+
+    TimeLines only wait for each other while one of them holds a device, so TimeLines using
+    different devices run fully in parallel. When several TimeLines wait for the same device,
+    the one with the highest priority gets it first.
+
+    Args:
+        backend (Backend, optional): Backend shared by TimeLines added without a backend of their own. Defaults to the backend returned by getbackend().
+    """
+
+
+    def __init__(self, backend : Backend = None):
+        self.backend = backend
+        self.locks = {MOUSE : DeviceLock(MOUSE), KEYBOARD : DeviceLock(KEYBOARD)}
+        self.timelines = []
+        self.threads = []
+
+
+    def add(self, timeline : object, priority : int = 0, name : str = None) -> object:
+        """Adds a TimeLine, routing its input through the arbiter.
+
+        Args:
+            timeline (TimeLine): The TimeLine to add. Its backend is replaced by an ArbitratedBackend.
+            priority (int, optional): Priority of its requests for the devices, higher is served first. Defaults to 0.
+            name (str, optional): Name it is reported under. Defaults to "timeline <n>".
+
+        Returns:
+            TimeLine: The TimeLine.
+        """
+        backend = timeline.backend
+        if backend is None:
+            backend = self.backend if self.backend is not None else getbackend()
+        timeline.backend = ArbitratedBackend(backend, self, priority)
+        self.timelines.append((name if name is not None else f"timeline {len(self.timelines)}", timeline))
+        return timeline
+
+
+    def start(self):
+        """Starts every TimeLine on its own thread."""
+        for lock in self.locks.values():
+            lock.reset()
+        for name, timeline in self.timelines:
+            timeline.backend.stats = [0, 0.0, 0.0]
+            thread = threading.Thread(target=timeline.start, name=name, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+
+    def join(self, timeout : float = None):
+        """Waits for every TimeLine to finish.
+
+        Args:
+            timeout (float, optional): Maximum time in seconds to wait for each thread. Defaults to None.
+        """
+        for thread in self.threads:
+            thread.join(timeout)
+        self.threads = [thread for thread in self.threads if thread.is_alive()]
+
+
+    def run(self):
+        """Starts every TimeLine and waits for them to finish."""
+        self.start()
+        self.join()
+
+
+    def report(self) -> dict:
+        """Summarises the contention since the last start.
+
+        Returns:
+            dict: "queueing" maps each TimeLine to the count, mean and maximum time in seconds it waited for a device, and "utilization" maps each device to the fraction of time it was held.
+        """
+        queueing = {}
+        for name, timeline in self.timelines:
+            count, total, worst = timeline.backend.stats
+            queueing[name] = {"count" : count, "mean" : total / count if count else 0.0, "max" : worst}
+        return {
+            "queueing" : queueing,
+            "utilization" : {name : lock.utilization() for name, lock in self.locks.items()},
+        }
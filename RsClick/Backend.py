@@ -0,0 +1,275 @@
+# MIT License
+
+# Copyright 2022 Svetlana Ankundinov
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import time
+from .utils import InvalidKeyError
+
+
+class Backend:
+    """Base input backend. Every event reaches the mouse and keyboard through one of these.
+    """
+
+
+    def position(self) -> tuple:
+        """Returns the current (x, y) position of the mouse."""
+        return (0, 0)
+
+
+    def moveto(self, x : int, y : int):
+        """Moves the mouse to an absolute position."""
+
+
+    def moveby(self, dx : int, dy : int):
+        """Moves the mouse relative to its current position."""
+
+
+    def press(self, button : object):
+        """Presses a mouse button."""
+
+
+    def release(self, button : object):
+        """Releases a mouse button."""
+
+
+    def click(self, button : object, count : int = 1):
+        """Clicks a mouse button count times."""
+
+
+    def scroll(self, dx : int, dy : int):
+        """Scrolls the mouse wheel."""
+
+
+    def keydown(self, key : object):
+        """Presses a key."""
+
+
+    def keyup(self, key : object):
+        """Releases a key."""
+
+
+    def type(self, text : str):
+        """Types a string."""
+
+class NullBackend(Backend):
+    """Backend which discards all input. Useful for measuring pure dispatch overhead.
+    """
+
+class PynputBackend(Backend):
+    """Backend which sends input to the real mouse and keyboard through pynput. Events hold
+    buttons and keys by name, and this is the only place they are turned into pynput objects.
+    """
+
+
+    def __init__(self):
+        self._mouse = None
+        self._keyboard = None
+        self.buttons = {}
+        self.keys = {}
+
+
+    @property
+    def mouse(self) -> object:
+        """The pynput mouse controller, created on first use."""
+        if self._mouse is None:
+            from pynput.mouse import Controller as mctrl
+            self._mouse = mctrl()
+        return self._mouse
+
+
+    @property
+    def keyboard(self) -> object:
+        """The pynput keyboard controller, created on first use."""
+        if self._keyboard is None:
+            from pynput.keyboard import Controller as kctrl
+            self._keyboard = kctrl()
+        return self._keyboard
+
+
+    def button(self, button : str) -> object:
+        """Returns the pynput Button for a button name, converting each name once."""
+        converted = self.buttons.get(button)
+        if converted is None:
+            from pynput.mouse import Button
+            converted = self.buttons[button] = getattr(Button, button)
+        return converted
+
+
+    def key(self, key : object) -> object:
+        """Returns what the pynput controller expects for a key name, character or virtual key code.
+
+        Raises:
+            InvalidKeyError: Raised if the key names no pynput Key on this platform.
+        """
+        converted = self.keys.get(key)
+        if converted is None:
+            from pynput.keyboard import Key, KeyCode
+            if isinstance(key, int):
+                converted = KeyCode.from_vk(key)
+            elif isinstance(key, str) and len(key) > 1:
+                converted = getattr(Key, key, None)
+                if converted is None:
+                    raise InvalidKeyError(key)
+            else:
+                converted = key
+            self.keys[key] = converted
+        return converted
+
+
+    def position(self) -> tuple:
+        return self.mouse.position
+
+
+    def moveto(self, x : int, y : int):
+        self.mouse.position = (x, y)
+
+
+    def moveby(self, dx : int, dy : int):
+        self.mouse.move(dx, dy)
+
+
+    def press(self, button : object):
+        self.mouse.press(self.button(button))
+
+
+    def release(self, button : object):
+        self.mouse.release(self.button(button))
+
+
+    def click(self, button : object, count : int = 1):
+        self.mouse.click(self.button(button), count)
+
+
+    def scroll(self, dx : int, dy : int):
+        self.mouse.scroll(dx, dy)
+
+
+    def keydown(self, key : object):
+        self.keyboard.press(self.key(key))
+
+
+    def keyup(self, key : object):
+        self.keyboard.release(self.key(key))
+
+
+    def type(self, text : str):
+        self.keyboard.type(text)
+
+class RecordingBackend(Backend):
+    """Backend which stores every input in memory instead of sending it to a device.
+
+    Records are (timestamp, action, a, b) tuples kept in a ring buffer, so only the most recent
+    capacity records are retained. The mouse position is tracked virtually.
+
+    Args:
+        capacity (int, optional): Maximum number of records kept. Defaults to 65536.
+        clock (callable, optional): Function returning the timestamp of each record. Defaults to time.perf_counter.
+    """
+
+
+    def __init__(self, capacity : int = 65536, clock : object = time.perf_counter):
+        from collections import deque
+        self.records = deque(maxlen=capacity)
+        self.clock = clock
+        self.x = 0
+        self.y = 0
+
+
+    def clear(self):
+        """Discards every stored record."""
+        self.records.clear()
+
+
+    def actions(self) -> list:
+        """Returns the recorded inputs without their timestamps.
+
+        Returns:
+            list: (action, a, b) tuples in the order they happened.
+        """
+        return [record[1:] for record in self.records]
+
+
+    def position(self) -> tuple:
+        return (self.x, self.y)
+
+
+    def moveto(self, x : int, y : int):
+        self.x, self.y = x, y
+        self.records.append((self.clock(), "moveto", x, y))
+
+
+    def moveby(self, dx : int, dy : int):
+        self.x += dx
+        self.y += dy
+        self.records.append((self.clock(), "moveby", dx, dy))
+
+
+    def press(self, button : object):
+        self.records.append((self.clock(), "press", button, None))
+
+
+    def release(self, button : object):
+        self.records.append((self.clock(), "release", button, None))
+
+
+    def click(self, button : object, count : int = 1):
+        self.records.append((self.clock(), "click", button, count))
+
+
+    def scroll(self, dx : int, dy : int):
+        self.records.append((self.clock(), "scroll", dx, dy))
+
+
+    def keydown(self, key : object):
+        self.records.append((self.clock(), "keydown", key, None))
+
+
+    def keyup(self, key : object):
+        self.records.append((self.clock(), "keyup", key, None))
+
+
+    def type(self, text : str):
+        self.records.append((self.clock(), "type", text, None))
+
+
+DEFAULT_BACKEND = None
+
+
+def getbackend() -> Backend:
+    """Returns the backend used by events which are not given one, creating a PynputBackend on first use.
+
+    Returns:
+        Backend: The default backend.
+    """
+    global DEFAULT_BACKEND
+    if DEFAULT_BACKEND is None:
+        DEFAULT_BACKEND = PynputBackend()
+    return DEFAULT_BACKEND
+
+
+def setbackend(backend : Backend):
+    """Replaces the default backend, e.g. with a RecordingBackend on a headless machine.
+
+    Args:
+        backend (Backend): The new default backend.
+    """
+    global DEFAULT_BACKEND
+    DEFAULT_BACKEND = backend
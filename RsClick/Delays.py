@@ -0,0 +1,211 @@
+# MIT License
+
+# Copyright 2022 Svetlana Ankundinov
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import math
+from .utils import InvalidIntervalError
+
+
+DISTRIBUTIONS = ("uniform", "truncnormal", "lognormal")
+
+
+class InvalidDistributionError(Exception):
+    """Exception raised when an unknown delay distribution is requested."""
+
+
+    def __init__(self):
+        self.message = f"Invalid distribution, options are {', '.join(DISTRIBUTIONS)}."
+        super().__init__(self.message)
+
+
+def _numpy() -> object:
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+class DelayStream:
+    """Delays for a single randomization range, drawn a block at a time.
+
+    Args:
+        source (RandomSource): The source the stream belongs to.
+        low (float): Lower bound.
+        high (float): Upper bound.
+        generator (object): The random generator the stream draws from.
+    """
+
+
+    def __init__(self, source : "RandomSource", low : float, high : float, generator : object):
+        self.source = source
+        self.low = low
+        self.high = high
+        self.generator = generator
+        self.block = []
+        self.index = 0
+
+
+    def next(self) -> float:
+        """Returns the next delay, drawing a new block when the current one runs out.
+
+        Returns:
+            float: A delay within the range.
+        """
+        if self.index >= len(self.block):
+            self.block = self.source.draw(self.generator, self.low, self.high, self.source.blocksize)
+            self.index = 0
+        value = self.block[self.index]
+        self.index += 1
+        return value
+
+
+class RandomSource:
+    """Seeded source of the randomized delays of a TimeLine.
+
+    Every randomization range in a script gets its own stream with its own generator, derived
+    from the seed in the order the ranges are compiled. Streams draw a whole block of delays at
+    once, vectorized with numpy when it is installed, so a given seed replays exactly and
+    independently of other threads.
+
+    Args:
+        seed (int, optional): Seed to replay. Defaults to None, which draws fresh entropy.
+        distribution (str, optional): "uniform", "truncnormal" or "lognormal". The last two are truncated to the range. Defaults to "uniform".
+        blocksize (int, optional): Number of delays drawn at a time. Defaults to 1024.
+    """
+
+
+    def __init__(self, seed : int = None, distribution : str = "uniform", blocksize : int = 1024):
+        if distribution not in DISTRIBUTIONS:
+            raise InvalidDistributionError
+        self.seed = seed
+        self.distribution = distribution
+        self.blocksize = blocksize
+        self.streams = {}
+        self.numpy = None
+        self.seeds = None
+
+
+    def reset(self):
+        """Rewinds every stream to the start of the sequence given by the seed and draws its first block."""
+        self.seeds = None
+        for stream in self.streams.values():
+            stream.generator = self.generator()
+            stream.block = self.draw(stream.generator, stream.low, stream.high, self.blocksize)
+            stream.index = 0
+
+
+    def generator(self) -> object:
+        """Returns a new generator, the next one in the sequence derived from the seed.
+
+        Returns:
+            object: A numpy Generator, or a random.Random if numpy is missing.
+        """
+        if self.seeds is None:
+            self.numpy = _numpy()
+            if self.numpy is not None:
+                self.seeds = self.numpy.random.SeedSequence(self.seed)
+            else:
+                import random
+                self.seeds = random.Random(self.seed)
+        if self.numpy is not None:
+            return self.numpy.random.default_rng(self.seeds.spawn(1)[0])
+        import random
+        return random.Random(self.seeds.getrandbits(64))
+
+
+    def stream(self, low : float, high : float) -> DelayStream:
+        """Returns the stream for a range, creating it on first use.
+
+        Args:
+            low (float): Lower bound.
+            high (float): Upper bound.
+
+        Raises:
+            InvalidIntervalError: Raised if the range is invalid.
+
+        Returns:
+            DelayStream: The stream.
+        """
+        if low > high:
+            raise InvalidIntervalError
+        stream = self.streams.get((low, high))
+        if stream is None:
+            stream = self.streams[(low, high)] = DelayStream(self, low, high, self.generator())
+        return stream
+
+
+    def draw(self, generator : object, low : float, high : float, count : int) -> list:
+        """Draws a block of delays from a generator.
+
+        Args:
+            generator (object): A numpy Generator, or a random.Random if numpy is missing.
+            low (float): Lower bound.
+            high (float): Upper bound.
+            count (int): Number of delays.
+
+        Returns:
+            list: The delays.
+        """
+        if self.numpy is not None:
+            return self.array(generator, low, high, count).tolist()
+        if self.distribution == "uniform" or low == high:
+            return [generator.uniform(low, high) for _ in range(count)]
+        if self.distribution == "truncnormal":
+            mu, sigma = (low + high) / 2, (high - low) / 4
+        else:
+            low = max(low, high * 1e-3)
+            mu, sigma = math.log(low * high) / 2, math.log(high / low) / 4
+        sample = generator.gauss if self.distribution == "truncnormal" else generator.lognormvariate
+        values = []
+        while len(values) < count:
+            value = sample(mu, sigma)
+            if low <= value <= high:
+                values.append(value)
+        return values
+
+
+    def array(self, generator : object, low : float, high : float, count : int) -> object:
+        """Draws a block of delays from a numpy Generator as an array.
+
+        Args:
+            generator (object): A numpy Generator.
+            low (float): Lower bound.
+            high (float): Upper bound.
+            count (int): Number of delays.
+
+        Returns:
+            numpy.ndarray: The delays.
+        """
+        if self.distribution == "uniform" or low == high:
+            return generator.uniform(low, high, count)
+        if self.distribution == "truncnormal":
+            mu, sigma = (low + high) / 2, (high - low) / 4
+        else:
+            low = max(low, high * 1e-3)
+            mu, sigma = math.log(low * high) / 2, math.log(high / low) / 4
+        sample = generator.normal if self.distribution == "truncnormal" else generator.lognormal
+        values = sample(mu, sigma, count)
+        outside = (values < low) | (values > high)
+        while outside.any():
+            values[outside] = sample(mu, sigma, int(outside.sum()))
+            outside = (values < low) | (values > high)
+        return values
@@ -0,0 +1,323 @@
+# MIT License
+
+# Copyright 2022 Svetlana Ankundinov
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import struct
+import mmap
+from .utils import KEYNAMES, BUTTONNAMES, InvalidEventError
+from .TimeLine import *
+
+
+# A file is a header followed by fixed-width records, one per event. TypeEvents are followed
+# by their UTF-8 text padded to a whole number of records, as are ChordEvents by their key
+# spec, and Loops are written as a
+# REC_LOOP record, their events, and a REC_ENDLOOP record. MouseMoveEvents with a HumanMotion
+# only store a flag and are read back with the shared default motion. Version 1 files stored
+# delays in single precision and are still read.
+MAGIC = b"RSCK"
+VERSION = 2
+HEADER = struct.Struct("<4sHH")
+RECORD = struct.Struct("<BBhiiddd")
+RECORDS = {1: struct.Struct("<BBhiifff"), 2: RECORD}
+
+REC_PAUSE = 1
+REC_CLICK = 2
+REC_MOVE = 3
+REC_KEY = 4
+REC_TYPE = 5
+REC_SCROLL = 6
+REC_LOOP = 7
+REC_ENDLOOP = 8
+REC_CHORD = 9
+REC_MOUSEDOWN = 10
+REC_MOUSEUP = 11
+REC_KEYDOWN = 12
+REC_KEYUP = 13
+
+FLAG_RANGE = 1
+FLAG_DOUBLECLICK = 1
+FLAG_RELATIVE = 1
+FLAG_VK = 2
+FLAG_MOTION = 2
+
+
+class InvalidFileError(Exception):
+    """Exception raised when a file is not a valid binary timeline."""
+
+
+    def __init__(self, message : str = "Not a valid RsClick timeline file."):
+        self.message = message
+        super().__init__(self.message)
+
+
+def _delays(releasedelay : object, hold : float) -> tuple:
+    if isinstance(releasedelay, (list, tuple)) and len(releasedelay) == 2:
+        return float(releasedelay[0]), float(releasedelay[1]), float(hold)
+    return 0.0, 0.0, float(hold)
+
+
+def _keycode(key : object) -> tuple:
+    if key in KEYNAMES:
+        return -(KEYNAMES.index(key) + 1), 0
+    if isinstance(key, str) and len(key) == 1:
+        return ord(key), 0
+    if isinstance(key, int):
+        return key, FLAG_VK
+    raise ValueError(f"Key {key!r} can not be stored in a timeline file.")
+
+
+def _key(code : int, flags : int) -> object:
+    if flags & FLAG_VK:
+        return code
+    if code < 0:
+        return KEYNAMES[-code - 1]
+    return chr(code)
+
+
+def encode(event : Event) -> bytes:
+    """Encodes an event into its binary records.
+
+    Args:
+        event (Event): The event to encode. Loops are encoded together with their events.
+
+    Raises:
+        InvalidEventError: Raised if the object is not one of the built in events.
+
+    Returns:
+        bytes: One or more records.
+    """
+    pack = RECORD.pack
+    if isinstance(event, PauseEvent):
+        time = event.time
+        if isinstance(time, (list, tuple)):
+            return pack(REC_PAUSE, FLAG_RANGE, 0, 0, 0, time[0], time[1], 0.0)
+        return pack(REC_PAUSE, 0, 0, 0, 0, time, time, 0.0)
+    if isinstance(event, MouseMoveEvent):
+        flags = (FLAG_RELATIVE if event.relative else 0) | (FLAG_MOTION if event.motion is not None else 0)
+        return pack(REC_MOVE, flags, 0, event.x, event.y, 0.0, 0.0, 0.0)
+    if isinstance(event, MouseClickEvent):
+        flags = FLAG_DOUBLECLICK if event.doubleclick else 0
+        return pack(REC_CLICK, flags, BUTTONNAMES.index(event.button), 0, 0, *_delays(event.releasedelay, event.hold))
+    if isinstance(event, KeyEvent):
+        code, flags = _keycode(event.key)
+        return pack(REC_KEY, flags, 0, code, 0, *_delays(event.releasedelay, event.hold))
+    if isinstance(event, MouseDownEvent):
+        kind = REC_MOUSEUP if isinstance(event, MouseUpEvent) else REC_MOUSEDOWN
+        return pack(kind, 0, BUTTONNAMES.index(event.button), 0, 0, 0.0, 0.0, 0.0)
+    if isinstance(event, KeyDownEvent):
+        code, flags = _keycode(event.key)
+        return pack(REC_KEYUP if isinstance(event, KeyUpEvent) else REC_KEYDOWN, flags, 0, code, 0, 0.0, 0.0, 0.0)
+    if isinstance(event, MouseScrollEvent):
+        return pack(REC_SCROLL, 0, 0, event.delta, 0, 0.0, 0.0, 0.0)
+    if isinstance(event, TypeEvent):
+        text = event.str.encode("utf-8")
+        padding = -len(text) % RECORD.size
+        return pack(REC_TYPE, 0, 0, len(text), 0, 0.0, 0.0, 0.0) + text + bytes(padding)
+    if isinstance(event, ChordEvent):
+        text = event.spec.encode("utf-8")
+        padding = -len(text) % RECORD.size
+        return pack(REC_CHORD, 0, 0, len(text), 0, *_delays(event.releasedelay, event.hold)) + text + bytes(padding)
+    if isinstance(event, Loop):
+        body = b"".join(encode(child) for child in event.events)
+        return pack(REC_LOOP, 0, 0, event.repeats, 0, 0.0, 0.0, 0.0) + body + pack(REC_ENDLOOP, 0, 0, 0, 0, 0.0, 0.0, 0.0)
+    raise InvalidEventError
+
+
+def decode(buffer : object, offset : int, record : struct.Struct = RECORD) -> tuple:
+    """Decodes the event starting at the given offset.
+
+    Args:
+        buffer (object): Any bytes-like object holding the records.
+        offset (int): Offset of the event's first record.
+        record (struct.Struct, optional): Layout of the records, as returned by checkheader. Defaults to the current version.
+
+    Raises:
+        InvalidFileError: Raised if the records are malformed.
+
+    Returns:
+        tuple: The decoded event and the offset of the record following it.
+    """
+    kind, flags, h, a, b, c, d, e = record.unpack_from(buffer, offset)
+    offset += record.size
+    if kind == REC_PAUSE:
+        return PauseEvent([c, d] if flags & FLAG_RANGE else c), offset
+    if kind == REC_MOVE:
+        return MouseMoveEvent(a, b, relative=bool(flags & FLAG_RELATIVE), motion=bool(flags & FLAG_MOTION)), offset
+    if kind == REC_CLICK:
+        return MouseClickEvent(BUTTONNAMES[h], releasedelay=(c, d), doubleclick=bool(flags & FLAG_DOUBLECLICK), hold=e), offset
+    if kind == REC_KEY:
+        return KeyEvent.fromkey(_key(a, flags), releasedelay=(c, d), hold=e), offset
+    if kind == REC_SCROLL:
+        return MouseScrollEvent(a), offset
+    if kind == REC_MOUSEDOWN:
+        return MouseDownEvent(BUTTONNAMES[h]), offset
+    if kind == REC_MOUSEUP:
+        return MouseUpEvent(BUTTONNAMES[h]), offset
+    if kind == REC_KEYDOWN:
+        return KeyDownEvent.fromkey(_key(a, flags)), offset
+    if kind == REC_KEYUP:
+        return KeyUpEvent.fromkey(_key(a, flags)), offset
+    if kind == REC_TYPE:
+        text = bytes(buffer[offset:offset + a]).decode("utf-8")
+        return TypeEvent(text), offset + a + (-a % record.size)
+    if kind == REC_CHORD:
+        text = bytes(buffer[offset:offset + a]).decode("utf-8")
+        return ChordEvent(text, releasedelay=(c, d), hold=e), offset + a + (-a % record.size)
+    if kind == REC_LOOP:
+        events = []
+        while True:
+            if offset >= len(buffer):
+                raise InvalidFileError("Unterminated loop in timeline file.")
+            if buffer[offset] == REC_ENDLOOP:
+                return Loop(*events, repeats=a), offset + record.size
+            event, offset = decode(buffer, offset, record)
+            events.append(event)
+    raise InvalidFileError(f"Unknown record type {kind} in timeline file.")
+
+
+def iterevents(buffer : object, offset : int = HEADER.size, record : struct.Struct = RECORD):
+    """Lazily decodes every event in a buffer holding a whole timeline file.
+
+    Args:
+        buffer (object): Any bytes-like object, e.g. an mmap of the file.
+        offset (int, optional): Offset of the first record. Defaults to the size of the header.
+        record (struct.Struct, optional): Layout of the records, as returned by checkheader. Defaults to the current version.
+
+    Yields:
+        Event: The decoded events, in order.
+    """
+    end = len(buffer)
+    while offset < end:
+        event, offset = decode(buffer, offset, record)
+        yield event
+
+
+def checkheader(buffer : object) -> struct.Struct:
+    """Validates the header of a timeline file.
+
+    Args:
+        buffer (object): Any bytes-like object holding the file, or at least its header.
+
+    Raises:
+        InvalidFileError: Raised if the header is missing or belongs to an unsupported version.
+
+    Returns:
+        struct.Struct: The record layout of the file's version.
+    """
+    if len(buffer) < HEADER.size:
+        raise InvalidFileError
+    magic, version, size = HEADER.unpack_from(buffer, 0)
+    record = RECORDS.get(version)
+    if magic != MAGIC or record is None or size != record.size:
+        raise InvalidFileError
+    return record
+
+
+class MappedEvents:
+    """Decodes the events of a binary timeline file lazily through a memory map.
+
+    The file is only mapped while an iteration is running and is unmapped and closed as soon
+    as it ends, so nothing is held open between plays and the events can be played any number
+    of times.
+
+    Args:
+        path (str): The file to read.
+
+    Raises:
+        InvalidFileError: Raised if the file is not a valid timeline file.
+    """
+
+
+    def __init__(self, path : str):
+        self.path = path
+        with open(path, "rb") as file:
+            self.record = checkheader(file.read(HEADER.size))
+
+
+    def __iter__(self):
+        with open(self.path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            yield from iterevents(buffer, record=self.record)
+
+
+class EventWriter:
+    """Streams events to a binary timeline file through a buffered writer.
+
+    Args:
+        path (str): The file to write.
+        buffering (int, optional): Size of the write buffer in bytes. Defaults to 65536.
+    """
+
+
+    def __init__(self, path : str, buffering : int = 1 << 16):
+        self.file = open(path, "wb", buffering=buffering)
+        self.file.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+        self.count = 0
+
+
+    def write(self, event : Event):
+        """Appends an event to the file.
+
+        Args:
+            event (Event): The event to write.
+        """
+        self.file.write(encode(event))
+        self.count += 1
+
+
+    def close(self):
+        """Flushes the buffer and closes the file."""
+        self.file.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def dumps(events : object) -> bytes:
+    """Encodes events into the contents of a binary timeline file.
+
+    Args:
+        events (object): Any iterable of events.
+
+    Returns:
+        bytes: The header followed by the records of every event.
+    """
+    return HEADER.pack(MAGIC, VERSION, RECORD.size) + b"".join(encode(event) for event in events)
+
+
+def writeevents(path : str, events : object) -> int:
+    """Writes events to a binary timeline file.
+
+    Args:
+        path (str): The file to write.
+        events (object): Any iterable of events.
+
+    Returns:
+        int: The number of events written.
+    """
+    with EventWriter(path) as writer:
+        for event in events:
+            writer.write(event)
+    return writer.count
@@ -0,0 +1,208 @@
+# MIT License
+
+# Copyright 2022 Svetlana Ankundinov
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from array import array
+from .utils import BUTTONNAMES, InvalidEventError
+from .TimeLine import *
+from .EventFile import REC_PAUSE, REC_CLICK, REC_MOVE, REC_KEY, REC_TYPE, REC_SCROLL, REC_LOOP, REC_ENDLOOP, REC_CHORD, REC_MOUSEDOWN, REC_MOUSEUP, REC_KEYDOWN, REC_KEYUP, FLAG_RANGE, FLAG_DOUBLECLICK, FLAG_RELATIVE
+
+
+class EventTable:
+    """Holds events column by column in typed arrays instead of as separate objects.
+
+    Each event takes one row of a kind, flags, x, y, ref, low, high and hold column, using the
+    same record kinds as a timeline file. Keys, texts, key specs and motions are interned into a
+    shared list of objects and referred to by their index in the ref column; buttons are stored by
+    their index in BUTTONNAMES. Loops take a row before and after their events. A row uses 38
+    bytes, a fraction of what an event object needs.
+
+    A TimeLine plays an EventTable like any other source of events: every row is turned back
+    into an event and compiled just before it runs, so the table saves memory while stored but
+    not the cost of building and compiling each event during playback.
+
+    Args:
+        events (object, optional): Any iterable of events to add. Defaults to ().
+    """
+
+
+    def __init__(self, events : object = ()):
+        self.kind = array("B")
+        self.flags = array("B")
+        self.x = array("i")
+        self.y = array("i")
+        self.ref = array("i")
+        self.low = array("d")
+        self.high = array("d")
+        self.hold = array("d")
+        self.objects = []
+        self.interned = {}
+        self.extend(events)
+
+
+    def __len__(self) -> int:
+        return len(self.kind)
+
+
+    def intern(self, value : object) -> int:
+        """Returns the index of an object in the shared list, adding it on first use.
+
+        Args:
+            value (object): A key, text or motion.
+
+        Returns:
+            int: Its index.
+        """
+        try:
+            key = (type(value), value)
+            index = self.interned.get(key)
+        except TypeError:
+            key, index = None, None
+        if index is None:
+            index = len(self.objects)
+            self.objects.append(value)
+            if key is not None:
+                self.interned[key] = index
+        return index
+
+
+    def row(self, kind : int, flags : int = 0, x : int = 0, y : int = 0, ref : int = -1, low : float = 0.0, high : float = 0.0, hold : float = 0.0):
+        """Appends a single row."""
+        self.kind.append(kind)
+        self.flags.append(flags)
+        self.x.append(x)
+        self.y.append(y)
+        self.ref.append(ref)
+        self.low.append(low)
+        self.high.append(high)
+        self.hold.append(hold)
+
+
+    def append(self, event : Event):
+        """Appends an event, and the events of a Loop.
+
+        Args:
+            event (Event): The event to add.
+
+        Raises:
+            InvalidEventError: Raised if the object is not one of the built in events.
+        """
+        if isinstance(event, PauseEvent):
+            time = event.time
+            if isinstance(time, (list, tuple)):
+                self.row(REC_PAUSE, FLAG_RANGE, low=time[0], high=time[1])
+            else:
+                self.row(REC_PAUSE, low=time, high=time)
+        elif isinstance(event, MouseMoveEvent):
+            self.row(REC_MOVE, FLAG_RELATIVE if event.relative else 0, event.x, event.y, -1 if event.motion is None else self.intern(event.motion))
+        elif isinstance(event, MouseClickEvent):
+            low, high = event.releasedelay if len(event.releasedelay) == 2 else (1.0, 0.0)
+            self.row(REC_CLICK, FLAG_DOUBLECLICK if event.doubleclick else 0, y=BUTTONNAMES.index(event.button), low=low, high=high, hold=event.hold)
+        elif isinstance(event, KeyEvent):
+            low, high = event.releasedelay if len(event.releasedelay) == 2 else (1.0, 0.0)
+            self.row(REC_KEY, ref=self.intern(event.key), low=low, high=high, hold=event.hold)
+        elif isinstance(event, MouseDownEvent):
+            self.row(REC_MOUSEUP if isinstance(event, MouseUpEvent) else REC_MOUSEDOWN, y=BUTTONNAMES.index(event.button))
+        elif isinstance(event, KeyDownEvent):
+            self.row(REC_KEYUP if isinstance(event, KeyUpEvent) else REC_KEYDOWN, ref=self.intern(event.key))
+        elif isinstance(event, ChordEvent):
+            low, high = event.releasedelay if len(event.releasedelay) == 2 else (1.0, 0.0)
+            self.row(REC_CHORD, ref=self.intern(event.spec), low=low, high=high, hold=event.hold)
+        elif isinstance(event, MouseScrollEvent):
+            self.row(REC_SCROLL, x=event.delta)
+        elif isinstance(event, TypeEvent):
+            self.row(REC_TYPE, ref=self.intern(event.str))
+        elif isinstance(event, Loop):
+            self.row(REC_LOOP, x=event.repeats)
+            self.extend(event.events)
+            self.row(REC_ENDLOOP)
+        else:
+            raise InvalidEventError
+
+
+    def extend(self, events : object):
+        """Appends every event of an iterable.
+
+        Args:
+            events (object): Any iterable of events.
+        """
+        for event in events:
+            self.append(event)
+
+
+    def event(self, index : int) -> tuple:
+        """Turns the row at the given index back into an event.
+
+        Args:
+            index (int): Index of the event's first row.
+
+        Returns:
+            tuple: The event and the index of the row following it.
+        """
+        kind = self.kind[index]
+        flags = self.flags[index]
+        if kind == REC_PAUSE:
+            return PauseEvent((self.low[index], self.high[index]) if flags & FLAG_RANGE else self.low[index]), index + 1
+        if kind == REC_MOVE:
+            ref = self.ref[index]
+            return MouseMoveEvent(self.x[index], self.y[index], relative=bool(flags & FLAG_RELATIVE), motion=None if ref < 0 else self.objects[ref]), index + 1
+        if kind == REC_CLICK:
+            return MouseClickEvent(BUTTONNAMES[self.y[index]], releasedelay=(self.low[index], self.high[index]), doubleclick=bool(flags & FLAG_DOUBLECLICK), hold=self.hold[index]), index + 1
+        if kind == REC_KEY:
+            return KeyEvent.fromkey(self.objects[self.ref[index]], releasedelay=(self.low[index], self.high[index]), hold=self.hold[index]), index + 1
+        if kind == REC_MOUSEDOWN:
+            return MouseDownEvent(BUTTONNAMES[self.y[index]]), index + 1
+        if kind == REC_MOUSEUP:
+            return MouseUpEvent(BUTTONNAMES[self.y[index]]), index + 1
+        if kind == REC_KEYDOWN:
+            return KeyDownEvent.fromkey(self.objects[self.ref[index]]), index + 1
+        if kind == REC_KEYUP:
+            return KeyUpEvent.fromkey(self.objects[self.ref[index]]), index + 1
+        if kind == REC_CHORD:
+            return ChordEvent(self.objects[self.ref[index]], releasedelay=(self.low[index], self.high[index]), hold=self.hold[index]), index + 1
+        if kind == REC_SCROLL:
+            return MouseScrollEvent(self.x[index]), index + 1
+        if kind == REC_TYPE:
+            return TypeEvent(self.objects[self.ref[index]]), index + 1
+        repeats = self.x[index]
+        events = []
+        index += 1
+        while self.kind[index] != REC_ENDLOOP:
+            event, index = self.event(index)
+            events.append(event)
+        return Loop(*events, repeats=repeats), index + 1
+
+
+    def __iter__(self):
+        index = 0
+        end = len(self.kind)
+        while index < end:
+            event, index = self.event(index)
+            yield event
+
+
+    def nbytes(self) -> int:
+        """Returns the memory used by the columns, excluding the interned objects.
+
+        Returns:
+            int: Size in bytes.
+        """
+        return sum(column.itemsize * len(column) for column in (self.kind, self.flags, self.x, self.y, self.ref, self.low, self.high, self.hold))
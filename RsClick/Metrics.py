@@ -0,0 +1,281 @@
+# MIT License
+
+# Copyright 2022 Svetlana Ankundinov
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import bisect
+import threading
+import time
+from .Backend import Backend
+
+
+# Upper bounds in seconds of the histogram buckets, followed by an implicit +Inf bucket.
+BUCKETS = (
+    .00001, .000025, .00005, .0001, .00025, .0005, .001, .0025, .005, .01,
+    .025, .05, .1, .25, .5, 1.0, 2.5, 5.0, 10.0,
+)
+
+# Name, help text and label of every metric.
+METRICS = {
+    "dispatch" : ("Time from the start of an event until it first waits or the next event starts.", "event"),
+    "lateness" : ("How late an event or wait fired relative to its deadline.", "event"),
+    "backend" : ("Time spent in a single backend call, by the event type making it.", "event"),
+    "trigger" : ("Time from a hotkey or button trigger until its TimeLine sent its first input.", "trigger"),
+}
+
+
+class Histogram:
+    """Counts observations in fixed buckets.
+
+    Args:
+        buckets (tuple, optional): Sorted upper bounds of the buckets. Defaults to BUCKETS.
+    """
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+
+    def __init__(self, buckets : tuple = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+
+    def observe(self, value : float):
+        """Adds an observation.
+
+        Args:
+            value (float): The observed value.
+        """
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+    def cumulative(self) -> list:
+        """Returns the number of observations at or below each bound, ending with the total.
+
+        Returns:
+            list: One count per bucket.
+        """
+        total = 0
+        counts = []
+        for count in self.counts:
+            total += count
+            counts.append(total)
+        return counts
+
+
+    def quantile(self, q : float) -> float:
+        """Estimates a quantile as the upper bound of the bucket it falls in.
+
+        Args:
+            q (float): The quantile, between 0 and 1.
+
+        Returns:
+            float: The estimate, or infinity if it lies beyond the last bound.
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        for bound, total in zip(self.buckets + (float("inf"),), self.cumulative()):
+            if total >= rank:
+                return bound
+        return float("inf")
+
+
+class Metrics:
+    """Histograms of dispatch latency, lateness and backend call time per event type.
+
+    Attach it to a TimeLine with the metrics argument. Observations only take a bucket lookup
+    and an increment, so metrics can stay enabled in production. Subclasses may override
+    observe() and error() to forward the data elsewhere as well.
+
+    Args:
+        buckets (tuple, optional): Sorted upper bounds of the buckets in seconds. Defaults to BUCKETS.
+        prefix (str, optional): Prefix of the exported metric names. Defaults to "rsclick".
+    """
+
+
+    def __init__(self, buckets : tuple = BUCKETS, prefix : str = "rsclick"):
+        self.buckets = tuple(buckets)
+        self.prefix = prefix
+        self.histograms = {name : {} for name in METRICS}
+        self.errors = {}
+        self.lock = threading.Lock()
+
+
+    def observe(self, metric : str, label : str, value : float):
+        """Records an observation.
+
+        Args:
+            metric (str): "dispatch", "lateness", "backend" or "trigger".
+            label (str): The event type, or the name of the trigger.
+            value (float): The value in seconds.
+        """
+        with self.lock:
+            histograms = self.histograms[metric]
+            histogram = histograms.get(label)
+            if histogram is None:
+                histogram = histograms[label] = Histogram(self.buckets)
+            histogram.observe(value)
+
+
+    def error(self, error : Exception):
+        """Counts an error raised while running a TimeLine.
+
+        Args:
+            error (Exception): The error.
+        """
+        with self.lock:
+            name = type(error).__name__
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+
+    def clear(self):
+        """Discards every observation."""
+        with self.lock:
+            self.histograms = {name : {} for name in METRICS}
+            self.errors = {}
+
+
+    def snapshot(self) -> dict:
+        """Returns every histogram as plain data.
+
+        Returns:
+            dict: Maps each metric and event type to the bucket bounds, cumulative counts, sum and count, plus an "errors" entry mapping exception names to counts.
+        """
+        with self.lock:
+            data = {
+                metric : {
+                    label : {
+                        "buckets" : list(self.buckets) + ["+Inf"],
+                        "counts" : histogram.cumulative(),
+                        "sum" : histogram.sum,
+                        "count" : histogram.count,
+                    }
+                    for label, histogram in histograms.items()
+                }
+                for metric, histograms in self.histograms.items()
+            }
+            data["errors"] = dict(self.errors)
+        return data
+
+
+    def json(self) -> str:
+        """Exports the metrics as JSON.
+
+        Returns:
+            str: The snapshot() encoded as JSON.
+        """
+        import json
+        return json.dumps(self.snapshot())
+
+
+    def prometheus(self) -> str:
+        """Exports the metrics in the Prometheus text exposition format.
+
+        Returns:
+            str: One histogram family per metric, and a counter of errors.
+        """
+        data = self.snapshot()
+        lines = []
+        for metric, (description, label) in METRICS.items():
+            name = f"{self.prefix}_{metric}_seconds"
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} histogram")
+            for value, histogram in sorted(data[metric].items()):
+                for bound, count in zip(histogram["buckets"], histogram["counts"]):
+                    le = bound if isinstance(bound, str) else repr(float(bound))
+                    lines.append(f'{name}_bucket{{{label}="{value}",le="{le}"}} {count}')
+                lines.append(f'{name}_sum{{{label}="{value}"}} {histogram["sum"]!r}')
+                lines.append(f'{name}_count{{{label}="{value}"}} {histogram["count"]}')
+        name = f"{self.prefix}_errors_total"
+        lines.append(f"# HELP {name} Errors raised while running a TimeLine.")
+        lines.append(f"# TYPE {name} counter")
+        for error, count in sorted(data["errors"].items()):
+            lines.append(f'{name}{{type="{error}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+class TimedBackend(Backend):
+    """Backend which records the time every call to another backend takes in a Metrics,
+    under the event type the scheduler is currently dispatching.
+
+    Args:
+        backend (Backend): Backend the calls are passed on to.
+        metrics (Metrics): Metrics to record into.
+        scheduler (DeadlineScheduler): Scheduler of the TimeLine, which knows the current event type.
+    """
+
+
+    def __init__(self, backend : Backend, metrics : Metrics, scheduler : object):
+        self.backend = backend
+        self.metrics = metrics
+        self.scheduler = scheduler
+
+
+    def timed(self, method : object, *args) -> object:
+        """Calls a backend method and records how long it took."""
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self.metrics.observe("backend", self.scheduler.label or "TimeLine", time.perf_counter() - start)
+
+
+    def position(self) -> tuple:
+        return self.timed(self.backend.position)
+
+
+    def moveto(self, x : int, y : int):
+        self.timed(self.backend.moveto, x, y)
+
+
+    def moveby(self, dx : int, dy : int):
+        self.timed(self.backend.moveby, dx, dy)
+
+
+    def press(self, button : object):
+        self.timed(self.backend.press, button)
+
+
+    def release(self, button : object):
+        self.timed(self.backend.release, button)
+
+
+    def click(self, button : object, count : int = 1):
+        self.timed(self.backend.click, button, count)
+
+
+    def scroll(self, dx : int, dy : int):
+        self.timed(self.backend.scroll, dx, dy)
+
+
+    def keydown(self, key : object):
+        self.timed(self.backend.keydown, key)
+
+
+    def keyup(self, key : object):
+        self.timed(self.backend.keyup, key)
+
+
+    def type(self, text : str):
+        self.timed(self.backend.type, text)
@@ -0,0 +1,173 @@
+# MIT License
+
+# Copyright 2022 Svetlana Ankundinov
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import math
+import threading
+from .utils import LazyModule
+
+
+np = LazyModule("numpy")
+
+
+class HumanMotion:
+    """Moves the mouse along a generated curve instead of teleporting it.
+
+    Paths are cubic Bézier curves between the start and the target whose control points are
+    pushed off the straight line at random, traversed with ease-in-out timing and a little
+    jitter which fades out towards both ends. All points of a path are computed in one batch
+    with numpy and sampled at the given device rate. Generated paths are cached per
+    displacement vector and reused, evicting the least recently used ones once the cache is full.
+
+    Args:
+        rate (float, optional): Points per second, i.e. the polling rate of the simulated device. Defaults to 125.0.
+        speed (float, optional): Average speed in pixels per second on long moves. Defaults to 1500.0.
+        mintime (float, optional): Minimum duration of a move in seconds. Defaults to 0.08.
+        curvature (float, optional): How far the control points may leave the straight line, as a fraction of the distance. Defaults to 0.2.
+        jitter (float, optional): Standard deviation of the jitter in pixels. Defaults to 0.6.
+        variants (int, optional): Number of different paths cached per displacement, picked from at random. Defaults to 3.
+        cachesize (int, optional): Maximum number of cached paths. Defaults to 256.
+        seed (int, optional): Seed for the random generator. Defaults to None.
+    """
+
+
+    def __init__(self, rate : float = 125.0, speed : float = 1500.0, mintime : float = 0.08, curvature : float = 0.2, jitter : float = 0.6, variants : int = 3, cachesize : int = 256, seed : int = None):
+        from collections import OrderedDict
+        self.rate = rate
+        self.speed = speed
+        self.mintime = mintime
+        self.curvature = curvature
+        self.jitter = jitter
+        self.variants = variants
+        self.cachesize = cachesize
+        self.seed = seed
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._rng = None
+
+
+    @property
+    def rng(self) -> object:
+        if self._rng is None:
+            self._rng = np.random.default_rng(self.seed)
+        return self._rng
+
+
+    def count(self, dx : int, dy : int) -> int:
+        """Returns the number of points of a path for a displacement, including the start.
+
+        Args:
+            dx (int): Horizontal displacement in pixels.
+            dy (int): Vertical displacement in pixels.
+
+        Returns:
+            int: The number of points.
+        """
+        duration = max(self.mintime, math.hypot(dx, dy) / self.speed)
+        return max(2, int(round(duration * self.rate)) + 1)
+
+
+    def duration(self, dx : int, dy : int) -> float:
+        """Returns how long moving along a path for a displacement takes.
+
+        Args:
+            dx (int): Horizontal displacement in pixels.
+            dy (int): Vertical displacement in pixels.
+
+        Returns:
+            float: The duration in seconds.
+        """
+        return (self.count(dx, dy) - 1) / self.rate
+
+
+    def generate(self, dx : int, dy : int) -> list:
+        """Generates a new path for a displacement, bypassing the cache.
+
+        Args:
+            dx (int): Horizontal displacement in pixels.
+            dy (int): Vertical displacement in pixels.
+
+        Returns:
+            list: (x, y) offsets from the starting point, ending exactly at (dx, dy).
+        """
+        distance = math.hypot(dx, dy)
+        count = self.count(dx, dy)
+        # The generator is shared by every thread playing this motion and is not thread-safe.
+        with self.lock:
+            bends = self.rng.normal(0.0, self.curvature * distance, 2)
+            noise = self.rng.normal(0.0, self.jitter, (count, 2)) if self.jitter else None
+        t = np.linspace(0.0, 1.0, count)
+        t = t * t * (3.0 - 2.0 * t)
+        end = np.array([dx, dy], dtype=np.float64)
+        normal = np.array([-dy, dx], dtype=np.float64) / distance if distance else np.zeros(2)
+        c1 = end / 3.0 + normal * bends[0]
+        c2 = end * 2.0 / 3.0 + normal * bends[1]
+        u = 1.0 - t
+        points = (3.0 * u * u * t)[:, None] * c1 + (3.0 * u * t * t)[:, None] * c2 + (t * t * t)[:, None] * end
+        if noise is not None:
+            points += noise * np.sin(np.pi * t)[:, None]
+        points = np.rint(points).astype(np.int64)
+        points[0] = 0
+        points[-1] = end
+        return points.tolist()
+
+
+    def path(self, dx : int, dy : int) -> list:
+        """Returns a path for a displacement, from the cache where possible.
+
+        Args:
+            dx (int): Horizontal displacement in pixels.
+            dy (int): Vertical displacement in pixels.
+
+        Returns:
+            list: (x, y) offsets from the starting point, ending exactly at (dx, dy).
+        """
+        with self.lock:
+            key = (dx, dy, int(self.rng.integers(self.variants)) if self.variants > 1 else 0)
+            points = self.cache.get(key)
+            if points is not None:
+                self.cache.move_to_end(key)
+                self.hits += 1
+                return points
+            self.misses += 1
+        points = self.generate(dx, dy)
+        with self.lock:
+            self.cache[key] = points
+            while len(self.cache) > self.cachesize:
+                self.cache.popitem(last=False)
+        return points
+
+
+DEFAULT_MOTION = None
+
+
+def defaultmotion() -> HumanMotion:
+    """Returns the HumanMotion shared by every MouseMoveEvent created with motion=True.
+
+    Returns:
+        HumanMotion: The shared motion.
+    """
+    global DEFAULT_MOTION
+    if DEFAULT_MOTION is None:
+        DEFAULT_MOTION = HumanMotion()
+    return DEFAULT_MOTION
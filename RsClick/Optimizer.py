@@ -0,0 +1,288 @@
+# MIT License
+
+# Copyright 2022 Svetlana Ankundinov
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from .utils import LazyModule
+from .TimeLine import *
+
+
+np = LazyModule("numpy")
+
+
+def rdp(points : object, tolerance : float) -> object:
+    """Ramer-Douglas-Peucker simplification of a polyline.
+
+    Args:
+        points (numpy.ndarray): An (n, 2) array of coordinates.
+        tolerance (float): Maximum distance in pixels a dropped point may lie from the simplified path.
+
+    Returns:
+        numpy.ndarray: A boolean mask of the points to keep. The first and last points are always kept.
+    """
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        a = points[start]
+        d = points[end] - a
+        inner = points[start + 1:end] - a
+        norm = np.hypot(d[0], d[1])
+        if norm == 0:
+            distances = np.hypot(inner[:, 0], inner[:, 1])
+        else:
+            distances = np.abs(d[0] * inner[:, 1] - d[1] * inner[:, 0]) / norm
+        worst = int(np.argmax(distances))
+        if distances[worst] > tolerance:
+            split = start + 1 + worst
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return keep
+
+
+def _simplifyrun(moves : list, times : list, tolerance : float):
+    if len(moves) < 3:
+        keep = [True] * len(moves)
+    else:
+        points = np.array([(move.x, move.y) for move in moves], dtype=np.float64)
+        keep = rdp(points, tolerance).tolist()
+    previous = times[0]
+    for move, time, kept in zip(moves, times, keep):
+        if kept:
+            if time > previous:
+                yield PauseEvent(time - previous)
+            yield move
+            previous = time
+
+
+def _simplify(events : object, tolerance : float, counts : list):
+    moves = []
+    times = []
+    trailing = []
+    elapsed = 0.0
+    for event in events:
+        counts[0] += 1
+        if isinstance(event, MouseMoveEvent) and not event.relative and event.motion is None:
+            moves.append(event)
+            times.append(elapsed + sum(pause.time for pause in trailing))
+            elapsed = times[-1]
+            trailing = []
+            continue
+        if moves and isinstance(event, PauseEvent) and not isinstance(event.time, (list, tuple)):
+            trailing.append(event)
+            continue
+        if moves:
+            yield from _simplifyrun(moves, times, tolerance)
+            moves, times, elapsed = [], [], 0.0
+        yield from trailing
+        trailing = []
+        if isinstance(event, Loop):
+            inner = [0]
+            event = Loop(*_simplify(event.events, tolerance, inner), repeats=event.repeats)
+            counts[0] += inner[0]
+        yield event
+    if moves:
+        yield from _simplifyrun(moves, times, tolerance)
+    yield from trailing
+
+
+def _count(events : object) -> int:
+    return sum(1 + (_count(event.events) if isinstance(event, Loop) else 0) for event in events)
+
+
+def simplifypaths(events : object, tolerance : float = 1.0) -> tuple:
+    """Drops mouse movements which lie on near-straight segments of a recorded path.
+
+    Every run of absolute MouseMoveEvents, together with the constant PauseEvents between them,
+    is simplified with the Ramer-Douglas-Peucker algorithm. The pauses of dropped points are
+    folded into the pause before the next kept point, so every kept move happens at the same
+    time as before.
+
+    Args:
+        events (object): Any iterable of events, e.g. TimeLine.events.
+        tolerance (float, optional): Maximum distance in pixels between a dropped point and the simplified path. Defaults to 1.0.
+
+    Returns:
+        tuple: The simplified list of events and the compression ratio achieved, i.e. the number of events before divided by the number after.
+    """
+    counts = [0]
+    simplified = list(_simplify(events, tolerance, counts))
+    return simplified, counts[0] / max(_count(simplified), 1)
+
+
+def simplifyfile(source : str, destination : str, tolerance : float = 1.0) -> float:
+    """Simplifies the mouse paths of a binary timeline file, streaming it into a new file.
+
+    Args:
+        source (str): The file to read, e.g. one made by a Recorder.
+        destination (str): The file to write.
+        tolerance (float, optional): Maximum distance in pixels between a dropped point and the simplified path. Defaults to 1.0.
+
+    Returns:
+        float: The compression ratio achieved.
+    """
+    from .EventFile import MappedEvents, EventWriter
+    events = MappedEvents(source)
+    counts = [0]
+    written = 0
+    with EventWriter(destination) as writer:
+        for event in _simplify(events, tolerance, counts):
+            writer.write(event)
+            written += _count((event,))
+    return counts[0] / max(written, 1)
+
+
+def _mergepauses(first : object, second : object) -> object:
+    firstrange = isinstance(first, (list, tuple))
+    secondrange = isinstance(second, (list, tuple))
+    if firstrange and secondrange:
+        return None
+    if firstrange:
+        return [first[0] + second, first[1] + second]
+    if secondrange:
+        return [second[0] + first, second[1] + first]
+    return first + second
+
+
+def _typeable(event : Event) -> bool:
+    return isinstance(event, TypeEvent) or (isinstance(event, KeyEvent) and event.hold == 0.0 and isinstance(event.key, str) and len(event.key) == 1)
+
+
+def _text(event : Event) -> str:
+    return event.str if isinstance(event, TypeEvent) else event.key
+
+
+class Peephole:
+    """Merges and removes redundant events in a tree of events.
+
+    Args:
+        typechains (bool, optional): Merge chains of single character KeyEvents and TypeEvents into one TypeEvent. The keys are then typed without their release delays, which changes the timing. Defaults to False.
+    """
+
+
+    def __init__(self, typechains : bool = False):
+        self.typechains = typechains
+        self.stats = {"pauses merged" : 0, "moves merged" : 0, "keys merged" : 0, "loops unwrapped" : 0, "events removed" : 0}
+
+
+    def run(self, events : object) -> list:
+        """Optimizes a sequence of events.
+
+        Args:
+            events (object): Any iterable of events.
+
+        Returns:
+            list: The optimized events.
+        """
+        out = []
+        for event in events:
+            self.push(out, event)
+        return out
+
+
+    def push(self, out : list, event : Event):
+        """Appends an event to an optimized list, merging it with the last event where possible.
+
+        Args:
+            out (list): The optimized events so far.
+            event (Event): The event to append.
+        """
+        last = out[-1] if out else None
+        if isinstance(event, PauseEvent):
+            time = event.time
+            if time == 0 or (isinstance(time, (list, tuple)) and tuple(time) == (0, 0)):
+                self.stats["events removed"] += 1
+                return
+            if isinstance(last, PauseEvent):
+                merged = _mergepauses(last.time, event.time)
+                if merged is not None:
+                    out[-1] = PauseEvent(merged)
+                    self.stats["pauses merged"] += 1
+                    return
+        elif isinstance(event, MouseMoveEvent) and event.relative and event.motion is None:
+            if isinstance(last, MouseMoveEvent) and last.relative and last.motion is None:
+                out[-1] = MouseMoveEvent(last.x + event.x, last.y + event.y, relative=True)
+                self.stats["moves merged"] += 1
+                return
+        elif isinstance(event, Loop):
+            body = self.run(event.events)
+            if event.repeats <= 0 or not body:
+                self.stats["events removed"] += 1
+                return
+            if event.repeats == 1:
+                self.stats["loops unwrapped"] += 1
+                for child in body:
+                    self.push(out, child)
+                return
+            event = Loop(*body, repeats=event.repeats)
+        elif self.typechains and _typeable(event) and last is not None and _typeable(last):
+            out[-1] = TypeEvent(_text(last) + _text(event))
+            self.stats["keys merged"] += 1
+            return
+        out.append(event)
+
+
+def optimize(timeline : TimeLine, verbose : bool = False, typechains : bool = False) -> TimeLine:
+    """Returns a copy of a TimeLine with redundant events merged or removed.
+
+    Consecutive constant pauses are summed (a constant pause next to a range shifts the range),
+    zero length pauses are dropped, back-to-back relative movements are combined, and Loops
+    which run once are replaced by their events while Loops which never run are removed. The
+    resulting input sequence and its timing are the same. With typechains, chains of single
+    character key presses also become one TypeEvent, which drops their release delays. A non-zero defaultEventPause is written out as explicit pauses first, so merging
+    events does not change the timing.
+
+    Args:
+        timeline (TimeLine): The TimeLine to optimize. It is left unchanged.
+        verbose (bool, optional): Print the number of events before and after. Defaults to False.
+        typechains (bool, optional): Merge chains of single character KeyEvents into TypeEvents, typing them without their release delays. Defaults to False.
+
+    Returns:
+        TimeLine: The optimized TimeLine.
+    """
+    events = timeline.events
+    pause = timeline.defaulteventpause.getTime()
+    if pause != 0:
+        events = [item for event in events for item in (event, PauseEvent(pause))]
+    peephole = Peephole(typechains=typechains)
+    scheduler = timeline.scheduler
+    optimized = TimeLine(
+        *peephole.run(events),
+        startpause=timeline.startpause,
+        verbose=timeline.verbose,
+        repeat=timeline.repeat,
+        spinthreshold=scheduler.spinthreshold,
+        maxlateness=scheduler.maxlateness,
+        backend=timeline.backend,
+        seed=timeline.random.seed,
+        distribution=timeline.random.distribution,
+        prefetch=timeline.prefetch,
+        metrics=timeline.metrics,
+        trace=timeline.trace,
+        printloops=timeline.printloops
+    )
+    if verbose:
+        details = ", ".join(f"{name}: {count}" for name, count in peephole.stats.items())
+        print(f"Optimized TimeLine from {_count(timeline.events)} to {_count(optimized.events)} events ({details})")
+    return optimized
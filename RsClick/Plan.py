@@ -0,0 +1,443 @@
+# MIT License
+
+# Copyright 2022 Svetlana Ankundinov
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from .utils import rfloatrange, InvalidIntervalError, LazyModule
+
+
+log = LazyModule("logging")
+
+
+OP_MARK = 0
+OP_PAUSE = 1
+OP_PRESS = 2
+OP_RELEASE = 3
+OP_CLICK = 4
+OP_MOVE = 5
+OP_MOVEBY = 6
+OP_KEYDOWN = 7
+OP_KEYUP = 8
+OP_TYPE = 9
+OP_SCROLL = 10
+OP_LOOP = 11
+OP_ENDLOOP = 12
+OP_LOG = 13
+OP_CALL = 14
+OP_PATH = 15
+OP_DRAW = 16
+OP_PRINT = 17
+OP_STREAM = 18
+OP_CHORDDOWN = 19
+OP_CHORDUP = 20
+OP_TEXT = 21
+
+
+# Keyword arguments accepted by the execute() method of each custom event type.
+_EXECUTEARGS = {}
+
+
+def callevent(event : object, verbose : bool, scheduler : object, backend : object):
+    """Calls execute() on a custom event, passing only the keyword arguments it accepts.
+    Events written for the older execute(self, verbose=False) signature keep working.
+
+    Args:
+        event (Event): The custom event.
+        verbose (bool): Print out event occurances.
+        scheduler (DeadlineScheduler): Scheduler pauses are timed against.
+        backend (Backend): Backend the input is sent through.
+    """
+    method = type(event).execute
+    names = _EXECUTEARGS.get(method)
+    if names is None:
+        import inspect
+        try:
+            parameters = inspect.signature(method).parameters.values()
+        except (TypeError, ValueError):
+            parameters = ()
+        accepted = {parameter.name for parameter in parameters}
+        if any(parameter.kind == parameter.VAR_KEYWORD for parameter in parameters):
+            accepted = None
+        names = tuple(name for name in ("verbose", "scheduler", "backend") if accepted is None or name in accepted)
+        _EXECUTEARGS[method] = names
+    arguments = {"verbose": verbose, "scheduler": scheduler, "backend": backend}
+    return event.execute(**{name: arguments[name] for name in names})
+
+
+def releaseheld(backend : object, held : tuple):
+    """Releases every button and key left held down, e.g. by a MouseDownEvent or KeyDownEvent.
+
+    Args:
+        backend (Backend): Backend the releases are sent through.
+        held (tuple): The (buttons, keys) sets of held inputs. They are emptied.
+    """
+    buttons, keys = held
+    for button in buttons:
+        backend.release(button)
+    for key in keys:
+        backend.keyup(key)
+    buttons.clear()
+    keys.clear()
+
+
+class Plan:
+    """A flat list of validated instructions compiled from a tree of events.
+
+    Every instruction is an (opcode, a, b) tuple holding already resolved button and key
+    names. Nested Loops are flattened into OP_LOOP/OP_ENDLOOP jumps, so running a plan
+    never recurses. Only Loops over a lazy source of events are kept as a single OP_STREAM
+    instruction, whose events are compiled one at a time as they run.
+
+    Args:
+        verbose (bool, optional): Compile log instructions describing event occurances. Defaults to False.
+        random (RandomSource, optional): Source randomized pauses draw from. If unset they use utils.rfloatrange. Defaults to None.
+        printloops (bool, optional): Print the number of every loop iteration as it starts. Defaults to True.
+    """
+
+
+    def __init__(self, verbose : bool = False, random : object = None, printloops : bool = True):
+        self.code = []
+        self.loops = 0
+        self.verbose = verbose
+        self.random = random
+        self.printloops = printloops
+
+
+    def __len__(self) -> int:
+        return len(self.code)
+
+
+    def clear(self):
+        """Removes every instruction so the plan can be reused."""
+        self.code.clear()
+        self.loops = 0
+
+
+    def emit(self, op : int, a : object = None, b : object = None):
+        """Appends a single instruction.
+
+        Args:
+            op (int): The opcode.
+            a (object, optional): First operand. Defaults to None.
+            b (object, optional): Second operand. Defaults to None.
+        """
+        self.code.append((op, a, b))
+
+
+    def mark(self, label : str):
+        """Marks the dispatch of an event so its lateness is recorded under the given label.
+
+        Args:
+            label (str): Usually the name of the event type.
+        """
+        self.code.append((OP_MARK, label, None))
+
+
+    def log(self, message : str):
+        """Appends a log instruction, only if the plan is compiled verbose.
+
+        Args:
+            message (str): The message to log.
+        """
+        if self.verbose:
+            self.code.append((OP_LOG, message, None))
+
+
+    def pause(self, time : object):
+        """Appends a pause.
+
+        Args:
+            time (object): float or a list of floats of length 2 representing a randomization range.
+
+        Raises:
+            InvalidIntervalError: Raised if the randomization range is invalid.
+        """
+        if isinstance(time, (list, tuple)):
+            if len(time) != 2 or time[0] > time[1]:
+                raise InvalidIntervalError
+            if self.random is not None and time[0] != time[1]:
+                self.code.append((OP_DRAW, self.random.stream(time[0], time[1]), None))
+            else:
+                self.code.append((OP_PAUSE, time[0], time[1]))
+        else:
+            self.code.append((OP_PAUSE, time, time))
+
+
+    def beginloop(self, repeats : int) -> int:
+        """Opens a loop. Must be closed with endloop().
+
+        Args:
+            repeats (int): How many times the loop body runs.
+
+        Returns:
+            int: Index of the opening instruction, to be passed to endloop().
+        """
+        self.code.append((OP_LOOP, self.loops, repeats))
+        self.loops += 1
+        return len(self.code) - 1
+
+
+    def endloop(self, begin : int):
+        """Closes the loop opened at the given index.
+
+        Args:
+            begin (int): Index returned by beginloop().
+        """
+        self.code.append((OP_ENDLOOP, self.code[begin][1], begin))
+
+
+    def resolved(self):
+        """Walks the plan the way run() would, without sending any input, yielding its
+        instructions with every randomized delay drawn and every loop unrolled.
+
+        Yields:
+            tuple: The next instruction.
+        """
+        code = self.code
+        end = len(code)
+        counters = [0] * self.loops
+        pc = 0
+        while pc < end:
+            instruction = code[pc]
+            op, a, b = instruction
+            pc += 1
+            if op == OP_DRAW:
+                delay = a.next()
+                yield (OP_PAUSE, delay, delay)
+            elif op == OP_PAUSE and a != b:
+                delay = rfloatrange(a, b)
+                yield (OP_PAUSE, delay, delay)
+            elif op == OP_LOOP:
+                counters[a] = 0
+                if self.printloops:
+                    yield (OP_PRINT, "Loop 0", None)
+            elif op == OP_ENDLOOP:
+                counters[a] += 1
+                if counters[a] < code[b][2]:
+                    if self.printloops:
+                        yield (OP_PRINT, f"Loop {counters[a]}", None)
+                    pc = b + 1
+            elif op == OP_STREAM:
+                sub = Plan(verbose=a.verbose, random=b, printloops=self.printloops)
+                for repeat in range(a.repeats):
+                    if self.printloops:
+                        yield (OP_PRINT, f"Loop {repeat}", None)
+                    for event in a.events:
+                        sub.clear()
+                        a.compileevent(sub, event)
+                        yield from sub.resolved()
+            else:
+                yield instruction
+
+
+    def resolve(self, chunksize : int = 4096):
+        """Resolves the plan with resolved() and yields it as a sequence of straight-line plans.
+        Running the chunks one after another sends the same input as running the plan. Chunks are
+        only cut while no button or key is held down.
+
+        Args:
+            chunksize (int, optional): Number of instructions after which a new chunk is started. Defaults to 4096.
+
+        Yields:
+            Plan: The next chunk.
+        """
+        held = set()
+        chunk = []
+        for instruction in self.resolved():
+            op, a, b = instruction
+            if op == OP_PRESS or op == OP_KEYDOWN:
+                held.add((op, a))
+            elif op == OP_RELEASE:
+                held.discard((OP_PRESS, a))
+            elif op == OP_KEYUP:
+                held.discard((OP_KEYDOWN, a))
+            elif op == OP_CHORDDOWN:
+                held.update((OP_KEYDOWN, key) for key in a)
+            elif op == OP_CHORDUP:
+                held.difference_update((OP_KEYDOWN, key) for key in a)
+            chunk.append(instruction)
+            if len(chunk) >= chunksize and not held:
+                plan = Plan(verbose=self.verbose, printloops=self.printloops)
+                plan.code = chunk
+                yield plan
+                chunk = []
+        if chunk:
+            plan = Plan(verbose=self.verbose, printloops=self.printloops)
+            plan.code = chunk
+            yield plan
+
+
+    def steps(self, backend : object, scheduler : object, held : tuple = None):
+        """Executes the plan, yielding every wait to the caller instead of sleeping.
+
+        Pauses are yielded as (seconds, label) tuples which the caller must wait out, e.g. with
+        scheduler.sleep(). Custom events compiled to OP_CALL are yielded as (None, (event, verbose))
+        for the caller to execute. Buttons and keys still held down when the generator finishes
+        or is closed early, e.g. because a run was cancelled, are released.
+
+        If the scheduler has a Tracer attached, every instruction is recorded in it, and log
+        messages are written to the trace instead of being logged on the spot.
+
+        Args:
+            backend (Backend): Backend every input is sent through.
+            scheduler (DeadlineScheduler): Scheduler lateness is recorded with.
+            held (tuple, optional): The (buttons, keys) sets of an enclosing plan, which then releases them instead. Defaults to None.
+
+        Yields:
+            tuple: The next wait, or custom event to execute.
+        """
+        code = self.code
+        end = len(code)
+        counters = [0] * self.loops
+        owner = held is None
+        buttons, keys = (set(), set()) if owner else held
+        trace = scheduler.tracer
+        printloops = self.printloops
+        pc = 0
+        try:
+            while pc < end:
+                op, a, b = code[pc]
+                pc += 1
+                if trace is not None:
+                    trace.instruction(op, a)
+                if op == OP_MARK:
+                    scheduler.begin(a)
+                elif op == OP_DRAW:
+                    yield a.next(), "PauseEvent"
+                elif op == OP_PAUSE:
+                    yield (a if a == b else rfloatrange(a, b)), "PauseEvent"
+                elif op == OP_PRESS:
+                    backend.press(a)
+                    buttons.add(a)
+                    scheduler.anchor()
+                elif op == OP_RELEASE:
+                    backend.release(a)
+                    buttons.discard(a)
+                elif op == OP_KEYDOWN:
+                    backend.keydown(a)
+                    keys.add(a)
+                    scheduler.anchor()
+                elif op == OP_KEYUP:
+                    backend.keyup(a)
+                    keys.discard(a)
+                elif op == OP_CHORDDOWN:
+                    for key in a:
+                        backend.keydown(key)
+                        keys.add(key)
+                    scheduler.anchor()
+                elif op == OP_CHORDUP:
+                    for key in a:
+                        backend.keyup(key)
+                        keys.discard(key)
+                elif op == OP_MOVE:
+                    backend.moveto(a, b)
+                elif op == OP_MOVEBY:
+                    backend.moveby(a, b)
+                elif op == OP_PATH:
+                    x, y = backend.position()
+                    if a[2]:
+                        dx, dy = a[0], a[1]
+                    else:
+                        dx, dy = a[0] - x, a[1] - y
+                    interval = 1.0 / b.rate
+                    for px, py in b.path(dx, dy)[1:]:
+                        yield interval, "MouseMoveEvent.path"
+                        backend.moveto(x + px, y + py)
+                elif op == OP_CLICK:
+                    backend.click(a, b)
+                elif op == OP_TYPE:
+                    backend.type(a)
+                elif op == OP_SCROLL:
+                    backend.scroll(0, a)
+                elif op == OP_LOOP:
+                    counters[a] = 0
+                    if printloops:
+                        print("Loop 0")
+                elif op == OP_ENDLOOP:
+                    counters[a] += 1
+                    if counters[a] < code[b][2]:
+                        if printloops:
+                            print(f"Loop {counters[a]}")
+                        pc = b + 1
+                elif op == OP_LOG:
+                    if trace is None:
+                        log.info(a)
+                elif op == OP_CALL:
+                    yield None, (a, b)
+                elif op == OP_PRINT:
+                    print(a)
+                elif op == OP_TEXT:
+                    yield from a.play(backend)
+                elif op == OP_STREAM:
+                    sub = Plan(verbose=a.verbose, random=b, printloops=printloops)
+                    for repeat in range(a.repeats):
+                        if printloops:
+                            print(f"Loop {repeat}")
+                        for event in a.events:
+                            sub.clear()
+                            a.compileevent(sub, event)
+                            yield from sub.steps(backend, scheduler, (buttons, keys))
+        finally:
+            if owner:
+                releaseheld(backend, (buttons, keys))
+
+
+    def run(self, backend : object, scheduler : object, held : tuple = None):
+        """Executes the plan from start to finish.
+
+        Args:
+            backend (Backend): Backend every input is sent through.
+            scheduler (DeadlineScheduler): Scheduler every pause is timed against.
+            held (tuple, optional): (buttons, keys) sets to leave held inputs in for the caller to release. Defaults to None.
+        """
+        steps = self.steps(backend, scheduler, held)
+        try:
+            for seconds, label in steps:
+                if seconds is None:
+                    callevent(label[0], label[1], scheduler, backend)
+                else:
+                    scheduler.sleep(seconds, label)
+        finally:
+            steps.close()
+            if scheduler.started is not None:
+                scheduler.end()
+
+
+    async def run_async(self, backend : object, scheduler : object, held : tuple = None):
+        """Executes the plan from start to finish on the running asyncio event loop.
+        Every pause is awaited, so other tasks run in the meantime. If the task is cancelled,
+        any buttons and keys held down by the plan are released.
+
+        Args:
+            backend (Backend): Backend every input is sent through.
+            scheduler (DeadlineScheduler): Scheduler every pause is timed against.
+            held (tuple, optional): (buttons, keys) sets to leave held inputs in for the caller to release. Defaults to None.
+        """
+        steps = self.steps(backend, scheduler, held)
+        try:
+            for seconds, label in steps:
+                if seconds is None:
+                    await label[0].execute_async(verbose=label[1], scheduler=scheduler, backend=backend)
+                else:
+                    await scheduler.sleep_async(seconds, label)
+        finally:
+            steps.close()
+            if scheduler.started is not None:
+                scheduler.end()
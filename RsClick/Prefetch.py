@@ -0,0 +1,100 @@
+# MIT License
+
+# Copyright 2022 Svetlana Ankundinov
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import queue
+import threading
+
+
+_END = object()
+
+
+class Prefetcher:
+    """Resolves the iterations of a plan on a background thread while the caller plays them.
+
+    A producer thread walks the plan with Plan.resolve(), drawing the randomized delays and
+    unrolling the loops of the next iteration while the current one is still playing, and hands
+    the resulting chunks over through a bounded queue. The player only pops chunks which are
+    ready to fire.
+
+    Args:
+        plan (Plan): The compiled plan.
+        repeat (bool, optional): Produce iterations until closed instead of just one. Defaults to False.
+        depth (int, optional): Maximum number of chunks waiting in the queue. Defaults to 2.
+        chunksize (int, optional): Number of instructions per chunk. Defaults to 4096.
+    """
+
+
+    def __init__(self, plan : object, repeat : bool = False, depth : int = 2, chunksize : int = 4096):
+        self.plan = plan
+        self.repeat = repeat
+        self.chunksize = chunksize
+        self.queue = queue.Queue(maxsize=max(1, depth))
+        self.stopped = threading.Event()
+        self.thread = None
+
+
+    def put(self, item : object) -> bool:
+        """Queues an item for the player, giving up if the prefetcher is closed meanwhile."""
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.05)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+
+    def produce(self):
+        """Body of the producer thread."""
+        try:
+            while True:
+                for chunk in self.plan.resolve(self.chunksize):
+                    if not self.put(chunk):
+                        return
+                if not self.repeat:
+                    break
+        except Exception as e:
+            self.put(e)
+            return
+        self.put(_END)
+
+
+    def __iter__(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.produce, name="RsClick prefetch", daemon=True)
+            self.thread.start()
+        while True:
+            item = self.queue.get()
+            if item is _END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+
+    def close(self):
+        """Stops the producer thread and discards the chunks it has prepared."""
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        while not self.queue.empty():
+            self.queue.get_nowait()
@@ -0,0 +1,183 @@
+# MIT License
+
+# Copyright 2022 Svetlana Ankundinov
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import time
+import threading
+from .utils import strtokey, BUTTONNAMES
+from .TimeLine import *
+from .EventFile import EventWriter
+
+
+class Recorder:
+    """Records live mouse and keyboard input straight to a binary timeline file.
+
+    Input is captured with pynput listeners, timestamped with a monotonic clock and turned
+    into events as it happens: the gaps between inputs become PauseEvents, and every press and
+    release of a button or key is written on its own as a MouseDownEvent, MouseUpEvent,
+    KeyDownEvent or KeyUpEvent. Overlapping inputs such as ctrl+c, or moves made while a
+    button is held, therefore replay in the order and with the overlap they were made in.
+    Nothing but the set of held inputs is kept in memory, so recordings of any length use
+    constant memory. Input a timeline file can not hold, e.g. a key without a name or virtual
+    key code, is logged and skipped, and the time it took is kept as a pause.
+
+    Args:
+        path (str): The file to record to.
+        moves (bool, optional): Record mouse movement. Defaults to True.
+        stopkey (str, optional): Key which stops the recording when pressed. It is not recorded. Defaults to "esc".
+        buffering (int, optional): Size of the write buffer in bytes. Defaults to 65536.
+    """
+
+
+    def __init__(self, path : str, moves : bool = True, stopkey : str = "esc", buffering : int = 1 << 16):
+        self.path = path
+        self.moves = moves
+        self.stopkey = strtokey(stopkey) if stopkey is not None else None
+        self.buffering = buffering
+        self.writer = None
+        self.listeners = ()
+        self.buttons = set()
+        self.keys = set()
+        self.last = None
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+
+    def start(self):
+        """Opens the file and starts listening. Returns immediately.
+        """
+        from pynput import mouse, keyboard
+        self.writer = EventWriter(self.path, buffering=self.buffering)
+        self.last = time.perf_counter()
+        self.stopped.clear()
+        self.listeners = (
+            mouse.Listener(on_move=self.onmove if self.moves else None, on_click=self.onclick, on_scroll=self.onscroll),
+            keyboard.Listener(on_press=self.onpress, on_release=self.onrelease),
+        )
+        for listener in self.listeners:
+            listener.start()
+
+
+    def stop(self):
+        """Stops listening and closes the file. Inputs still held down are left without a
+        release, and are released when the recording finishes playing.
+        """
+        for listener in self.listeners:
+            listener.stop()
+        with self.lock:
+            if self.writer is not None:
+                self.writer.close()
+                self.writer = None
+        self.buttons.clear()
+        self.keys.clear()
+        self.stopped.set()
+
+
+    def wait(self, timeout : float = None) -> bool:
+        """Blocks until the recording is stopped, e.g. by the stop key.
+
+        Args:
+            timeout (float, optional): Maximum time to wait in seconds. Defaults to None.
+
+        Returns:
+            bool: True if the recording has stopped.
+        """
+        return self.stopped.wait(timeout)
+
+
+    def __enter__(self):
+        self.start()
+        return self
+
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+    def emit(self, start : float, event : Event) -> bool:
+        """Writes the pause since the previous event followed by the event itself.
+
+        Args:
+            start (float): Monotonic time at which the event happened.
+            event (Event): The event to write.
+
+        Returns:
+            bool: Whether the event was written. False if the recording is stopped or the event can not be stored.
+        """
+        with self.lock:
+            if self.writer is None:
+                return False
+            gap = start - self.last
+            if gap > 0:
+                self.writer.write(PauseEvent(gap))
+            self.last = max(self.last, start)
+            try:
+                self.writer.write(event)
+            except ValueError as e:
+                log.warning(f"Skipped input which can not be recorded. {e}")
+                return False
+            return True
+
+
+    def onmove(self, x : int, y : int):
+        self.emit(time.perf_counter(), MouseMoveEvent(x, y))
+
+
+    def onclick(self, x : int, y : int, button : object, pressed : bool):
+        now = time.perf_counter()
+        button = getattr(button, "name", button)
+        if button not in BUTTONNAMES or pressed == (button in self.buttons):
+            return
+        if pressed:
+            self.buttons.add(button)
+            self.emit(now, MouseDownEvent(button))
+        else:
+            self.buttons.discard(button)
+            self.emit(now, MouseUpEvent(button))
+
+
+    def onscroll(self, x : int, y : int, dx : int, dy : int):
+        self.emit(time.perf_counter(), MouseScrollEvent(dy))
+
+
+    def isstop(self, key : object) -> bool:
+        return self.stopkey is not None and strtokey(key) == self.stopkey
+
+
+    def onpress(self, key : object):
+        now = time.perf_counter()
+        if self.isstop(key):
+            return
+        key = strtokey(key)
+        # Held keys repeat their press; only the first one is recorded.
+        if key not in self.keys and self.emit(now, KeyDownEvent.fromkey(key)):
+            self.keys.add(key)
+
+
+    def onrelease(self, key : object):
+        now = time.perf_counter()
+        if self.isstop(key):
+            self.stop()
+            return False
+        key = strtokey(key)
+        if key in self.keys:
+            self.keys.discard(key)
+            self.emit(now, KeyUpEvent.fromkey(key))
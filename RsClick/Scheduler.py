@@ -0,0 +1,207 @@
+# MIT License
+
+# Copyright 2022 Svetlana Ankundinov
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import time
+
+
+class DeadlineScheduler:
+    """Fires events against absolute monotonic deadlines instead of chained sleeps.
+
+    Every pause moves the deadline forward by its duration, so time lost to dispatch,
+    logging or late OS wake-ups is absorbed by the next wait instead of adding up.
+
+    A schedule which falls behind by more than maxlateness, e.g. because a backend call
+    blocked, is re-anchored to the current time at the next wait, so the pauses after it are
+    kept instead of being skipped to catch up, which would fire the inputs in a burst. A button
+    or key which went down late is anchored to the same way, so it is still held for its full
+    release delay or hold.
+
+    If metrics are attached, the lateness of every event and wait is also recorded in them,
+    as is the dispatch latency of every event: the time from its start until it first waits or
+    the next event starts.
+
+    Args:
+        spinthreshold (float, optional): Seconds before a deadline at which the scheduler stops sleeping and busy-waits. Defaults to 0.002.
+        metrics (Metrics, optional): Metrics to record into. Defaults to None.
+        tracer (Tracer, optional): Tracer the plans run with this scheduler record their instructions in. Defaults to None.
+        maxlateness (float, optional): Seconds the schedule may fall behind before it is re-anchored, or None to always catch up. Defaults to 0.05.
+    """
+
+
+    def __init__(self, spinthreshold : float = 0.002, metrics : object = None, tracer : object = None, maxlateness : float = 0.05):
+        if spinthreshold < 0:
+            raise ValueError("spinthreshold must not be negative.")
+        self.spinthreshold = spinthreshold
+        self.maxlateness = maxlateness
+        self.deadline = None
+        self.stats = {}
+        self.metrics = metrics
+        self.tracer = tracer
+        self.clock = time.perf_counter
+        self.label = None
+        self.started = None
+
+
+    def reset(self):
+        """Anchors the schedule to the current time and clears the lateness statistics.
+        """
+        self.deadline = self.clock()
+        self.stats = {}
+
+
+    def sleep(self, seconds : float, label : str = "PauseEvent"):
+        """Advances the deadline by the given duration and waits for it.
+
+        Args:
+            seconds (float): Time in seconds to add to the current deadline.
+            label (str, optional): Name the lateness of this wait is recorded under. Defaults to "PauseEvent".
+        """
+        if self.started is not None:
+            self.end()
+        self.advance(seconds)
+        self.waituntil(self.deadline)
+        self.mark(label)
+
+
+    async def sleep_async(self, seconds : float, label : str = "PauseEvent"):
+        """Advances the deadline by the given duration and awaits it without blocking the event loop.
+        There is no spinning, so the accuracy is that of the event loop's timer.
+
+        Args:
+            seconds (float): Time in seconds to add to the current deadline.
+            label (str, optional): Name the lateness of this wait is recorded under. Defaults to "PauseEvent".
+        """
+        import asyncio
+        if self.started is not None:
+            self.end()
+        self.advance(seconds)
+        remaining = self.deadline - time.perf_counter()
+        while remaining > 0:
+            await asyncio.sleep(remaining)
+            remaining = self.deadline - time.perf_counter()
+        self.mark(label)
+
+
+    def advance(self, seconds : float):
+        """Moves the deadline forward, first re-anchoring it to the current time if the schedule
+        has fallen behind by more than maxlateness.
+
+        Args:
+            seconds (float): Time in seconds to add to the deadline.
+        """
+        if self.deadline is None:
+            self.reset()
+        elif self.maxlateness is not None:
+            now = self.clock()
+            if now - self.deadline > self.maxlateness:
+                self.deadline = now
+        self.deadline += seconds
+
+
+    def anchor(self):
+        """Moves the deadline up to the current time if it has passed by more than the
+        spinthreshold, so the next wait is measured from now. Called after a button or key is
+        pressed, so the wait for its release starts when it actually went down.
+        """
+        if self.deadline is None:
+            self.reset()
+            return
+        now = self.clock()
+        if now - self.deadline > self.spinthreshold:
+            self.deadline = now
+
+
+    def waituntil(self, deadline : float):
+        """Sleeps until shortly before the deadline, then spins until it has passed.
+
+        Args:
+            deadline (float): Absolute time.perf_counter() value to wait for.
+        """
+        remaining = deadline - time.perf_counter()
+        if remaining > self.spinthreshold:
+            time.sleep(remaining - self.spinthreshold)
+        while time.perf_counter() < deadline:
+            pass
+
+
+    def mark(self, label : str) -> float:
+        """Records how late the current moment is relative to the deadline.
+
+        Args:
+            label (str): Name the lateness is recorded under, usually the event type.
+
+        Returns:
+            float: Lateness in seconds.
+        """
+        if self.deadline is None:
+            self.reset()
+        lateness = self.clock() - self.deadline
+        if self.metrics is not None:
+            self.metrics.observe("lateness", label, lateness)
+        stat = self.stats.get(label)
+        if stat is None:
+            self.stats[label] = [1, lateness, lateness]
+        else:
+            stat[0] += 1
+            stat[1] += lateness
+            if lateness > stat[2]:
+                stat[2] = lateness
+        return lateness
+
+
+    def begin(self, label : str) -> float:
+        """Marks the start of an event, recording its lateness like mark() and, with metrics
+        attached, starting the measurement of its dispatch latency.
+
+        Args:
+            label (str): Name of the event type.
+
+        Returns:
+            float: Lateness in seconds.
+        """
+        if self.metrics is None:
+            return self.mark(label)
+        if self.started is not None:
+            self.end()
+        lateness = self.mark(label)
+        self.label = label
+        self.started = time.perf_counter()
+        return lateness
+
+
+    def end(self):
+        """Records the dispatch latency of the current event, if one is being measured."""
+        if self.started is not None:
+            self.metrics.observe("dispatch", self.label, time.perf_counter() - self.started)
+            self.started = None
+
+
+    def report(self) -> dict:
+        """Summarises the lateness recorded since the last reset.
+
+        Returns:
+            dict: Maps each label to its sample count, mean and maximum lateness in seconds.
+        """
+        return {
+            label : {"count" : count, "mean" : total / count, "max" : worst}
+            for label, (count, total, worst) in self.stats.items()
+        }
@@ -0,0 +1,490 @@
+# MIT License
+
+# Copyright 2022 Svetlana Ankundinov
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import json
+import os
+import hashlib
+import struct
+import tempfile
+from .utils import InvalidEventError, strtokey
+from .TimeLine import *
+from .Motion import HumanMotion, defaultmotion
+from .Typing import Cadence, TypeStreamEvent
+from .EventFile import EventWriter, InvalidFileError
+
+
+FORMAT = "rsclick"
+VERSION = 1
+
+# TimeLine settings stored with the events, under the names of the TimeLine arguments.
+SETTINGS = ("startpause", "verbose", "repeat", "defaultEventPause", "spinthreshold", "maxlateness", "seed", "distribution", "prefetch", "printloops")
+
+MOTION = ("rate", "speed", "mintime", "curvature", "jitter", "variants", "cachesize", "seed")
+
+
+def _key(key : object) -> object:
+    if isinstance(key, int):
+        return {"vk" : key}
+    return key if len(key) > 1 or (key == key.lower() and not key.isspace()) else {"char" : key}
+
+
+def _tokey(value : object) -> object:
+    if isinstance(value, str):
+        return strtokey(value)
+    if "char" in value:
+        return value["char"]
+    return value["vk"]
+
+
+def _range(value : object) -> object:
+    return list(value) if isinstance(value, (list, tuple)) else value
+
+
+def _motion(motion : HumanMotion) -> object:
+    if motion is None:
+        return None
+    if motion is defaultmotion():
+        return True
+    return {name : getattr(motion, name) for name in MOTION}
+
+
+def todict(event : Event) -> dict:
+    """Converts an event into plain data which can be encoded as JSON.
+
+    Args:
+        event (Event): The event. Loops are converted together with their events, pulling them once if they come from a lazy source.
+
+    Raises:
+        InvalidEventError: Raised if the object is not one of the built in events, or a TypeStreamEvent which does not type a string.
+
+    Returns:
+        dict: The event's type and arguments.
+    """
+    if isinstance(event, PauseEvent):
+        return {"type" : "PauseEvent", "time" : _range(event.time)}
+    if isinstance(event, MouseClickEvent):
+        return {"type" : "MouseClickEvent", "button" : event.button, "releasedelay" : _range(event.releasedelay), "doubleclick" : bool(event.doubleclick), "hold" : event.hold}
+    if isinstance(event, MouseMoveEvent):
+        return {"type" : "MouseMoveEvent", "x" : event.x, "y" : event.y, "relative" : bool(event.relative), "motion" : _motion(event.motion)}
+    if isinstance(event, KeyEvent):
+        return {"type" : "KeyEvent", "key" : _key(event.key), "releasedelay" : _range(event.releasedelay), "hold" : event.hold}
+    if isinstance(event, MouseDownEvent):
+        return {"type" : "MouseUpEvent" if isinstance(event, MouseUpEvent) else "MouseDownEvent", "button" : event.button}
+    if isinstance(event, KeyDownEvent):
+        return {"type" : "KeyUpEvent" if isinstance(event, KeyUpEvent) else "KeyDownEvent", "key" : _key(event.key)}
+    if isinstance(event, ChordEvent):
+        return {"type" : "ChordEvent", "spec" : event.spec, "releasedelay" : _range(event.releasedelay), "hold" : event.hold}
+    if isinstance(event, TypeEvent):
+        return {"type" : "TypeEvent", "text" : event.str}
+    if isinstance(event, MouseScrollEvent):
+        return {"type" : "MouseScrollEvent", "delta" : event.delta}
+    if isinstance(event, Loop):
+        return {"type" : "Loop", "repeats" : event.repeats, "events" : [todict(child) for child in event.events]}
+    if isinstance(event, TypeStreamEvent) and isinstance(event.source, str):
+        cadence = event.cadence
+        if cadence is not None:
+            cadence = {"cps" : cadence.cps, "spread" : cadence.spread, "bigrams" : cadence.bigrams, "seed" : cadence.seed}
+        return {"type" : "TypeStreamEvent", "text" : event.source, "cadence" : cadence, "cps" : event.cps, "chunksize" : event.chunksize}
+    raise InvalidEventError
+
+
+def fromdict(data : dict) -> Event:
+    """Creates an event from the data returned by todict().
+
+    Args:
+        data (dict): The data.
+
+    Raises:
+        InvalidFileError: Raised if the data does not describe a known event.
+
+    Returns:
+        Event: The event.
+    """
+    try:
+        kind = data["type"]
+        if kind == "PauseEvent":
+            return PauseEvent(data["time"])
+        if kind == "MouseClickEvent":
+            return MouseClickEvent(data["button"], releasedelay=tuple(data["releasedelay"]), doubleclick=data["doubleclick"], hold=data["hold"])
+        if kind == "MouseMoveEvent":
+            motion = data.get("motion")
+            if isinstance(motion, dict):
+                motion = HumanMotion(**motion)
+            return MouseMoveEvent(data["x"], data["y"], relative=data["relative"], motion=motion)
+        if kind == "KeyEvent":
+            return KeyEvent.fromkey(_tokey(data["key"]), releasedelay=tuple(data["releasedelay"]), hold=data["hold"])
+        if kind == "MouseDownEvent":
+            return MouseDownEvent(data["button"])
+        if kind == "MouseUpEvent":
+            return MouseUpEvent(data["button"])
+        if kind == "KeyDownEvent":
+            return KeyDownEvent.fromkey(_tokey(data["key"]))
+        if kind == "KeyUpEvent":
+            return KeyUpEvent.fromkey(_tokey(data["key"]))
+        if kind == "ChordEvent":
+            return ChordEvent(data["spec"], releasedelay=tuple(data["releasedelay"]), hold=data["hold"])
+        if kind == "TypeEvent":
+            return TypeEvent(data["text"])
+        if kind == "MouseScrollEvent":
+            return MouseScrollEvent(data["delta"])
+        if kind == "Loop":
+            return Loop(*(fromdict(child) for child in data["events"]), repeats=data["repeats"])
+        if kind == "TypeStreamEvent":
+            cadence = data.get("cadence")
+            return TypeStreamEvent(data["text"], cadence=Cadence(**cadence) if cadence is not None else None, cps=data.get("cps"), chunksize=data.get("chunksize", 4096))
+    except (KeyError, TypeError) as e:
+        raise InvalidFileError(f"Invalid event in timeline: {e!r}")
+    raise InvalidFileError(f"Unknown event type {kind!r} in timeline.")
+
+
+def settings(timeline : TimeLine) -> dict:
+    """Returns the settings of a TimeLine under the names of its arguments.
+
+    Args:
+        timeline (TimeLine): The TimeLine.
+
+    Returns:
+        dict: The settings.
+    """
+    return {
+        "startpause" : _range(timeline.startpause),
+        "verbose" : timeline.verbose,
+        "repeat" : timeline.repeat,
+        "defaultEventPause" : _range(timeline.defaulteventpause.getTime()),
+        "spinthreshold" : timeline.scheduler.spinthreshold,
+        "maxlateness" : timeline.scheduler.maxlateness,
+        "seed" : timeline.random.seed,
+        "distribution" : timeline.random.distribution,
+        "prefetch" : timeline.prefetch,
+        "printloops" : timeline.printloops,
+    }
+
+
+def dumps(timeline : TimeLine, indent : int = 2) -> str:
+    """Serializes a TimeLine and its events as JSON.
+
+    Args:
+        timeline (TimeLine): The TimeLine. Its backend, metrics and tracer are not stored.
+        indent (int, optional): Indentation of the JSON, or None for a single line. Defaults to 2.
+
+    Raises:
+        InvalidEventError: Raised if an event can not be serialized.
+
+    Returns:
+        str: The JSON text.
+    """
+    data = {
+        "format" : FORMAT,
+        "version" : VERSION,
+        "settings" : settings(timeline),
+        "events" : [todict(event) for event in timeline.events],
+    }
+    return json.dumps(data, indent=indent, ensure_ascii=False)
+
+
+def parse(text : str) -> tuple:
+    """Parses JSON made by dumps() into events and settings.
+
+    Args:
+        text (str): The JSON text.
+
+    Raises:
+        InvalidFileError: Raised if the text is not a serialized TimeLine.
+
+    Returns:
+        tuple: The list of events, and the settings as TimeLine keyword arguments.
+    """
+    try:
+        data = json.loads(text)
+    except ValueError as e:
+        raise InvalidFileError(f"Invalid JSON timeline: {e}")
+    if not isinstance(data, dict) or data.get("format") != FORMAT or data.get("version") != VERSION:
+        raise InvalidFileError("Not a serialized RsClick timeline.")
+    options = {name : value for name, value in data.get("settings", {}).items() if name in SETTINGS}
+    return [fromdict(event) for event in data.get("events", ())], options
+
+
+def loads(text : str, **kwargs) -> TimeLine:
+    """Creates a TimeLine from JSON made by dumps().
+
+    Args:
+        text (str): The JSON text.
+        **kwargs: TimeLine arguments overriding the stored settings, e.g. backend.
+
+    Raises:
+        InvalidFileError: Raised if the text is not a serialized TimeLine.
+
+    Returns:
+        TimeLine: The TimeLine.
+    """
+    events, options = parse(text)
+    options.update(kwargs)
+    return TimeLine(*events, **options)
+
+
+def save(timeline : TimeLine, path : str, indent : int = 2):
+    """Writes a TimeLine to a JSON file.
+
+    Args:
+        timeline (TimeLine): The TimeLine.
+        path (str): The file to write.
+        indent (int, optional): Indentation of the JSON. Defaults to 2.
+    """
+    text = dumps(timeline, indent=indent)
+    with open(path, "w", encoding="utf-8") as file:
+        file.write(text)
+
+
+def load(path : str, **kwargs) -> TimeLine:
+    """Reads a TimeLine from a JSON file.
+
+    Args:
+        path (str): The file to read.
+        **kwargs: TimeLine arguments overriding the stored settings.
+
+    Returns:
+        TimeLine: The TimeLine.
+    """
+    with open(path, encoding="utf-8") as file:
+        return loads(file.read(), **kwargs)
+
+
+def _binary(events : object) -> bool:
+    for event in events:
+        if isinstance(event, Loop):
+            if not _binary(event.events):
+                return False
+        elif isinstance(event, MouseMoveEvent):
+            if event.motion is not None and event.motion is not defaultmotion():
+                return False
+        elif not isinstance(event, (PauseEvent, MouseClickEvent, MouseDownEvent, KeyEvent, KeyDownEvent, ChordEvent, TypeEvent, MouseScrollEvent)):
+            return False
+    return True
+
+
+class TimelineCache:
+    """Content-addressed disk cache of JSON timelines converted to binary timeline files.
+
+    A JSON timeline is looked up by the SHA-256 digest of its text. On a miss it is parsed
+    once and written to the cache as a binary timeline file, next to its settings. Every load
+    then memory-maps the binary file and decodes its events lazily while playing, instead of
+    parsing the JSON again. Once the cache grows beyond maxbytes, the least recently used
+    entries are removed. Entries are written to temporary files and renamed into place, so
+    processes sharing a cache never see each other's partial entries. Timelines with events
+    the binary format can not hold, such as a TypeStreamEvent or a custom HumanMotion, or with
+    values it can not hold, such as a fractional coordinate, are parsed every time and not
+    cached.
+
+    Args:
+        directory (str, optional): Directory of the cache. Defaults to ~/.cache/rsclick.
+        maxbytes (int, optional): Maximum total size of the cache in bytes. Defaults to 256 MiB.
+    """
+
+
+    def __init__(self, directory : str = None, maxbytes : int = 1 << 28):
+        if directory is None:
+            directory = os.path.join(os.path.expanduser("~"), ".cache", "rsclick")
+        self.directory = directory
+        self.maxbytes = maxbytes
+        self.hits = 0
+        self.misses = 0
+
+
+    def paths(self, digest : str) -> tuple:
+        """Returns the paths of the binary file and the settings of a cache entry.
+
+        Args:
+            digest (str): Hex digest of the JSON text.
+
+        Returns:
+            tuple: The two paths.
+        """
+        base = os.path.join(self.directory, digest)
+        return base + ".rsc", base + ".json"
+
+
+    def load(self, path : str, **kwargs) -> TimeLine:
+        """Loads a JSON timeline file through the cache.
+
+        Args:
+            path (str): The JSON file.
+            **kwargs: TimeLine arguments overriding the stored settings.
+
+        Raises:
+            InvalidFileError: Raised if the file is not a serialized TimeLine.
+
+        Returns:
+            TimeLine: The TimeLine, playing from a memory-mapped binary file if it could be cached.
+        """
+        with open(path, "rb") as file:
+            text = file.read()
+        digest = hashlib.sha256(text).hexdigest()
+        events, options = self.lookup(digest)
+        if events is None:
+            self.misses += 1
+            events, options = parse(text.decode("utf-8"))
+            if _binary(events) and self.store(digest, events, options):
+                mapped, stored = self.lookup(digest)
+                if mapped is not None:
+                    events, options = mapped, stored
+        else:
+            self.hits += 1
+        options.update(kwargs)
+        if isinstance(events, list):
+            return TimeLine(*events, **options)
+        timeline = TimeLine(**options)
+        timeline.events = events
+        return timeline
+
+
+    def lookup(self, digest : str) -> tuple:
+        """Opens a cache entry and marks it as recently used.
+
+        Args:
+            digest (str): Hex digest of the JSON text.
+
+        Returns:
+            tuple: The MappedEvents of the entry and its settings, or None twice on a miss.
+        """
+        from .EventFile import MappedEvents
+        events, settings = self.paths(digest)
+        try:
+            with open(settings, encoding="utf-8") as file:
+                options = json.load(file)
+            mapped = MappedEvents(events)
+        except (OSError, ValueError, InvalidFileError):
+            return None, None
+        for path in (events, settings):
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+        return mapped, options
+
+
+    def store(self, digest : str, events : list, options : dict) -> bool:
+        """Writes a cache entry, then evicts entries until the cache fits in maxbytes.
+
+        Args:
+            digest (str): Hex digest of the JSON text.
+            events (list): The parsed events.
+            options (dict): The stored settings.
+
+        Returns:
+            bool: Whether the entry was written. False if an event has a value the binary format can not hold, e.g. a key without a stored name or a fractional coordinate.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        binary, settings = self.paths(digest)
+        temporary = []
+        try:
+            for _ in range(2):
+                handle, path = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+                os.close(handle)
+                temporary.append(path)
+            with EventWriter(temporary[0]) as writer:
+                for event in events:
+                    writer.write(event)
+            with open(temporary[1], "w", encoding="utf-8") as file:
+                json.dump(options, file)
+            os.replace(temporary[0], binary)
+            os.replace(temporary[1], settings)
+        except (ValueError, struct.error, InvalidEventError):
+            return False
+        finally:
+            for path in temporary:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        self.evict(keep=digest)
+        return True
+
+
+    def entries(self) -> list:
+        """Lists the cache entries, least recently used first.
+
+        Returns:
+            list: (last use, size in bytes, digest) tuples.
+        """
+        entries = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return entries
+        for name in names:
+            if not name.endswith(".rsc"):
+                continue
+            digest = name[:-4]
+            size = 0
+            used = 0.0
+            for path in self.paths(digest):
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                size += stat.st_size
+                used = max(used, stat.st_mtime)
+            entries.append((used, size, digest))
+        entries.sort()
+        return entries
+
+
+    def size(self) -> int:
+        """Returns the total size of the cache in bytes."""
+        return sum(size for used, size, digest in self.entries())
+
+
+    def evict(self, keep : str = None):
+        """Removes the least recently used entries until the cache fits in maxbytes.
+
+        Args:
+            keep (str, optional): Digest of an entry which is never removed. Defaults to None.
+        """
+        entries = self.entries()
+        total = sum(size for used, size, digest in entries)
+        for used, size, digest in entries:
+            if total <= self.maxbytes:
+                break
+            if digest == keep:
+                continue
+            self.remove(digest)
+            total -= size
+
+
+    def remove(self, digest : str):
+        """Removes a cache entry. Files still mapped elsewhere are skipped where the platform does not allow removing them.
+
+        Args:
+            digest (str): Hex digest of the JSON text.
+        """
+        for path in self.paths(digest):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+    def clear(self):
+        """Removes every entry."""
+        for used, size, digest in self.entries():
+            self.remove(digest)
@@ -0,0 +1,230 @@
+# MIT License
+
+# Copyright 2022 Svetlana Ankundinov
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import math
+from .utils import LazyModule
+from .Scheduler import DeadlineScheduler
+from .Backend import RecordingBackend
+from .Delays import RandomSource
+from .Plan import Plan, OP_PAUSE, OP_DRAW, OP_LOOP, OP_ENDLOOP, OP_MOVE, OP_MOVEBY, OP_PATH, OP_TEXT, OP_STREAM
+
+
+np = LazyModule("numpy")
+
+
+class VirtualScheduler(DeadlineScheduler):
+    """Scheduler running against a virtual clock. Waiting for a deadline moves the clock
+    forward to it at once, so a script plays in as long as it takes to dispatch its events
+    while every pause still counts towards its duration.
+    """
+
+
+    def __init__(self):
+        super().__init__(spinthreshold=0.0)
+        self.now = 0.0
+        self.clock = self.time
+
+
+    def time(self) -> float:
+        """Returns the virtual time.
+
+        Returns:
+            float: Seconds since the scheduler was created.
+        """
+        return self.now
+
+
+    def waituntil(self, deadline : float):
+        if deadline > self.now:
+            self.now = deadline
+
+
+    async def sleep_async(self, seconds : float, label : str = "PauseEvent"):
+        self.sleep(seconds, label)
+
+
+class Simulator:
+    """Dry runs a TimeLine against a virtual clock, or estimates its duration without running it.
+
+    Args:
+        timeline (TimeLine): The TimeLine to simulate. It is left unchanged.
+        capacity (int, optional): Maximum number of inputs kept by the RecordingBackend of a dry run. Defaults to 65536.
+    """
+
+
+    def __init__(self, timeline : object, capacity : int = 65536):
+        self.timeline = timeline
+        self.capacity = capacity
+
+
+    def run(self, seed : int = None) -> tuple:
+        """Plays one pass of the TimeLine, including its start pause, on a VirtualScheduler and a
+        RecordingBackend. Nothing sleeps and no input reaches a device, but every event is
+        compiled and dispatched as it would be, custom events included.
+
+        Args:
+            seed (int, optional): Seed for the randomized delays. Defaults to the seed of the TimeLine.
+
+        Raises:
+            Exception: Any error raised while playing the TimeLine.
+
+        Returns:
+            tuple: The duration in seconds, and the RecordingBackend holding every input with its virtual timestamp.
+        """
+        import copy
+        scheduler = VirtualScheduler()
+        backend = RecordingBackend(self.capacity, clock=scheduler.clock)
+        timeline = copy.copy(self.timeline)
+        timeline.scheduler = scheduler
+        timeline.backend = backend
+        timeline.random = RandomSource(self.timeline.random.seed if seed is None else seed, self.timeline.random.distribution)
+        timeline.repeat = False
+        timeline.prefetch = 0
+        timeline.metrics = None
+        timeline.trace = None
+        timeline.verbose = False
+        timeline.printloops = False
+        timeline.ERROR = None
+        timeline.start()
+        if timeline.ERROR is not None:
+            raise timeline.ERROR
+        return scheduler.now, backend
+
+
+    def model(self) -> tuple:
+        """Reduces one pass of the TimeLine to a constant duration plus a number of randomized
+        delays per range. Loops multiply the counts of their body instead of being unrolled,
+        and curved mouse movements are followed from (0, 0) through the first iteration of
+        every loop. Custom events are not timed.
+
+        Returns:
+            tuple: The constant duration in seconds, and a dictionary mapping (low, high, distribution) to the number of delays drawn from that range.
+        """
+        timeline = self.timeline
+        model = [0.0, {}]
+        self._pause(model, timeline.startpause, 1, "uniform")
+        plan = Plan(random=RandomSource(distribution=timeline.random.distribution), printloops=False)
+        events = timeline.events
+        if isinstance(events, tuple):
+            for event in events:
+                timeline.compileevent(plan, event)
+            self._walk(plan, model, 1, (0, 0))
+        else:
+            position = (0, 0)
+            for event in events:
+                plan.clear()
+                timeline.compileevent(plan, event)
+                position = self._walk(plan, model, 1, position)
+        return model[0], model[1]
+
+
+    def _pause(self, model : list, time : object, count : int, distribution : str):
+        if isinstance(time, (list, tuple)):
+            if time[0] == time[1]:
+                model[0] += time[0] * count
+            else:
+                key = (time[0], time[1], distribution)
+                model[1][key] = model[1].get(key, 0) + count
+        else:
+            model[0] += time * count
+
+
+    def _walk(self, plan : Plan, model : list, count : int, position : tuple) -> tuple:
+        distribution = self.timeline.random.distribution
+        counts = [count]
+        for op, a, b in plan.code:
+            count = counts[-1]
+            if op == OP_PAUSE:
+                self._pause(model, (a, b), count, "uniform")
+            elif op == OP_DRAW:
+                self._pause(model, (a.low, a.high), count, distribution)
+            elif op == OP_LOOP:
+                counts.append(count * b)
+            elif op == OP_ENDLOOP:
+                counts.pop()
+            elif op == OP_MOVE:
+                position = (a, b)
+            elif op == OP_MOVEBY:
+                position = (position[0] + a, position[1] + b)
+            elif op == OP_PATH:
+                dx, dy = (a[0], a[1]) if a[2] else (a[0] - position[0], a[1] - position[1])
+                model[0] += b.duration(dx, dy) * count
+                position = (position[0] + dx, position[1] + dy)
+            elif op == OP_TEXT:
+                cps = a.cadence.cps if a.cadence is not None else a.cps
+                if cps:
+                    model[0] += sum(len(chunk) for chunk in a.chunks()) / cps * count
+            elif op == OP_STREAM:
+                sub = Plan(random=plan.random, printloops=False)
+                for event in a.events:
+                    sub.clear()
+                    a.compileevent(sub, event)
+                    position = self._walk(sub, model, count * a.repeats, position)
+        return position
+
+
+    def estimate(self, runs : int = 10000, seed : int = None, exactlimit : int = 16) -> dict:
+        """Estimates the distribution of the duration of one pass of the TimeLine by Monte Carlo
+        simulation of its model(), without playing it.
+
+        All runs are sampled at once with numpy. A range drawn from at most exactlimit times per
+        pass is sampled delay by delay; the sum of the delays of a range drawn from more often is
+        sampled from its normal approximation, so the cost does not depend on the length of the
+        script or the number of loop repeats.
+
+        Args:
+            runs (int, optional): Number of simulated runs. Defaults to 10000.
+            seed (int, optional): Seed for the simulation. Defaults to None.
+            exactlimit (int, optional): Largest number of delays of a range which are sampled one by one. Defaults to 16.
+
+        Returns:
+            dict: The mean, standard deviation, minimum, p50, p95, p99 and maximum duration in seconds.
+        """
+        constant, ranges = self.model()
+        rng = np.random.default_rng(seed)
+        totals = np.full(runs, constant, dtype=np.float64)
+        sources = {}
+        for (low, high, distribution), count in ranges.items():
+            source = sources.get(distribution)
+            if source is None:
+                source = sources[distribution] = RandomSource(distribution=distribution)
+            if count <= exactlimit:
+                totals += source.array(rng, low, high, runs * count).reshape(runs, count).sum(axis=1)
+                continue
+            if distribution == "uniform":
+                mean, variance = (low + high) / 2, (high - low) ** 2 / 12
+            else:
+                sample = source.array(rng, low, high, 1 << 16)
+                mean, variance = float(sample.mean()), float(sample.var())
+            totals += rng.normal(mean * count, math.sqrt(variance * count), runs)
+        p50, p95, p99 = np.percentile(totals, (50, 95, 99)).tolist()
+        return {
+            "runs" : runs,
+            "mean" : float(totals.mean()),
+            "std" : float(totals.std()),
+            "min" : float(totals.min()),
+            "p50" : p50,
+            "p95" : p95,
+            "p99" : p99,
+            "max" : float(totals.max()),
+        }
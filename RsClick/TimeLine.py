@@ -20,35 +20,251 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-import logging as log
-from pynput.mouse import Controller as mctrl
-from pynput.keyboard import  Controller as kctrl
-from utils import *
+from .utils import *
+from .Scheduler import DeadlineScheduler
+from .Plan import *
+from .Backend import *
+from .Motion import HumanMotion, defaultmotion
+from .Delays import RandomSource
 
 
-MOUSE_CONTROLLER = mctrl()
-KEYBOARD_CONTROLLER = kctrl()
+log = LazyModule("logging")
+
+
+class EventSource:
+    """Events pulled lazily from an iterable, or from a function returning one.
+
+    Iterating calls the function again every time, so a generator function yields a fresh pass
+    of events for every repetition. A plain iterator is consumed by its first pass.
+
+    Args:
+        source (object): An iterable of events, or a function without arguments returning one.
+    """
+
+
+    def __init__(self, source : object):
+        self.source = source
+
+
+    def __iter__(self):
+        return iter(self.source() if callable(self.source) else self.source)
+
+
+def lazyevents(events : tuple) -> object:
+    """Wraps the arguments of a TimeLine or Loop into an EventSource if they are a single source of events.
+
+    Args:
+        events (tuple): The positional arguments.
+
+    Returns:
+        object: An EventSource, or the arguments as they were.
+    """
+    if len(events) == 1:
+        source = events[0]
+        if not isinstance(source, (Event, str)) and (callable(source) or hasattr(source, "__iter__")):
+            return EventSource(source)
+    return events
+
 
 class TimeLine:
     """TimeLine responsible for storing and executing events. 
 
+    Instead of events, a single iterable or a function returning one may be passed, e.g. a
+    generator function. Its events are then pulled one at a time as the TimeLine runs, and a
+    function is called again for every repetition.
+
     Args:
         startpause (float, optional): Time to pause before executing the script. Defaults to 5.0.
         verbose (bool, optional): Print out event happenings. Defaults to True.
         repeat (bool, optional): Repeat the script indefinitely. Defaults to True.
         defaultEventPause (float, optional): Default time to pause between events. If left unset, there will be no delay. Defaults to 0.0.
+        spinthreshold (float, optional): Seconds before each deadline at which the scheduler switches from sleeping to spinning. Defaults to 0.002.
+        maxlateness (float, optional): Seconds the schedule may fall behind, e.g. after a slow backend call, before it is re-anchored to the current time instead of skipping pauses to catch up. None always catches up. Defaults to 0.05.
+        backend (Backend, optional): Backend the input is sent through. Defaults to the backend returned by getbackend().
+        seed (int, optional): Seed for the randomized delays. A TimeLine with a seed replays the same delays on every start. Defaults to None.
+        distribution (str, optional): Distribution of the randomized delays: "uniform", "truncnormal" or "lognormal". Defaults to "uniform".
+        prefetch (int, optional): Number of resolved chunks of instructions to prepare ahead on a background thread, drawing delays and unrolling loops while the previous chunk plays. If 0 everything is resolved in line. Defaults to 0.
+        metrics (Metrics, optional): Metrics recording the dispatch latency, lateness and backend call time of every event type, and any errors. Defaults to None.
+        trace (Tracer, optional): Tracer recording every instruction run. Verbose messages are then written to the trace instead of the log. Defaults to None.
+        printloops (bool, optional): Print the number of every Loop iteration as it starts. Defaults to True.
     """
 
 
-    def __init__(self, *events, startpause : float = 5.0, verbose : bool = True, repeat : bool = True, defaultEventPause : float = 0.0):
-        self.events = events
+    def __init__(self, *events, startpause : float = 5.0, verbose : bool = True, repeat : bool = True, defaultEventPause : float = 0.0, spinthreshold : float = 0.002, maxlateness : float = 0.05, backend : Backend = None, seed : int = None, distribution : str = "uniform", prefetch : int = 0, metrics : object = None, trace : object = None, printloops : bool = True):
+        self.events = lazyevents(events)
         self.startpause = startpause
         self.verbose = verbose
         self.repeat = repeat
         self.defaulteventpause = PauseEvent(defaultEventPause)
+        self.scheduler = DeadlineScheduler(spinthreshold, maxlateness=maxlateness)
+        self.backend = backend
+        self.random = RandomSource(seed, distribution)
+        self.prefetch = prefetch
+        self.metrics = metrics
+        self.trace = trace
+        self.printloops = printloops
         self.ERROR = None
 
 
+    @classmethod
+    def from_file(cls, path : str, **kwargs) -> "TimeLine":
+        """Creates a TimeLine which plays a binary timeline file, such as one made by a Recorder.
+
+        The file is memory-mapped and its events are decoded one at a time while playing, so
+        playback starts at once and memory use does not grow with the length of the file.
+
+        Args:
+            path (str): The file to play.
+            **kwargs: Any of the keyword arguments accepted by TimeLine.
+
+        Raises:
+            InvalidFileError: Raised if the file is not a valid timeline file.
+
+        Returns:
+            TimeLine: The TimeLine.
+        """
+        from .EventFile import MappedEvents
+        timeline = cls(**kwargs)
+        timeline.events = MappedEvents(path)
+        return timeline
+
+
+    def compileevent(self, plan : Plan, event : "Event"):
+        """Validates a single top level event and appends its instructions to a plan.
+
+        Args:
+            plan (Plan): The plan being compiled.
+            event (Event): The event to compile.
+
+        Raises:
+            InvalidEventError: Raised if the object is not an Event.
+        """
+        if not isinstance(event, Event):
+            raise InvalidEventError
+        plan.mark(type(event).__name__)
+        if _callsexecute(type(event)):
+            plan.emit(OP_CALL, event, plan.verbose)
+        else:
+            event.compile(plan)
+        if self.defaulteventpause.getTime() != 0:
+            plan.pause(self.defaulteventpause.getTime())
+
+
+    def compile(self) -> Plan:
+        """Validates every event once and flattens the script into a single instruction plan.
+
+        Raises:
+            InvalidEventError: Raised if an invalid object is passed into the TimeLine.
+            InvalidIntervalError: Raised if an event has an invalid randomization range.
+
+        Returns:
+            Plan: The compiled plan.
+        """
+        plan = Plan(verbose=self.verbose, random=self.random, printloops=self.printloops)
+        for event in self.events:
+            self.compileevent(plan, event)
+        return plan
+
+
+    def stream(self, backend : Backend) -> int:
+        """Executes one pass over the events, compiling each one just before it runs.
+        Used for events which are not held in memory, such as those of a mapped file or a generator.
+
+        Args:
+            backend (Backend): Backend the input is sent through.
+
+        Returns:
+            int: The number of events executed.
+        """
+        plan = Plan(verbose=self.verbose, random=self.random, printloops=self.printloops)
+        count = 0
+        held = (set(), set())
+        try:
+            for event in self.events:
+                plan.clear()
+                self.compileevent(plan, event)
+                plan.run(backend, self.scheduler, held)
+                count += 1
+        finally:
+            releaseheld(backend, held)
+        return count
+
+
+    async def stream_async(self, backend : Backend) -> int:
+        """Asynchronous counterpart of stream().
+
+        Args:
+            backend (Backend): Backend the input is sent through.
+
+        Returns:
+            int: The number of events executed.
+        """
+        plan = Plan(verbose=self.verbose, random=self.random, printloops=self.printloops)
+        count = 0
+        held = (set(), set())
+        try:
+            for event in self.events:
+                plan.clear()
+                self.compileevent(plan, event)
+                await plan.run_async(backend, self.scheduler, held)
+                count += 1
+        finally:
+            releaseheld(backend, held)
+        return count
+
+
+    def resolvebackend(self) -> Backend:
+        """Returns the backend to send input through, instrumented if metrics are attached,
+        and attaches the metrics and tracer to the scheduler.
+
+        Returns:
+            Backend: The backend.
+        """
+        backend = self.backend if self.backend is not None else getbackend()
+        self.scheduler.metrics = self.metrics
+        self.scheduler.tracer = self.trace
+        if self.metrics is not None:
+            from .Metrics import TimedBackend
+            backend = TimedBackend(backend, self.metrics, self.scheduler)
+        return backend
+
+
+    def prefetched(self, plan : Plan, backend : Backend):
+        """Plays a compiled plan from chunks resolved ahead of time by a Prefetcher.
+
+        Args:
+            plan (Plan): The compiled plan.
+            backend (Backend): Backend the input is sent through.
+        """
+        from .Prefetch import Prefetcher
+        prefetcher = Prefetcher(plan, repeat=self.repeat, depth=self.prefetch)
+        try:
+            for chunk in prefetcher:
+                chunk.run(backend, self.scheduler)
+        finally:
+            prefetcher.close()
+
+
+    def play(self, plan : Plan, backend : Backend):
+        """Executes the events once, or until stopped if repeat is set, without the start pause.
+
+        Args:
+            plan (Plan): The compiled plan, or None to stream the events.
+            backend (Backend): Backend the input is sent through.
+        """
+        if plan is not None and self.prefetch:
+            self.prefetched(plan, backend)
+            return
+        while True:
+            if plan is None:
+                if not self.stream(backend):
+                    break
+            else:
+                plan.run(backend, self.scheduler)
+            if not self.repeat:
+                break
+
+
     def start(self):
         """Begins the consecutive execution of events. 
 
@@ -56,29 +272,131 @@ class TimeLine:
             InvalidEventError: Raised if an invalid object is passed into the TimeLine.
         """
         try:
-            PauseEvent(self.startpause).execute(verbose=True)
+            plan = self.compile() if isinstance(self.events, tuple) else None
+            backend = self.resolvebackend()
+            self.random.reset()
+            self.scheduler.reset()
+            PauseEvent(self.startpause).execute(verbose=True, scheduler=self.scheduler, backend=backend)
+            self.play(plan, backend)
+        except Exception as e:
+            self.ERROR = e
+            if self.metrics is not None:
+                self.metrics.error(e)
+            log.error(f"An error has occured.{e}")
+
+
+    async def run_async(self):
+        """Executes the events as a coroutine on the running asyncio event loop, so several
+        TimeLines can be played side by side in one thread. Cancelling the task stops the
+        TimeLine and releases any buttons or keys it is holding down.
+
+        Pauses are awaited rather than spun on, so their accuracy is that of the event loop.
+        Errors are stored in ERROR and logged, just like start().
+        """
+        try:
+            plan = self.compile() if isinstance(self.events, tuple) else None
+            backend = self.resolvebackend()
+            self.random.reset()
+            self.scheduler.reset()
+            await PauseEvent(self.startpause).execute_async(verbose=True, scheduler=self.scheduler, backend=backend)
             while True:
-                for event in self.events:
-                    if not isinstance(event, Event):
-                        raise InvalidEventError
-                    event.execute(verbose=self.verbose)
-                    if self.defaulteventpause.getTime != 0:
-                        self.defaulteventpause.execute()
+                if plan is None:
+                    if not await self.stream_async(backend):
+                        break
+                else:
+                    await plan.run_async(backend, self.scheduler)
                 if not self.repeat:
                     break
         except Exception as e:
             self.ERROR = e
+            if self.metrics is not None:
+                self.metrics.error(e)
             log.error(f"An error has occured.{e}")
 
 
     def setDefaultEventPause(self, time : float):
         self.defaulteventpause = PauseEvent(time)
 
+
+    def lateness(self) -> dict:
+        """Per-event lateness of the last run, measured against the scheduled deadlines.
+
+        Returns:
+            dict: Maps each event type to its sample count, mean and maximum lateness in seconds.
+        """
+        return self.scheduler.report()
+
+# Whether the execute() of each event type is overridden below the class providing its compile().
+_CUSTOMEXECUTE = {}
+
+
+def _callsexecute(cls : type) -> bool:
+    custom = _CUSTOMEXECUTE.get(cls)
+    if custom is None:
+        mro = cls.__mro__
+        owner = next(index for index, base in enumerate(mro) if "compile" in vars(base))
+        custom = any("execute" in vars(base) for base in mro[:owner])
+        _CUSTOMEXECUTE[cls] = custom
+    return custom
+
+
 class Event:
-    """Base Event class
+    """Base Event class. Subclasses describe themselves by appending instructions to a Plan in compile().
+    Custom events which only override execute(), including subclasses of the built in events,
+    are called back from the plan as they are.
     """
-    def execute(self):
-        pass
+
+    __slots__ = ()
+
+
+    def compile(self, plan : Plan):
+        """Append the instructions for this event to a plan.
+
+        Args:
+            plan (Plan): The plan being compiled.
+        """
+        plan.emit(OP_CALL, self, plan.verbose)
+
+
+    def execute(self, verbose : bool = False, scheduler : DeadlineScheduler = None, backend : Backend = None):
+        """Compile and execute this event on its own.
+
+        Args:
+            verbose (bool, optional): Print out event occurances. Defaults to False.
+            scheduler (DeadlineScheduler, optional): Scheduler pauses are timed against. A fresh one is used if unset.
+            backend (Backend, optional): Backend the input is sent through. Defaults to the backend returned by getbackend().
+        """
+        # An Event which overrides neither method has nothing to do.
+        if type(self).compile is Event.compile:
+            return
+        plan = Plan(verbose=verbose)
+        self.compile(plan)
+        if scheduler is None:
+            scheduler = DeadlineScheduler()
+            scheduler.reset()
+        plan.run(backend if backend is not None else getbackend(), scheduler)
+
+    async def execute_async(self, verbose : bool = False, scheduler : DeadlineScheduler = None, backend : Backend = None):
+        """Compile and execute this event on its own as a coroutine. Custom events which only
+        override execute() are run in the event loop's default executor.
+
+        Args:
+            verbose (bool, optional): Print out event occurances. Defaults to False.
+            scheduler (DeadlineScheduler, optional): Scheduler pauses are timed against. A fresh one is used if unset.
+            backend (Backend, optional): Backend the input is sent through. Defaults to the backend returned by getbackend().
+        """
+        if _callsexecute(type(self)):
+            import asyncio
+            await asyncio.get_running_loop().run_in_executor(None, lambda: callevent(self, verbose, scheduler, backend))
+            return
+        if type(self).compile is Event.compile:
+            return
+        plan = Plan(verbose=verbose)
+        self.compile(plan)
+        if scheduler is None:
+            scheduler = DeadlineScheduler()
+            scheduler.reset()
+        await plan.run_async(backend if backend is not None else getbackend(), scheduler)
 
 class PauseEvent(Event):
     """Pause event. Pause the script. 
@@ -87,24 +405,25 @@ class PauseEvent(Event):
         time (object): float or a list of floats of length 2 representing a randomization range. 
     """    
 
+    __slots__ = ("time",)
+
+
     def __init__(self, time : object):
 
         self.time = time
 
 
-    def execute(self, verbose : bool = False):
-        """Execute the configured Event
+    def compile(self, plan : Plan):
+        """Append the instructions for this event to a plan.
 
         Args:
-            verbose (bool, optional): Print out event occurances. Defaults to False.
+            plan (Plan): The plan being compiled.
+
+        Raises:
+            InvalidIntervalError: Raised if an invalid interval is passed.
         """
-        import time
-        if verbose:
-            log.info(f"Sleeping for {self.time} seconds!")
-        if type(self.time) == list:
-            time.sleep(rfloatrange(self.time[0], self.time[1]))
-        else:
-            time.sleep(self.time)    
+        plan.log(f"Sleeping for {self.time} seconds!")
+        plan.pause(self.time)
 
 
     def getTime(self) -> float:
@@ -114,49 +433,94 @@ class MouseClickEvent(Event):
     """A Mouse click event. 
 
     Args:
-        button (str): "l", "r", "left", or "right".
-        releasedelay (list, optional): Range for which to calculate the release delay.. Defaults to [.0824, .223].
+        button (str): "l", "r", "m", "left", "right" or "middle".
+        releasedelay (tuple, optional): Range for which to calculate the release delay.. Defaults to (.0824, .223).
         doubleclick (bool, optional): Doubleclick. Defaults to False.
         hold (float, optional): How long to hold the button down. Defaults to 0.0.
     """
-    
-    def __init__(self, button : str, releasedelay = [.0824, .223], doubleclick = False, hold : float = 0.0):
+
+    __slots__ = ("button", "releasedelay", "doubleclick", "hold")
+
+
+    def __init__(self, button : str, releasedelay : tuple = (.0824, .223), doubleclick = False, hold : float = 0.0):
         self.button = strtobtn(button)
         self.releasedelay = releasedelay
         self.doubleclick = doubleclick
         self.hold = hold
     
 
-    def execute(self, verbose : bool = False):
-        """Execute the configured event. 
+    def compile(self, plan : Plan):
+        """Append the instructions for this event to a plan.
 
         Args:
-            verbose (bool, optional): Print out event occurances. Defaults to False.
+            plan (Plan): The plan being compiled.
 
         Raises:
             InvalidIntervalError: Raised if an invalid interval is passed.
         """
         
         if(self.doubleclick):
-            MOUSE_CONTROLLER.click(self.button, 2)
-            if verbose:
-                log.info("Mouse doubleclicked")
+            plan.emit(OP_CLICK, self.button, 2)
+            plan.log("Mouse doubleclicked")
         else:
-            if verbose:
-                log.info("Mouse clicked")
-            MOUSE_CONTROLLER.press(self.button)
             if(self.hold == 0.0):
                 if len(self.releasedelay) != 2 or self.releasedelay[0] > self.releasedelay[1]:
-                    log.error("An InvalidIntervalError has been raised in MouseClickEvent.execute()")
+                    log.error("An InvalidIntervalError has been raised in MouseClickEvent.compile()")
                     raise InvalidIntervalError
-                if verbose:
-                    log.info(f"Holding for {self.hold} seconds.")
-                PauseEvent(self.releasedelay).execute()
+            plan.log("Mouse clicked")
+            plan.emit(OP_PRESS, self.button)
+            if(self.hold == 0.0):
+                plan.log(f"Holding for {self.hold} seconds.")
+                plan.pause(self.releasedelay)
             else:
-                PauseEvent(self.hold).execute()
-            if verbose:
-                    log.info("Mouse released.")
-            MOUSE_CONTROLLER.release(self.button)
+                plan.pause(self.hold)
+            plan.log("Mouse released.")
+            plan.emit(OP_RELEASE, self.button)
+
+
+class MouseDownEvent(Event):
+    """Presses a mouse button and leaves it down until a MouseUpEvent releases it, e.g. to drag.
+    A button still held when the TimeLine finishes is released.
+
+    Args:
+        button (str): "l", "r", "m", "left", "right" or "middle".
+    """
+
+    __slots__ = ("button",)
+
+
+    def __init__(self, button : str):
+        self.button = strtobtn(button)
+
+
+    def compile(self, plan : Plan):
+        """Append the instructions for this event to a plan.
+
+        Args:
+            plan (Plan): The plan being compiled.
+        """
+        plan.log(f"Mouse {self.button} pressed")
+        plan.emit(OP_PRESS, self.button)
+
+
+class MouseUpEvent(MouseDownEvent):
+    """Releases a mouse button pressed by a MouseDownEvent.
+
+    Args:
+        button (str): "l", "r", "m", "left", "right" or "middle".
+    """
+
+    __slots__ = ()
+
+
+    def compile(self, plan : Plan):
+        """Append the instructions for this event to a plan.
+
+        Args:
+            plan (Plan): The plan being compiled.
+        """
+        plan.log(f"Mouse {self.button} released")
+        plan.emit(OP_RELEASE, self.button)
 
 
 class MouseMoveEvent(Event):
@@ -166,30 +530,35 @@ class MouseMoveEvent(Event):
         x (int): The x coordinate to move to.
         y (int): The y coordinate to move to.
         relative (bool, optional): Move the mouse relative to the current position. Defaults to False.
+        motion (object, optional): A HumanMotion describing the curve to move along, or True for the shared default one. If unset the mouse is moved instantly. Defaults to None.
     """    
 
+    __slots__ = ("x", "y", "relative", "motion")
 
-    def __init__(self, x : int, y: int, relative : bool = False):
+
+    def __init__(self, x : int, y: int, relative : bool = False, motion : object = None):
         self.x = x
         self.y = y
         self.relative = relative
+        self.motion = defaultmotion() if motion is True else motion or None
 
 
-    def execute(self, verbose : bool = False):
-        """Execute the configured event.
+    def compile(self, plan : Plan):
+        """Append the instructions for this event to a plan.
 
         Args:
-            verbose (bool, optional): Print out event occurances.. Defaults to False.
+            plan (Plan): The plan being compiled.
         """
         
-        if(self.relative):
-            if verbose:
-                log.info(f"Mouse moved to ({self.x}, {self.y})")
-            MOUSE_CONTROLLER.move(self.x, self.y)
+        if self.motion is not None:
+            plan.log(f"Mouse moving along a curve to ({self.x}, {self.y}){' relative to your previous position' if self.relative else ''}.")
+            plan.emit(OP_PATH, (self.x, self.y, self.relative), self.motion)
+        elif(self.relative):
+            plan.log(f"Mouse moved by ({self.x}, {self.y}) relative to your previous position.")
+            plan.emit(OP_MOVEBY, self.x, self.y)
         else:
-            if verbose:
-                log.info(f"Mouse moved by ({self.x}, {self.y}) relative to your previous position.")
-            MOUSE_CONTROLLER.position = (self.x, self.y)
+            plan.log(f"Mouse moved to ({self.x}, {self.y})")
+            plan.emit(OP_MOVE, self.x, self.y)
 
 
 class KeyEvent(Event):
@@ -197,41 +566,159 @@ class KeyEvent(Event):
    
     Args:
             key (str): String representation of the desired key. 
-            releasedelay (list, optional): A list of 2 floats defining the randomization range. Defaults to [.0824, .223].
+            releasedelay (tuple, optional): 2 floats defining the randomization range. Defaults to (.0824, .223).
             hold (float, optional): Float representating how long to hold the key down. Defaults to 0.0.
     """
 
+    __slots__ = ("key", "releasedelay", "hold")
+
 
-    def __init__(self, key : str, releasedelay = [.0824, .223], hold : float = 0.0) -> None:
+    def __init__(self, key : str, releasedelay : tuple = (.0824, .223), hold : float = 0.0) -> None:
         self.key = strtokey(key)
         self.releasedelay = releasedelay
         self.hold = hold
+
+
+    @classmethod
+    def fromkey(cls, key : object, releasedelay : tuple = (.0824, .223), hold : float = 0.0):
+        """Creates a KeyEvent for a key already converted by strtokey(), e.g. one read back from
+        a file. Unlike strings passed to the constructor, characters keep their case.
+
+        Args:
+            key (object): A key name, character or virtual key code.
+            releasedelay (tuple, optional): 2 floats defining the randomization range. Defaults to (.0824, .223).
+            hold (float, optional): Float representating how long to hold the key down. Defaults to 0.0.
+
+        Returns:
+            KeyEvent: The event.
+        """
+        event = cls(key, releasedelay, hold)
+        event.key = key
+        return event
     
 
-    def execute(self, verbose : bool = False):
-        """Execute the configured event. 
+    def compile(self, plan : Plan):
+        """Append the instructions for this event to a plan.
 
         Args:
-            verbose (bool, optional): Print out event occurances. Defaults to False.
+            plan (Plan): The plan being compiled.
 
         Raises:
             InvalidIntervalError: Raised if an invalid interval is provided. 
         """
-        if verbose:
-            log.info(f"Key {self.key} pressed")
-        KEYBOARD_CONTROLLER.press(self.key)
         if(self.hold == 0.0):
             if len(self.releasedelay) != 2 or self.releasedelay[0] > self.releasedelay[1]:
-                log.error("An InvalidIntervalError has been raised in KeyEvent.Execute()")
+                log.error("An InvalidIntervalError has been raised in KeyEvent.compile()")
                 raise InvalidIntervalError
-            if verbose:
-                log.info(f"Holding for {self.hold} seconds.")
-            PauseEvent(self.releasedelay).execute()
-            if verbose:
-                log.info("Key released.")
+        plan.log(f"Key {self.key} pressed")
+        plan.emit(OP_KEYDOWN, self.key)
+        if(self.hold == 0.0):
+            plan.log(f"Holding for {self.hold} seconds.")
+            plan.pause(self.releasedelay)
+            plan.log("Key released.")
         else:
-            PauseEvent(self.hold).execute()
-        KEYBOARD_CONTROLLER.release(self.key)
+            plan.pause(self.hold)
+        plan.emit(OP_KEYUP, self.key)
+
+class KeyDownEvent(Event):
+    """Presses a key and leaves it down until a KeyUpEvent releases it, so other input can
+    happen while it is held. A key still held when the TimeLine finishes is released.
+
+    Args:
+            key (str): String representation of the desired key.
+    """
+
+    __slots__ = ("key",)
+
+
+    def __init__(self, key : str):
+        self.key = strtokey(key)
+
+
+    @classmethod
+    def fromkey(cls, key : object):
+        """Creates the event for a key already converted by strtokey(), keeping the case of characters.
+
+        Args:
+            key (object): A key name, character or virtual key code.
+
+        Returns:
+            KeyDownEvent: The event.
+        """
+        event = cls(key)
+        event.key = key
+        return event
+
+
+    def compile(self, plan : Plan):
+        """Append the instructions for this event to a plan.
+
+        Args:
+            plan (Plan): The plan being compiled.
+        """
+        plan.log(f"Key {self.key} pressed")
+        plan.emit(OP_KEYDOWN, self.key)
+
+class KeyUpEvent(KeyDownEvent):
+    """Releases a key pressed by a KeyDownEvent.
+
+    Args:
+            key (str): String representation of the desired key.
+    """
+
+    __slots__ = ()
+
+
+    def compile(self, plan : Plan):
+        """Append the instructions for this event to a plan.
+
+        Args:
+            plan (Plan): The plan being compiled.
+        """
+        plan.log(f"Key {self.key} released")
+        plan.emit(OP_KEYUP, self.key)
+
+class ChordEvent(Event):
+    """A key chord, or a sequence of chords. The keys of a chord are pressed in order,
+    held, and released in reverse order.
+
+    Args:
+            spec (str): Keys joined with "+", chords separated by ",", e.g. "ctrl+shift+t" or "ctrl+c, ctrl+v".
+            releasedelay (tuple, optional): 2 floats defining the randomization range of each chord's hold. Defaults to (.0824, .223).
+            hold (float, optional): Float representating how long to hold each chord down. Defaults to 0.0.
+
+    Raises:
+            InvalidKeyError: Raised if the spec can not be parsed.
+    """
+
+    __slots__ = ("spec", "chords", "releasedelay", "hold")
+
+
+    def __init__(self, spec : str, releasedelay : tuple = (.0824, .223), hold : float = 0.0):
+        self.spec = spec
+        self.chords = tuple((keys, keys[::-1]) for keys in parsekeys(spec))
+        self.releasedelay = releasedelay
+        self.hold = hold
+
+
+    def compile(self, plan : Plan):
+        """Append the instructions for this event to a plan.
+
+        Args:
+            plan (Plan): The plan being compiled.
+
+        Raises:
+            InvalidIntervalError: Raised if an invalid interval is provided. 
+        """
+        if(self.hold == 0.0):
+            if len(self.releasedelay) != 2 or self.releasedelay[0] > self.releasedelay[1]:
+                log.error("An InvalidIntervalError has been raised in ChordEvent.compile()")
+                raise InvalidIntervalError
+        for down, up in self.chords:
+            plan.log(f"Chord {'+'.join(str(key) for key in down)} pressed")
+            plan.emit(OP_CHORDDOWN, down)
+            plan.pause(self.releasedelay if self.hold == 0.0 else self.hold)
+            plan.emit(OP_CHORDUP, up)
 
 class TypeEvent(Event):
     """A string typing event. 
@@ -240,20 +727,21 @@ class TypeEvent(Event):
         str (str): The string you wish typed. 
     """
 
+    __slots__ = ("str",)
+
 
     def __init__(self, str : str):
         self.str = str
     
-    def execute(self, verbose : bool = False):
-        """Execute the configured event. 
+    def compile(self, plan : Plan):
+        """Append the instructions for this event to a plan.
 
         Args:
-            verbose (bool, optional): Print out event occurances. Defaults to False.
+            plan (Plan): The plan being compiled.
         """
         
-        if verbose:
-            log.info(f"Typing message: {self.str}")
-        KEYBOARD_CONTROLLER.type(self.str)
+        plan.log(f"Typing message: {self.str}")
+        plan.emit(OP_TYPE, self.str)
 
 class MouseScrollEvent(Event):
     """A mouse scrolling event.
@@ -261,36 +749,77 @@ class MouseScrollEvent(Event):
     Args:
         delta (int): How far to scroll the wheel. 
     """
-    
+
+    __slots__ = ("delta",)
+
+
     def __init__(self, delta : int):
 
         self.delta = delta
 
     
-    def execute(self, verbose : bool = False):
-        """Execute the configured event. 
+    def compile(self, plan : Plan):
+        """Append the instructions for this event to a plan.
 
         Args:
-            verbose (bool, optional): Print out event occurances. Defaults to False.
+            plan (Plan): The plan being compiled.
         """
-        if verbose:
-            log.info(f"Mouse scrolled by {self.delta}")
-        MOUSE_CONTROLLER.scroll(0 , self.delta)
+        plan.log(f"Mouse scrolled by {self.delta}")
+        plan.emit(OP_SCROLL, self.delta)
 
 class Loop(Event):
-    "Repeats all the events passed in, in order, for the specified number of times"
+    """Repeats all the events passed in, in order, for the specified number of times.
+    Like a TimeLine, a Loop accepts a single iterable or function returning one instead of
+    events. They are then compiled one at a time while the Loop runs, and a function is called
+    again for every repetition.
+    """
+
+    __slots__ = ("events", "repeats", "verbose")
 
 
     def __init__(self, *events, repeats : int = 1):
-        self.events = events
+        self.events = lazyevents(events)
         self.repeats = repeats
         self.verbose = False
     
-    def execute(self, verbose : bool = False):
-        for i in range(self.repeats):
-            print(f"Loop {i}")
-            for event in self.events:
-                if not isinstance(event, Event):
-                    raise InvalidEventError
-                event.execute(verbose=self.verbose)
-        
+    def compile(self, plan : Plan):
+        """Append the instructions for this event to a plan. Nested events are flattened
+        into the same plan between a pair of loop instructions.
+
+        Args:
+            plan (Plan): The plan being compiled.
+
+        Raises:
+            InvalidEventError: Raised if an invalid object is passed into the Loop.
+        """
+        if not isinstance(self.events, tuple):
+            if self.repeats > 0:
+                plan.emit(OP_STREAM, self, plan.random)
+            return
+        verbose = plan.verbose
+        plan.verbose = self.verbose
+        body = plan if self.repeats > 0 else Plan()
+        begin = body.beginloop(self.repeats)
+        for event in self.events:
+            self.compileevent(body, event)
+        body.endloop(begin)
+        plan.verbose = verbose
+
+
+    def compileevent(self, plan : Plan, event : Event):
+        """Validates one of the events of the loop and appends its instructions to a plan.
+
+        Args:
+            plan (Plan): The plan being compiled.
+            event (Event): The event to compile.
+
+        Raises:
+            InvalidEventError: Raised if the object is not an Event.
+        """
+        if not isinstance(event, Event):
+            raise InvalidEventError
+        plan.mark(type(event).__name__)
+        if _callsexecute(type(event)):
+            plan.emit(OP_CALL, event, plan.verbose)
+        else:
+            event.compile(plan)
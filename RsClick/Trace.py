@@ -0,0 +1,289 @@
+# MIT License
+
+# Copyright 2022 Svetlana Ankundinov
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import struct
+import threading
+import time
+from array import array
+from . import Plan as _plan
+from .Plan import OP_MARK, OP_PAUSE, OP_LOG, OP_LOOP, OP_ENDLOOP
+
+
+# A trace file is a header followed by fixed-size records and, once the trace is stopped,
+# the JSON encoded list of labels and the length of that list in bytes.
+MAGIC = b"RSTR"
+VERSION = 1
+HEADER = struct.Struct("<4sHH")
+RECORD = struct.Struct("<IBIdd")
+TRAILER = struct.Struct("<I")
+
+OPNAMES = {value : name[3:] for name, value in vars(_plan).items() if name.startswith("OP_")}
+
+# Label shared by every string recorded once the label table is full.
+OVERFLOW = "(label table full)"
+
+
+class Tracer:
+    """Records every instruction a TimeLine runs into a preallocated ring buffer.
+
+    Each record holds the id of the event being run, the opcode, a label, a timestamp and a
+    value: the name of the event type for an event's start, the message for a log instruction,
+    the duration of a constant pause, or the loop slot of a loop instruction. Strings are stored
+    once in a list of labels and referred to by their index. Recording a record only writes five
+    array slots, so tracing a TimeLine costs far less than logging. The list keeps at most
+    maxlabels labels, since every distinct log message adds one; once it is full, new strings
+    are recorded as OVERFLOW and counted in overflowed.
+
+    A background thread started with start() drains the buffer to a binary trace file or to a
+    logging handler, e.g. a QueueHandler. If the buffer fills up faster than it is drained, the
+    oldest records are overwritten and counted in dropped. A Tracer must only be used by one
+    TimeLine at a time.
+
+    Args:
+        capacity (int, optional): Number of records the ring buffer holds. Defaults to 65536.
+        maxlabels (int, optional): Maximum number of labels kept, at least 2. Defaults to 4096.
+
+    Raises:
+        ValueError: Raised if maxlabels is less than 2.
+    """
+
+
+    def __init__(self, capacity : int = 1 << 16, maxlabels : int = 4096):
+        if maxlabels < 2:
+            raise ValueError("maxlabels must be at least 2.")
+        self.capacity = capacity
+        self.maxlabels = maxlabels
+        self.overflowed = 0
+        self.events = array("I", bytes(4 * capacity))
+        self.ops = array("B", bytes(capacity))
+        self.labelids = array("I", bytes(4 * capacity))
+        self.times = array("d", bytes(8 * capacity))
+        self.values = array("d", bytes(8 * capacity))
+        self.head = 0
+        self.tail = 0
+        self.dropped = 0
+        self.event = 0
+        self.labels = [""]
+        self.interned = {"" : 0}
+        self.thread = None
+        self.stopped = threading.Event()
+        self.sink = None
+        self.file = None
+
+
+    def label(self, name : str) -> int:
+        """Returns the index of a label, adding it on first use. Once the table is full, the
+        index of OVERFLOW is returned instead.
+
+        Args:
+            name (str): The label.
+
+        Returns:
+            int: Its index.
+        """
+        index = self.interned.get(name)
+        if index is None:
+            # The last free slot is kept for OVERFLOW.
+            if len(self.labels) >= self.maxlabels - 1:
+                self.overflowed += 1
+                name = OVERFLOW
+                index = self.interned.get(name)
+                if index is not None:
+                    return index
+            index = self.interned[name] = len(self.labels)
+            self.labels.append(name)
+        return index
+
+
+    def record(self, op : int, label : int = 0, value : float = 0.0):
+        """Appends a record to the ring buffer.
+
+        Args:
+            op (int): The opcode.
+            label (int, optional): Index of the label. Defaults to 0.
+            value (float, optional): The value. Defaults to 0.0.
+        """
+        index = self.head % self.capacity
+        self.events[index] = self.event
+        self.ops[index] = op
+        self.labelids[index] = label
+        self.times[index] = time.perf_counter()
+        self.values[index] = value
+        self.head += 1
+
+
+    def instruction(self, op : int, a : object):
+        """Records an instruction of a plan as it runs.
+
+        Args:
+            op (int): The opcode.
+            a (object): The first operand.
+        """
+        if op == OP_MARK:
+            self.event += 1
+            self.record(op, self.label(a))
+        elif op == OP_LOG:
+            self.record(op, self.label(a))
+        elif op == OP_PAUSE or op == OP_LOOP or op == OP_ENDLOOP:
+            self.record(op, 0, a)
+        else:
+            self.record(op)
+
+
+    def drain(self) -> list:
+        """Removes the records written since the last drain from the buffer.
+
+        Returns:
+            list: (event, opcode, label, timestamp, value) tuples in the order they were recorded.
+        """
+        head = self.head
+        if head - self.tail > self.capacity:
+            self.dropped += head - self.tail - self.capacity
+            self.tail = head - self.capacity
+        capacity = self.capacity
+        records = []
+        for position in range(self.tail, head):
+            index = position % capacity
+            records.append((self.events[index], self.ops[index], self.labelids[index], self.times[index], self.values[index]))
+        self.tail = head
+        return records
+
+
+    def write(self, records : list):
+        """Passes drained records on to the sink."""
+        if self.file is not None:
+            self.file.write(b"".join(RECORD.pack(*record) for record in records))
+            return
+        import logging
+        labels = self.labels
+        for event, op, label, stamp, value in records:
+            if op == OP_LOG:
+                message = labels[label]
+            else:
+                message = f"{OPNAMES.get(op, op)} {labels[label] if label else (f'{value:g}' if value else '')}".rstrip()
+            self.sink.handle(logging.makeLogRecord({"name" : "RsClick.Trace", "levelno" : logging.INFO, "levelname" : "INFO", "msg" : f"event {event}: {message}", "created" : stamp}))
+
+
+    def run(self, interval : float):
+        """Body of the drain thread."""
+        while not self.stopped.wait(interval):
+            self.write(self.drain())
+        self.write(self.drain())
+
+
+    def start(self, sink : object, interval : float = 0.1):
+        """Starts draining the buffer on a background thread.
+
+        Args:
+            sink (object): Path of a binary trace file to write, or a logging.Handler to emit the records to.
+            interval (float, optional): Seconds between drains. Defaults to 0.1.
+        """
+        if isinstance(sink, str):
+            self.file = open(sink, "wb")
+            self.file.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+        else:
+            self.sink = sink
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, args=(interval,), name="RsClick trace", daemon=True)
+        self.thread.start()
+
+
+    def stop(self):
+        """Drains the remaining records, stops the drain thread and closes the trace file."""
+        import json
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.file is not None:
+            labels = json.dumps(self.labels).encode("utf-8")
+            self.file.write(labels + TRAILER.pack(len(labels)))
+            self.file.close()
+            self.file = None
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def readtrace(path : str) -> tuple:
+    """Reads a binary trace file.
+
+    Args:
+        path (str): The file.
+
+    Raises:
+        ValueError: Raised if the file is not a complete trace file.
+
+    Returns:
+        tuple: The list of (event, opcode, label, timestamp, value) records and the list of labels.
+    """
+    import json
+    with open(path, "rb") as file:
+        data = file.read()
+    if len(data) < HEADER.size + TRAILER.size or HEADER.unpack_from(data, 0) != (MAGIC, VERSION, RECORD.size):
+        raise ValueError(f"{path} is not a complete RsClick trace file.")
+    (length,) = TRAILER.unpack_from(data, len(data) - TRAILER.size)
+    end = len(data) - TRAILER.size - length
+    labels = json.loads(data[end:len(data) - TRAILER.size].decode("utf-8"))
+    return list(RECORD.iter_unpack(data[HEADER.size:end])), labels
+
+
+def render(records : list, labels : list) -> str:
+    """Renders trace records as a readable table.
+
+    Args:
+        records (list): (event, opcode, label, timestamp, value) records.
+        labels (list): The labels the records refer to.
+
+    Returns:
+        str: One line per record, with the time in milliseconds since the first record and the time since the previous one.
+    """
+    lines = [f"{'time ms':>12} {'delta ms':>10} {'event':>7}  {'op':<10} detail"]
+    first = previous = records[0][3] if records else 0.0
+    for event, op, label, stamp, value in records:
+        detail = labels[label] if label else (f"{value:g}" if value else "")
+        lines.append(f"{(stamp - first) * 1000:12.3f} {(stamp - previous) * 1000:10.3f} {event:7d}  {OPNAMES.get(op, str(op)):<10} {detail}".rstrip())
+        previous = stamp
+    return "\n".join(lines)
+
+
+def view(path : str) -> str:
+    """Renders a binary trace file as a readable table.
+
+    Args:
+        path (str): The file.
+
+    Returns:
+        str: The table.
+    """
+    return render(*readtrace(path))
+
+
+if __name__ == "__main__":
+    import sys
+    for path in sys.argv[1:]:
+        print(view(path))
@@ -0,0 +1,508 @@
+# MIT License
+
+# Copyright 2022 Svetlana Ankundinov
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import time
+import threading
+from .utils import strtobtn, strtokey, parsekeys, InvalidKeyError, LazyModule
+from .Scheduler import DeadlineScheduler
+from .Backend import Backend
+
+
+log = LazyModule("logging")
+
+
+RUNNING = "running"
+PAUSED = "paused"
+STOPPED = "stopped"
+
+
+class TriggerStopped(Exception):
+    """Exception raised inside a triggered TimeLine to stop it."""
+
+
+    def __init__(self):
+        self.message = "The TimeLine was stopped."
+        super().__init__(self.message)
+
+
+class ControlledScheduler(DeadlineScheduler):
+    """DeadlineScheduler which can be paused, resumed and stopped from another thread.
+
+    Waits block on a condition instead of sleeping, so pausing or stopping wakes them at once.
+    A stopped scheduler raises TriggerStopped from its next wait or event, which unwinds the
+    plan and releases every button and key it holds. Time spent paused is added to the
+    deadline, so the rest of the script keeps its timing.
+
+    Args:
+        spinthreshold (float, optional): Seconds before a deadline at which the scheduler stops sleeping and busy-waits. Defaults to 0.002.
+        metrics (Metrics, optional): Metrics to record into. Defaults to None.
+        tracer (Tracer, optional): Tracer the plans run with this scheduler record their instructions in. Defaults to None.
+        maxlateness (float, optional): Seconds the schedule may fall behind before it is re-anchored. Defaults to 0.05.
+    """
+
+
+    def __init__(self, spinthreshold : float = 0.002, metrics : object = None, tracer : object = None, maxlateness : float = 0.05):
+        super().__init__(spinthreshold, metrics, tracer, maxlateness)
+        self.condition = threading.Condition()
+        self.state = RUNNING
+
+
+    def setstate(self, state : str, current : tuple = (RUNNING, PAUSED, STOPPED)):
+        with self.condition:
+            if self.state in current:
+                self.state = state
+                self.condition.notify_all()
+
+
+    def pause(self):
+        """Holds the schedule at the next wait or event until resumed."""
+        self.setstate(PAUSED, (RUNNING,))
+
+
+    def resume(self):
+        """Continues a paused schedule."""
+        self.setstate(RUNNING, (PAUSED,))
+
+
+    def stop(self):
+        """Interrupts the schedule, raising TriggerStopped in the thread running it."""
+        self.setstate(STOPPED)
+
+
+    def rearm(self):
+        """Makes a stopped scheduler usable again."""
+        self.setstate(RUNNING)
+
+
+    def check(self) -> float:
+        """Blocks while paused and raises if stopped. The condition must be held.
+
+        Raises:
+            TriggerStopped: Raised if the scheduler is stopped.
+
+        Returns:
+            float: Seconds spent paused, which have been added to the deadline.
+        """
+        paused = 0.0
+        if self.state == PAUSED:
+            start = time.perf_counter()
+            while self.state == PAUSED:
+                self.condition.wait()
+            paused = time.perf_counter() - start
+            if self.deadline is not None:
+                self.deadline += paused
+        if self.state == STOPPED:
+            raise TriggerStopped
+        return paused
+
+
+    def waituntil(self, deadline : float):
+        with self.condition:
+            while True:
+                deadline += self.check()
+                remaining = deadline - time.perf_counter()
+                if remaining <= self.spinthreshold:
+                    break
+                self.condition.wait(remaining - self.spinthreshold)
+        while time.perf_counter() < deadline:
+            pass
+
+
+    def begin(self, label : str) -> float:
+        if self.state != RUNNING:
+            with self.condition:
+                self.check()
+        return super().begin(label)
+
+
+class TriggeredBackend(Backend):
+    """Backend which passes every call on to another backend and reports the first input
+    sent after its trigger fired.
+
+    Args:
+        backend (Backend): Backend the calls are passed on to.
+        trigger (Trigger): The trigger the latency is reported to.
+    """
+
+
+    def __init__(self, backend : Backend, trigger : "Trigger"):
+        self.backend = backend
+        self.trigger = trigger
+
+
+    def send(self, method : object, *args):
+        method(*args)
+        if self.trigger.fired is not None:
+            self.trigger.first()
+
+
+    def position(self) -> tuple:
+        return self.backend.position()
+
+
+    def moveto(self, x : int, y : int):
+        self.send(self.backend.moveto, x, y)
+
+
+    def moveby(self, dx : int, dy : int):
+        self.send(self.backend.moveby, dx, dy)
+
+
+    def press(self, button : object):
+        self.send(self.backend.press, button)
+
+
+    def release(self, button : object):
+        self.send(self.backend.release, button)
+
+
+    def click(self, button : object, count : int = 1):
+        self.send(self.backend.click, button, count)
+
+
+    def scroll(self, dx : int, dy : int):
+        self.send(self.backend.scroll, dx, dy)
+
+
+    def keydown(self, key : object):
+        self.send(self.backend.keydown, key)
+
+
+    def keyup(self, key : object):
+        self.send(self.backend.keyup, key)
+
+
+    def type(self, text : str):
+        self.send(self.backend.type, text)
+
+
+class Trigger:
+    """A TimeLine bound to a hotkey or mouse button. The TimeLine is compiled and its backend
+    resolved once, when the trigger is created, and it runs without its start pause.
+
+    Args:
+        timeline (TimeLine): The TimeLine to run. Its scheduler is replaced by a ControlledScheduler.
+        name (str): Name the trigger is reported under.
+    """
+
+
+    def __init__(self, timeline : object, name : str):
+        self.timeline = timeline
+        self.name = name
+        self.scheduler = timeline.scheduler = ControlledScheduler(timeline.scheduler.spinthreshold, maxlateness=timeline.scheduler.maxlateness)
+        self.plan = timeline.compile() if isinstance(timeline.events, tuple) else None
+        self.backend = TriggeredBackend(timeline.resolvebackend(), self)
+        self.future = None
+        self.fired = None
+        self.stats = [0, 0.0, 0.0]
+
+
+    @property
+    def running(self) -> bool:
+        return self.future is not None and not self.future.done()
+
+
+    def run(self, fired : float):
+        """Runs the TimeLine, as a task of the worker pool. Errors are stored in the TimeLine's ERROR and logged.
+
+        Args:
+            fired (float): time.perf_counter() value at which the trigger fired.
+        """
+        timeline = self.timeline
+        self.fired = fired
+        try:
+            timeline.random.reset()
+            self.scheduler.reset()
+            timeline.play(self.plan, self.backend)
+        except TriggerStopped:
+            pass
+        except Exception as e:
+            timeline.ERROR = e
+            if timeline.metrics is not None:
+                timeline.metrics.error(e)
+            log.error(f"An error has occured.{e}")
+        finally:
+            self.fired = None
+
+
+    def first(self):
+        """Records the latency from the trigger firing to the first input."""
+        latency = time.perf_counter() - self.fired
+        self.fired = None
+        stats = self.stats
+        stats[0] += 1
+        stats[1] += latency
+        if latency > stats[2]:
+            stats[2] = latency
+        if self.timeline.metrics is not None:
+            self.timeline.metrics.observe("trigger", self.name, latency)
+
+
+def canonical(key : object) -> object:
+    """Reduces a key to a form in which the keys of hotkeys and listeners compare equal.
+    Characters are lowercased, and left and right modifiers are treated as the same key.
+
+    Args:
+        key (object): A key as returned by strtokey(), or a pynput Key or KeyCode.
+
+    Returns:
+        object: A key name, character or virtual key code.
+    """
+    key = strtokey(key)
+    if not isinstance(key, str):
+        return key
+    if len(key) == 1:
+        return key.lower()
+    return key[:-2] if key.endswith(("_l", "_r")) else key
+
+
+def parsehotkey(spec : str) -> frozenset:
+    """Parses a hotkey, a single chord such as "ctrl+shift+f1".
+
+    Args:
+        spec (str): The hotkey.
+
+    Raises:
+        InvalidKeyError: Raised if the spec is empty or holds more than one chord.
+
+    Returns:
+        frozenset: The canonical keys of the chord.
+    """
+    chords = parsekeys(spec)
+    if len(chords) != 1:
+        raise InvalidKeyError(spec)
+    return frozenset(canonical(key) for key in chords[0])
+
+
+class Triggers:
+    """Runs TimeLines when hotkeys or mouse buttons are pressed.
+
+    Input is received from pynput listeners, so nothing is polled, and triggered TimeLines run
+    on a pool of worker threads started ahead of time. Pressing the hotkey of a running
+    TimeLine stops it. The stop key, which is always active, stops every running TimeLine and
+    releases the buttons and keys they hold, and the pause key pauses and resumes them all.
+    Input sent by a program, including the TimeLines themselves, never fires a trigger on
+    platforms where pynput can tell it apart, and a held hotkey only fires once.
+
+    Args:
+        stopkey (str, optional): Hotkey stopping every TimeLine. Defaults to "esc".
+        pausekey (str, optional): Hotkey pausing and resuming every TimeLine. Defaults to None.
+        workers (int, optional): Number of worker threads, i.e. of TimeLines which can run at once. Defaults to 4.
+    """
+
+
+    def __init__(self, stopkey : str = "esc", pausekey : str = None, workers : int = 4):
+        self.stopkey = parsehotkey(stopkey) if stopkey is not None else None
+        self.pausekey = parsehotkey(pausekey) if pausekey is not None else None
+        self.workers = workers
+        self.triggers = []
+        self.hotkeys = []
+        self.buttons = {}
+        self.pressed = set()
+        self.paused = False
+        self.executor = None
+        self.keyboard = None
+        self.listeners = ()
+        self.lock = threading.Lock()
+
+
+    def add(self, timeline : object, hotkey : str = None, button : str = None, name : str = None) -> Trigger:
+        """Binds a TimeLine to a hotkey or a mouse button.
+
+        Args:
+            timeline (TimeLine): The TimeLine to run.
+            hotkey (str, optional): A chord such as "ctrl+shift+f1". Defaults to None.
+            button (str, optional): "l", "r", "m", "left", "right" or "middle". Defaults to None.
+            name (str, optional): Name the trigger is reported under. Defaults to the hotkey or button.
+
+        Raises:
+            ValueError: Raised if neither or both of hotkey and button are given.
+
+        Returns:
+            Trigger: The trigger.
+        """
+        if (hotkey is None) == (button is None):
+            raise ValueError("Pass either a hotkey or a button.")
+        trigger = Trigger(timeline, name if name is not None else hotkey or button)
+        if hotkey is not None:
+            self.hotkeys.append((parsehotkey(hotkey), trigger))
+        else:
+            self.buttons[strtobtn(button)] = trigger
+        self.triggers.append(trigger)
+        return trigger
+
+
+    def warm(self):
+        """Starts the worker pool and waits until every worker thread is running."""
+        from concurrent.futures import ThreadPoolExecutor
+        if self.executor is not None:
+            return
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="RsClick trigger")
+        barrier = threading.Barrier(self.workers + 1)
+        for _ in range(self.workers):
+            self.executor.submit(barrier.wait)
+        barrier.wait()
+
+
+    def start(self):
+        """Starts the worker pool and the listeners. Returns immediately."""
+        from pynput import mouse, keyboard
+        self.warm()
+        self.keyboard = keyboard.Listener(on_press=self.onpress, on_release=self.onrelease)
+        self.listeners = (self.keyboard, mouse.Listener(on_click=self.onclick))
+        for listener in self.listeners:
+            listener.start()
+
+
+    def stop(self, timeout : float = 1.0):
+        """Stops the listeners and every TimeLine, and shuts the worker pool down.
+
+        Args:
+            timeout (float, optional): Maximum time in seconds to wait for the TimeLines to stop. Defaults to 1.0.
+        """
+        for listener in self.listeners:
+            listener.stop()
+        self.listeners = ()
+        self.keyboard = None
+        self.stopall(timeout)
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+
+    def __enter__(self):
+        self.start()
+        return self
+
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+    def fire(self, trigger : Trigger, fired : float = None) -> bool:
+        """Starts a trigger's TimeLine on the worker pool, or stops it if it is running.
+
+        Args:
+            trigger (Trigger): The trigger.
+            fired (float, optional): time.perf_counter() value at which the trigger fired. Defaults to now.
+
+        Returns:
+            bool: True if the TimeLine was started, False if it was stopped.
+        """
+        if fired is None:
+            fired = time.perf_counter()
+        with self.lock:
+            if trigger.running:
+                trigger.scheduler.stop()
+                return False
+            self.warm()
+            trigger.scheduler.rearm()
+            trigger.future = self.executor.submit(trigger.run, fired)
+            return True
+
+
+    def pause(self):
+        """Pauses every running TimeLine."""
+        self.paused = True
+        for trigger in self.triggers:
+            trigger.scheduler.pause()
+
+
+    def resume(self):
+        """Resumes every paused TimeLine."""
+        self.paused = False
+        for trigger in self.triggers:
+            trigger.scheduler.resume()
+
+
+    def stopall(self, timeout : float = 1.0) -> bool:
+        """Stops every running TimeLine. Each one stops at its next wait or event, releasing
+        the buttons and keys it holds.
+
+        Args:
+            timeout (float, optional): Maximum time in seconds to wait for them to stop. Defaults to 1.0.
+
+        Returns:
+            bool: True if every TimeLine has stopped.
+        """
+        from concurrent.futures import wait
+        self.paused = False
+        futures = []
+        for trigger in self.triggers:
+            if trigger.running:
+                trigger.scheduler.stop()
+                futures.append(trigger.future)
+        return not wait(futures, timeout).not_done
+
+
+    def report(self) -> dict:
+        """Summarises the latency from each trigger firing to its TimeLine's first input.
+
+        Returns:
+            dict: Maps each trigger to the count, mean and maximum latency in seconds.
+        """
+        report = {}
+        for trigger in self.triggers:
+            count, total, worst = trigger.stats
+            report[trigger.name] = {"count" : count, "mean" : total / count if count else 0.0, "max" : worst}
+        return report
+
+
+    def onpress(self, key : object, injected : bool = False):
+        now = time.perf_counter()
+        if injected:
+            return
+        if self.keyboard is not None:
+            key = self.keyboard.canonical(key)
+        key = canonical(key)
+        if key in self.pressed:
+            return
+        self.pressed.add(key)
+        if self.stopkey is not None and key in self.stopkey and self.stopkey <= self.pressed:
+            self.stopall(timeout=0)
+            return
+        if self.pausekey is not None and key in self.pausekey and self.pausekey <= self.pressed:
+            if self.paused:
+                self.resume()
+            else:
+                self.pause()
+            return
+        for chord, trigger in self.hotkeys:
+            if key in chord and chord <= self.pressed:
+                self.fire(trigger, now)
+
+
+    def onrelease(self, key : object, injected : bool = False):
+        if injected:
+            return
+        if self.keyboard is not None:
+            key = self.keyboard.canonical(key)
+        self.pressed.discard(canonical(key))
+
+
+    def onclick(self, x : int, y : int, button : object, pressed : bool, injected : bool = False):
+        now = time.perf_counter()
+        if pressed and not injected:
+            trigger = self.buttons.get(getattr(button, "name", button))
+            if trigger is not None:
+                self.fire(trigger, now)
@@ -0,0 +1,234 @@
+# MIT License
+
+# Copyright 2022 Svetlana Ankundinov
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import time
+from .utils import LazyModule
+from .TimeLine import *
+
+
+np = LazyModule("numpy")
+
+
+# Hand each ASCII character is typed with on a QWERTY keyboard: 1 for left, 2 for right, 0 for neither.
+_LEFT = "`12345qwertasdfgzxcvb~!@#$%QWERTASDFGZXCVB"
+_RIGHT = "67890-=yuiop[]\\hjkl;'nm,./^&*()_+YUIOP{}|HJKL:\"NM<>?"
+_SHIFTED = "~!@#$%^&*()_+{}|:\"<>?ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+
+class Cadence:
+    """Humanized timing for typing text one character at a time.
+
+    The delay before each character is drawn from a lognormal distribution around the target
+    rate and scaled by its bigram with the previous character: switching hands is quick,
+    repeating a key or staying on the same hand is slower, shifted characters and the start of a
+    word take longer still. Extra factors for specific bigrams may be given. The delays of a
+    whole chunk of text are drawn in one vectorized batch with numpy and rescaled so each
+    chunk keeps the target rate on average.
+
+    Args:
+        cps (float, optional): Target rate in characters per second. Defaults to 8.0.
+        spread (float, optional): Standard deviation of the lognormal noise. Defaults to 0.3.
+        bigrams (dict, optional): Maps two character strings to an extra factor for the delay of their second character, e.g. {"th" : 0.7}. Defaults to None.
+        seed (int, optional): Seed for the random generator. Defaults to None.
+    """
+
+
+    def __init__(self, cps : float = 8.0, spread : float = 0.3, bigrams : dict = None, seed : int = None):
+        if cps <= 0:
+            raise ValueError("cps must be positive.")
+        self.cps = cps
+        self.spread = spread
+        self.bigrams = bigrams or {}
+        self.seed = seed
+        self._rng = None
+        self._hands = None
+        self._shifted = None
+
+
+    @property
+    def rng(self) -> object:
+        if self._rng is None:
+            self._rng = np.random.default_rng(self.seed)
+        return self._rng
+
+
+    def tables(self) -> tuple:
+        """Returns the lookup tables of hands and shifted characters, building them on first use."""
+        if self._hands is None:
+            hands = np.zeros(128, dtype=np.int8)
+            hands[[ord(char) for char in _LEFT]] = 1
+            hands[[ord(char) for char in _RIGHT]] = 2
+            shifted = np.zeros(128, dtype=bool)
+            shifted[[ord(char) for char in _SHIFTED]] = True
+            self._hands, self._shifted = hands, shifted
+        return self._hands, self._shifted
+
+
+    def schedule(self, text : str, previous : str = "") -> list:
+        """Draws the delays before each character of a chunk of text.
+
+        Args:
+            text (str): The chunk.
+            previous (str, optional): The character typed before the chunk. Defaults to "".
+
+        Returns:
+            list: One delay in seconds per character.
+        """
+        if not text:
+            return []
+        hands, shifted = self.tables()
+        codes = np.frombuffer((previous[-1:] or " ").encode("utf-32-le") + text.encode("utf-32-le"), dtype=np.uint32).astype(np.int64)
+        index = np.minimum(codes, 127)
+        before, after = codes[:-1], codes[1:]
+        hand = hands[index]
+        handbefore, handafter = hand[:-1], hand[1:]
+        factor = np.ones(len(text))
+        typed = (handbefore != 0) & (handafter != 0)
+        factor[typed & (handbefore != handafter)] = 0.8
+        factor[typed & (handbefore == handafter)] = 1.1
+        factor[before == after] = 1.2
+        factor[(before == 32) & (after != 32)] = 1.3
+        factor[shifted[index[1:]] & (after < 128)] *= 1.35
+        for bigram, extra in self.bigrams.items():
+            if len(bigram) == 2:
+                factor[(before == ord(bigram[0])) & (after == ord(bigram[1]))] *= extra
+        factor /= factor.mean()
+        noise = self.rng.lognormal(-self.spread * self.spread / 2, self.spread, len(text))
+        return (factor * noise / self.cps).tolist()
+
+
+class TypeStreamEvent(Event):
+    """Types text of any length, streamed in chunks.
+
+    In throughput mode, without a cadence, each chunk is handed to the backend at once, at the
+    highest rate the backend sustains or at most cps characters per second. In humanized mode
+    every character is typed on its own, after a delay from the cadence's schedule. After each
+    run, report() tells the rate achieved.
+
+    Args:
+        source (object): The text, an iterable of strings such as an open file, or a function returning one which is called again on every run.
+        cadence (Cadence, optional): Humanized timing. Defaults to None, for throughput mode.
+        cps (float, optional): Maximum rate in characters per second in throughput mode. Defaults to None, for no limit.
+        chunksize (int, optional): Maximum number of characters per chunk. Defaults to 4096.
+    """
+
+    __slots__ = ("source", "cadence", "cps", "chunksize", "chars", "seconds")
+
+
+    def __init__(self, source : object, cadence : Cadence = None, cps : float = None, chunksize : int = 4096):
+        self.source = source
+        self.cadence = cadence
+        self.cps = cps
+        self.chunksize = chunksize
+        self.chars = 0
+        self.seconds = 0.0
+
+
+    @classmethod
+    def from_file(cls, path : str, encoding : str = "utf-8", **kwargs) -> "TypeStreamEvent":
+        """Creates an event which types the contents of a text file, reading it a chunk at a time.
+
+        Args:
+            path (str): The file.
+            encoding (str, optional): Its encoding. Defaults to "utf-8".
+            **kwargs: Any of the keyword arguments accepted by TypeStreamEvent.
+
+        Returns:
+            TypeStreamEvent: The event.
+        """
+        chunksize = kwargs.get("chunksize", 4096)
+
+        def read():
+            with open(path, encoding=encoding) as file:
+                while True:
+                    chunk = file.read(chunksize)
+                    if not chunk:
+                        return
+                    yield chunk
+
+        return cls(read, **kwargs)
+
+
+    def chunks(self):
+        """Yields the text in chunks of at most chunksize characters."""
+        source = self.source() if callable(self.source) else self.source
+        if isinstance(source, str):
+            source = (source,)
+        size = self.chunksize
+        for text in source:
+            for start in range(0, len(text), size):
+                yield text[start:start + size]
+
+
+    def compile(self, plan : Plan):
+        """Append the instructions for this event to a plan.
+
+        Args:
+            plan (Plan): The plan being compiled.
+        """
+        plan.log("Typing streamed text")
+        plan.emit(OP_TEXT, self)
+
+
+    def play(self, backend : Backend):
+        """Types the text, yielding the waits between chunks or characters to the plan.
+
+        Args:
+            backend (Backend): Backend the input is sent through.
+
+        Yields:
+            tuple: The next wait.
+        """
+        self.chars = 0
+        self.seconds = 0.0
+        start = time.perf_counter()
+        previous = ""
+        try:
+            for chunk in self.chunks():
+                if self.cadence is None:
+                    backend.type(chunk)
+                    self.chars += len(chunk)
+                    if self.cps:
+                        yield len(chunk) / self.cps, "TypeStreamEvent.chunk"
+                    continue
+                for char, delay in zip(chunk, self.cadence.schedule(chunk, previous)):
+                    yield delay, "TypeStreamEvent.key"
+                    backend.type(char)
+                    self.chars += 1
+                previous = chunk[-1]
+        finally:
+            self.seconds = time.perf_counter() - start
+
+
+    def report(self) -> dict:
+        """Summarises the last run.
+
+        Returns:
+            dict: The number of characters typed, the seconds it took, the characters per second achieved, and the target rate or None if unlimited.
+        """
+        target = self.cadence.cps if self.cadence is not None else self.cps
+        return {
+            "chars" : self.chars,
+            "seconds" : self.seconds,
+            "cps" : self.chars / self.seconds if self.seconds > 0 else 0.0,
+            "target" : target,
+        }
@@ -0,0 +1,359 @@
+# MIT License
+
+# Copyright 2022 Svetlana Ankundinov
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from ..Backend import NullBackend, RecordingBackend
+from ..TimeLine import *
+from ..EventTable import EventTable
+from ..utils import strtokey
+
+
+# Measurements are stored as {"value", "unit", "better", "slack"}: better is "higher" or
+# "lower", and slack is an absolute difference below which a change never counts as a
+# regression, for values such as jitter which are close to the resolution of the clock.
+def result(value : float, unit : str, better : str = "higher", slack : float = 0.0) -> dict:
+    """Builds a measurement.
+
+    Args:
+        value (float): The measured value.
+        unit (str): Its unit.
+        better (str, optional): "higher" or "lower". Defaults to "higher".
+        slack (float, optional): Absolute change which is always tolerated. Defaults to 0.0.
+
+    Returns:
+        dict: The measurement.
+    """
+    return {"value" : value, "unit" : unit, "better" : better, "slack" : slack}
+
+
+def timeline(*events) -> TimeLine:
+    return TimeLine(*events, startpause=0, repeat=False, verbose=False, printloops=False, backend=NullBackend())
+
+
+def best(function : object, repeats : int = 3) -> float:
+    """Returns the shortest of several timings of a function, with the garbage collector off.
+
+    Args:
+        function (callable): The function.
+        repeats (int, optional): Number of timings. Defaults to 3.
+
+    Returns:
+        float: The shortest time in seconds.
+    """
+    times = []
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeats):
+            start = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start)
+    finally:
+        if enabled:
+            gc.enable()
+    return min(times)
+
+
+# Every event sends input but never waits, so the rate is the dispatch overhead alone.
+EVENTS = {
+    "PauseEvent" : lambda: PauseEvent(0),
+    "MouseClickEvent" : lambda: MouseClickEvent("left", releasedelay=(0, 0)),
+    "MouseMoveEvent" : lambda: MouseMoveEvent(1, 1),
+    "KeyEvent" : lambda: KeyEvent("a", releasedelay=(0, 0)),
+    "ChordEvent" : lambda: ChordEvent("ctrl+c", releasedelay=(0, 0)),
+    "TypeEvent" : lambda: TypeEvent("a"),
+    "MouseScrollEvent" : lambda: MouseScrollEvent(1),
+}
+
+
+def eventrates(count : int = 100000) -> dict:
+    """Measures how many events of each type a TimeLine dispatches per second, compiling included.
+
+    Args:
+        count (int, optional): Number of events per measurement. Defaults to 100000.
+
+    Returns:
+        dict: One measurement per event type.
+    """
+    results = {}
+    for name, make in EVENTS.items():
+        script = timeline(*(make() for _ in range(count)))
+        results[f"events/s {name}"] = result(count / best(script.start), "events/s")
+    return results
+
+
+def looprates(count : int = 100000, depths : tuple = (1, 2, 4)) -> dict:
+    """Measures the cost of nesting Loops, as events dispatched per second by count events
+    spread over nested Loops of each depth.
+
+    Args:
+        count (int, optional): Number of events per measurement. Defaults to 100000.
+        depths (tuple, optional): Nesting depths to measure. Defaults to (1, 2, 4).
+
+    Returns:
+        dict: One measurement per depth.
+    """
+    results = {}
+    for depth in depths:
+        repeats = max(2, round(count ** (1 / depth)))
+        event = MouseScrollEvent(1)
+        for _ in range(depth):
+            event = Loop(event, repeats=repeats)
+        total = repeats ** depth
+        results[f"events/s Loop depth {depth}"] = result(total / best(timeline(event).start), "events/s")
+    return results
+
+
+def keylookups(count : int = 100000) -> dict:
+    """Measures strtokey() lookups per second over key names and characters.
+
+    Args:
+        count (int, optional): Number of lookups. Defaults to 100000.
+
+    Returns:
+        dict: The measurement.
+    """
+    names = ("a", "enter", "Shift", "page down", "f5", "z")
+    keys = [names[i % len(names)] for i in range(count)]
+
+    def lookup():
+        for key in keys:
+            strtokey(key)
+
+    return {"lookups/s strtokey" : result(count / best(lookup), "lookups/s")}
+
+
+def jitter(pauses : tuple = (.001, .005, .02), samples : int = 200) -> dict:
+    """Measures how far the interval between inputs strays from the pause between them.
+
+    Args:
+        pauses (tuple, optional): Pause lengths in seconds. Defaults to (.001, .005, .02).
+        samples (int, optional): Number of intervals per pause length. Defaults to 200.
+
+    Returns:
+        dict: The median and 99th percentile absolute error for each pause length.
+    """
+    results = {}
+    for pause in pauses:
+        backend = RecordingBackend(capacity=samples + 1)
+        script = timeline(Loop(MouseScrollEvent(1), PauseEvent(pause), repeats=samples + 1))
+        script.backend = backend
+        script.start()
+        stamps = [record[0] for record in backend.records]
+        errors = sorted(abs(b - a - pause) for a, b in zip(stamps, stamps[1:]))
+        label = f"{pause * 1000:g}ms"
+        results[f"jitter p50 {label}"] = result(errors[len(errors) // 2], "s", "lower", slack=.0002)
+        results[f"jitter p99 {label}"] = result(errors[min(len(errors) - 1, int(len(errors) * .99))], "s", "lower", slack=.001)
+    return results
+
+
+def memory(count : int = 100000) -> dict:
+    """Measures the memory taken by count events, their compiled plan and an EventTable of them.
+
+    Args:
+        count (int, optional): Number of events. Defaults to 100000.
+
+    Returns:
+        dict: Bytes per 100k events of each form.
+    """
+    import tracemalloc
+    makers = list(EVENTS.values())
+    scale = 100000 / count
+    results = {}
+    tracemalloc.start()
+    try:
+        start = tracemalloc.get_traced_memory()[0]
+        events = [makers[i % len(makers)]() for i in range(count)]
+        built = tracemalloc.get_traced_memory()[0]
+        plan = timeline(*events).compile()
+        compiled = tracemalloc.get_traced_memory()[0]
+        table = EventTable(events)
+        tabled = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    results["memory per 100k events"] = result((built - start) * scale, "bytes", "lower")
+    results["memory per 100k compiled"] = result((compiled - built) * scale, "bytes", "lower")
+    results["memory per 100k EventTable"] = result((tabled - compiled) * scale, "bytes", "lower")
+    del events, plan, table
+    return results
+
+
+# Modules which importing RsClick.TimeLine should not load, because they are slow to import.
+HEAVY = ("pynput", "logging", "random", "numpy")
+
+
+def measureimport() -> tuple:
+    """Imports RsClick.TimeLine in a fresh interpreter.
+
+    Returns:
+        tuple: The time the import took in seconds and the HEAVY modules it loaded.
+    """
+    script = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        "import RsClick.TimeLine\n"
+        "print(time.perf_counter() - start)\n"
+        f"print(','.join(m for m in {HEAVY!r} if m in sys.modules))\n"
+    )
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    out = subprocess.run([sys.executable, "-c", script], cwd=root, capture_output=True, text=True, check=True).stdout.split("\n")
+    return float(out[0]), tuple(name for name in out[1].split(",") if name)
+
+
+def importtime(repeats : int = 5) -> dict:
+    """Measures the time a fresh interpreter takes to import RsClick.TimeLine.
+
+    Args:
+        repeats (int, optional): Number of interpreters started; the fastest counts. Defaults to 5.
+
+    Returns:
+        dict: The measurement.
+    """
+    return {"import time" : result(min(measureimport()[0] for _ in range(repeats)), "s", "lower", slack=.005)}
+
+
+def run(scale : float = 1.0) -> dict:
+    """Runs every benchmark.
+
+    Args:
+        scale (float, optional): Factor applied to the number of events and samples, e.g. 0.01 for a quick smoke run. Defaults to 1.0.
+
+    Returns:
+        dict: Every measurement by name.
+    """
+    count = max(100, int(100000 * scale))
+    results = {}
+    results.update(eventrates(count))
+    results.update(looprates(count))
+    results.update(keylookups(count))
+    results.update(jitter(samples=max(20, int(200 * scale))))
+    results.update(memory(count))
+    results.update(importtime(repeats=5 if scale >= 1 else 1))
+    return results
+
+
+def save(results : dict, path : str):
+    """Writes measurements to a baseline JSON file, along with the machine they were taken on.
+
+    Args:
+        results (dict): The measurements.
+        path (str): The file to write.
+    """
+    data = {
+        "python" : platform.python_version(),
+        "platform" : platform.platform(),
+        "machine" : platform.machine(),
+        "results" : results,
+    }
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(data, file, indent=2)
+
+
+def load(path : str) -> dict:
+    """Reads the measurements of a baseline JSON file.
+
+    Args:
+        path (str): The file.
+
+    Returns:
+        dict: The measurements.
+    """
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)["results"]
+
+
+def compare(results : dict, baseline : dict, tolerance : float = .25) -> list:
+    """Finds the measurements which got worse than the baseline by more than a relative tolerance.
+
+    Args:
+        results (dict): The new measurements.
+        baseline (dict): The baseline measurements.
+        tolerance (float, optional): Fraction by which a measurement may be worse. Defaults to 0.25.
+
+    Returns:
+        list: (name, baseline value, new value, relative change) tuples of every regression. Measurements missing from either side are skipped.
+    """
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        old, new = base["value"], current["value"]
+        if abs(new - old) <= current.get("slack", 0.0):
+            continue
+        if current["better"] == "higher":
+            worse = new < old * (1 - tolerance)
+        else:
+            worse = new > old * (1 + tolerance)
+        if worse:
+            regressions.append((name, old, new, (new - old) / old if old else float("inf")))
+    return regressions
+
+
+def render(results : dict, baseline : dict = None) -> str:
+    """Formats measurements as a table, next to their baseline if given.
+
+    Args:
+        results (dict): The measurements.
+        baseline (dict, optional): Baseline measurements. Defaults to None.
+
+    Returns:
+        str: The table.
+    """
+    width = max(len(name) for name in results)
+    lines = []
+    for name, current in results.items():
+        line = f"{name:<{width}}  {current['value']:>14.6g} {current['unit']}"
+        base = (baseline or {}).get(name)
+        if base is not None and base["value"]:
+            line += f"  ({(current['value'] - base['value']) / base['value']:+.1%} vs baseline)"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def main(argv : list = None) -> int:
+    import argparse
+    parser = argparse.ArgumentParser(prog="python -m RsClick.benchmarks", description="Headless dispatch overhead benchmarks for RsClick.")
+    parser.add_argument("--scale", type=float, default=1.0, help="factor applied to the number of events and samples")
+    parser.add_argument("--save", metavar="PATH", help="write the results to a baseline JSON file")
+    parser.add_argument("--compare", metavar="PATH", help="fail if a result is worse than this baseline")
+    parser.add_argument("--tolerance", type=float, default=.25, help="fraction by which a result may be worse than the baseline")
+    arguments = parser.parse_args(argv)
+    results = run(arguments.scale)
+    baseline = load(arguments.compare) if arguments.compare else None
+    print(render(results, baseline))
+    if arguments.save:
+        save(results, arguments.save)
+    if baseline is not None:
+        regressions = compare(results, baseline, arguments.tolerance)
+        for name, old, new, change in regressions:
+            print(f"REGRESSION {name}: {old:.6g} -> {new:.6g} ({change:+.1%})")
+        if regressions:
+            return 1
+    return 0
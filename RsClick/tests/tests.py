@@ -22,8 +22,12 @@
 
 import unittest
 import sys
-from pynput.keyboard import Key, Controller as kctrl
-from pynput.mouse import Button, Controller as mctrl
+import time
+import os
+import subprocess
+import tempfile
+import socket
+import json
 import logging as log
 
 # setting path
@@ -32,13 +36,51 @@ sys.path.append('../RsClick')
 # importing
 from RsClick.TimeLine import *
 from RsClick.utils import *
+from RsClick.Scheduler import DeadlineScheduler
+from RsClick.Plan import *
+from RsClick.EventFile import *
+from RsClick.Recorder import Recorder
+from RsClick.Optimizer import *
+from RsClick.Motion import HumanMotion, defaultmotion
+from RsClick.Delays import *
+from RsClick.Arbiter import Arbiter
+from RsClick.Prefetch import Prefetcher
+from RsClick.EventTable import EventTable
+from RsClick.Typing import *
+from RsClick.Metrics import Metrics, Histogram
+from RsClick.Trace import Tracer, readtrace, render, view, OVERFLOW
+from RsClick.Simulator import Simulator, VirtualScheduler
+from RsClick.Triggers import Triggers, ControlledScheduler, TriggerStopped
+from RsClick.Agent import Agent, Client, ProtocolError, frame, isloopback, MSG_SUBMIT
+from RsClick import Serialization
+from RsClick.Serialization import TimelineCache
+from RsClick.benchmarks import suite
 
 
-__POS = MOUSE_CONTROLLER.position
+MOUSE_POS = None
+
+
+def requirepynput():
+    """Skips the calling test unless pynput can reach a display or input device."""
+    try:
+        import pynput.keyboard, pynput.mouse
+    except ImportError as e:
+        raise unittest.SkipTest(f"pynput is unavailable: {e}")
 
 
 def reset_mouse():
-    MOUSE_CONTROLLER.position = __POS
+    getbackend().moveto(*MOUSE_POS)
+
+
+class DeviceTestCase(unittest.TestCase):
+    """Tests which drive the real mouse and keyboard through the default backend."""
+
+    @classmethod
+    def setUpClass(cls):
+        global MOUSE_POS
+        requirepynput()
+        if MOUSE_POS is None:
+            MOUSE_POS = getbackend().position()
     
 class TestHelpers(unittest.TestCase):
 
@@ -52,15 +94,37 @@ class TestHelpers(unittest.TestCase):
 
     def test_to_key(self):
         self.assertEqual(strtokey("a"), "a")
-        self.assertEqual(strtokey("ctrl"), Key.ctrl)
+        self.assertEqual(strtokey("ctrl"), "ctrl")
+        self.assertEqual(strtokey("Return"), "enter")
     
+    def test_key_tables(self):
+        self.assertEqual(strtokey("F24"), "f24")
+        self.assertEqual(strtokey("page up"), "page_up")
+        self.assertEqual(strtokey("pgdn"), "page_down")
+        self.assertEqual(strtokey("volume up"), "media_volume_up")
+        self.assertIs(keytable(), keytable())
+
+    def test_parse_keys(self):
+        self.assertEqual(parsekeys("ctrl+shift+t"), (("ctrl", "shift", "t"),))
+        self.assertEqual(parsekeys("ctrl+c, ctrl+v"), (("ctrl", "c"), ("ctrl", "v")))
+        self.assertEqual(parsekeys("shift+plus"), (("shift", "+"),))
+        self.assertIs(parsekeys("ctrl+c, ctrl+v"), parsekeys("ctrl+c, ctrl+v"))
+        with self.assertRaises(InvalidKeyError):
+            parsekeys("ctrl++t")
+        with self.assertRaises(InvalidKeyError):
+            parsekeys("ctlr+c")
+        with self.assertRaises(InvalidKeyError):
+            ChordEvent("ctrl+shfit+t")
+        self.assertEqual(parsekeys("Control+Page Up"), (("ctrl", "page_up"),))
+        self.assertEqual(parsekeys.cache_info().maxsize, 1024)
+
     def test_to_btn(self):
-        self.assertEqual(strtobtn("l"), Button.left)
-        self.assertEqual(strtobtn("left"), Button.left)
-        self.assertEqual(strtobtn("r"), Button.right)
-        self.assertEqual(strtobtn("right"), Button.right)
+        self.assertEqual(strtobtn("l"), "left")
+        self.assertEqual(strtobtn("left"), "left")
+        self.assertEqual(strtobtn("r"), "right")
+        self.assertEqual(strtobtn("right"), "right")
 
-class TestMouse(unittest.TestCase):
+class TestMouse(DeviceTestCase):
 
     def test_doubleclick(self):
         MouseClickEvent("l", doubleclick=True).execute()
@@ -103,14 +167,14 @@ class TestMouse(unittest.TestCase):
         with self.assertRaises(InvalidIntervalError):
             MouseClickEvent("l", releasedelay=[3]).execute()
         
-class TestPauseEvent(unittest.TestCase):
+class TestPauseEvent(DeviceTestCase):
 
     def test_pause_int(self):
         PauseEvent(.1).execute()
     
     def test_pause_range(self):
         PauseEvent([.1, .2]).execute()
-class TestKeyboard(unittest.TestCase):
+class TestKeyboard(DeviceTestCase):
 
     def test_key_press(self):
         KeyEvent("a").execute()
@@ -125,7 +189,1231 @@ class TestKeyboard(unittest.TestCase):
         with self.assertRaises(InvalidIntervalError):
             MouseClickEvent("l", releasedelay=[3]).execute()
 
-class TestTimeLine(unittest.TestCase):
+class TestScheduler(unittest.TestCase):
+
+    def test_deadlines_do_not_drift(self):
+        # Without re-anchoring, the deadlines only depend on the pauses, however late a wait
+        # ends; the bound on the time it took is only a loose sanity check.
+        scheduler = DeadlineScheduler(spinthreshold=.002, maxlateness=None)
+        scheduler.reset()
+        start = scheduler.deadline
+        for _ in range(20):
+            scheduler.sleep(.005)
+        self.assertAlmostEqual(scheduler.deadline - start, .1, places=9)
+        self.assertGreaterEqual(time.perf_counter() - start, .1)
+        self.assertLess(time.perf_counter() - start, 1.0)
+
+    def test_lateness_report(self):
+        scheduler = DeadlineScheduler()
+        scheduler.reset()
+        scheduler.sleep(.01, label="wait")
+        report = scheduler.report()["wait"]
+        self.assertEqual(report["count"], 1)
+        self.assertGreaterEqual(report["max"], 0)
+
+    def test_slow_backend_does_not_burst(self):
+
+        class SlowBackend(RecordingBackend):
+            def type(self, text):
+                time.sleep(.2)
+                super().type(text)
+
+        backend = SlowBackend()
+        timeline = TimeLine(TypeEvent("slow"), PauseEvent(.1), KeyEvent("a", hold=.02), startpause=0, repeat=False, verbose=False, backend=backend)
+        timeline.start()
+        stamps = [record[0] for record in backend.records]
+        self.assertGreater(stamps[1] - stamps[0], .09)
+        self.assertGreater(stamps[2] - stamps[1], .01)
+        catchup = TimeLine(TypeEvent("slow"), PauseEvent(.1), startpause=0, repeat=False, verbose=False, backend=backend, maxlateness=None)
+        catchup.start()
+        self.assertGreater(catchup.scheduler.report()["PauseEvent"]["max"], .05)
+
+    def test_late_press_is_held_in_full(self):
+
+        class SlowBackend(RecordingBackend):
+            def keydown(self, key):
+                time.sleep(.03)
+                super().keydown(key)
+
+        backend = SlowBackend()
+        TimeLine(KeyEvent("a", hold=.02), startpause=0, repeat=False, verbose=False, backend=backend).start()
+        stamps = [record[0] for record in backend.records]
+        self.assertGreater(stamps[1] - stamps[0], .015)
+
+    def test_invalid_spin_threshold(self):
+        with self.assertRaises(ValueError):
+            DeadlineScheduler(spinthreshold=-1)
+
+class TestPlan(unittest.TestCase):
+
+    def test_compile_flattens_loops(self):
+        plan = TimeLine(
+            Loop(
+                KeyEvent("a", hold=.005),
+                Loop(TypeEvent("b"), repeats=3),
+                repeats=2),
+            repeat=False
+        ).compile()
+        ops = [instruction[0] for instruction in plan.code]
+        self.assertEqual(ops.count(OP_LOOP), 2)
+        self.assertEqual(ops.count(OP_ENDLOOP), 2)
+        self.assertEqual(plan.loops, 2)
+
+    def test_compile_validates_once(self):
+        with self.assertRaises(InvalidEventError):
+            TimeLine(PauseEvent(.1), Loop("Invalid Object")).compile()
+        with self.assertRaises(InvalidIntervalError):
+            TimeLine(Loop(KeyEvent("a", releasedelay=[.5, .1]), repeats=0)).compile()
+
+    def test_baseline_custom_event(self):
+        calls = []
+
+        class Custom(Event):
+            def execute(self, verbose=False):
+                calls.append(verbose)
+
+        timeline = TimeLine(Custom(), Loop(Custom(), repeats=2), startpause=0, repeat=False, verbose=False, backend=RecordingBackend())
+        timeline.start()
+        self.assertIsNone(timeline.ERROR)
+        import asyncio
+        asyncio.run(timeline.run_async())
+        self.assertEqual(calls, [False] * 6)
+
+    def test_subclass_overriding_execute(self):
+        calls = []
+
+        class LoggedClick(MouseClickEvent):
+            def execute(self, verbose=False, scheduler=None, backend=None):
+                calls.append(self.button)
+                super().execute(verbose, scheduler, backend)
+
+        backend = RecordingBackend()
+        timeline = TimeLine(LoggedClick("l", releasedelay=[0, 0]), Loop(LoggedClick("r", releasedelay=[0, 0])), startpause=0, repeat=False, verbose=False, backend=backend)
+        timeline.start()
+        self.assertIsNone(timeline.ERROR)
+        import asyncio
+        asyncio.run(timeline.run_async())
+        self.assertEqual(calls, ["left", "right"] * 2)
+        self.assertEqual([action[0] for action in backend.actions()], ["press", "release"] * 4)
+        plan = TimeLine(MouseClickEvent("l"), verbose=False).compile()
+        self.assertNotIn(OP_CALL, [op for op, a, b in plan.code])
+
+class TestBackend(unittest.TestCase):
+
+    def test_recording_backend(self):
+        backend = RecordingBackend()
+        TimeLine(
+            MouseMoveEvent(10, 20),
+            MouseMoveEvent(5, -5, relative=True),
+            MouseClickEvent("l", hold=.001),
+            KeyEvent("a", hold=.001),
+            TypeEvent("hi"),
+            MouseScrollEvent(-2),
+            startpause=0,
+            repeat=False,
+            verbose=False,
+            backend=backend
+        ).start()
+        self.assertEqual(backend.actions(), [
+            ("moveto", 10, 20),
+            ("moveby", 5, -5),
+            ("press", "left", None),
+            ("release", "left", None),
+            ("keydown", "a", None),
+            ("keyup", "a", None),
+            ("type", "hi", None),
+            ("scroll", 0, -2),
+        ])
+        self.assertEqual(backend.position(), (15, 15))
+        stamps = [record[0] for record in backend.records]
+        self.assertEqual(stamps, sorted(stamps))
+
+    def test_recording_backend_ring_buffer(self):
+        backend = RecordingBackend(capacity=3)
+        for i in range(10):
+            backend.moveto(i, i)
+        self.assertEqual(backend.actions(), [("moveto", i, i) for i in (7, 8, 9)])
+
+    def test_null_backend(self):
+        timeline = TimeLine(KeyEvent("a", hold=.001), startpause=0, repeat=False, verbose=False, backend=NullBackend())
+        timeline.start()
+        self.assertIsNone(timeline.ERROR)
+
+    def test_events_without_pynput(self):
+        script = (
+            "import sys\n"
+            "sys.modules['pynput'] = None\n"
+            "from RsClick.TimeLine import *\n"
+            "from RsClick import Serialization, EventFile\n"
+            "events = [MouseClickEvent('l', hold=.001), KeyEvent('Return', hold=.001), KeyEvent(9, hold=.001), ChordEvent('ctrl+c', hold=.001)]\n"
+            "backend = RecordingBackend()\n"
+            "timeline = TimeLine(*events, startpause=0, repeat=False, verbose=False, backend=backend)\n"
+            "timeline.compile()\n"
+            "timeline.start()\n"
+            "assert timeline.ERROR is None, timeline.ERROR\n"
+            "loaded = Serialization.loads(Serialization.dumps(timeline))\n"
+            "decoded = list(EventFile.iterevents(EventFile.dumps(events)))\n"
+            "print(repr([action[:2] for action in backend.actions()]))\n"
+            "print(repr([loaded.events[i].key for i in (1, 2)] + [decoded[0].button, decoded[2].key]))\n"
+        )
+        root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        env = {name : value for name, value in os.environ.items() if name != "PYNPUT_BACKEND"}
+        result = subprocess.run([sys.executable, "-c", script], cwd=root, env=env, capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        out = result.stdout.split("\n")
+        self.assertEqual(eval(out[0]), [
+            ("press", "left"), ("release", "left"), ("keydown", "enter"), ("keyup", "enter"), ("keydown", 9), ("keyup", 9),
+            ("keydown", "ctrl"), ("keydown", "c"), ("keyup", "c"), ("keyup", "ctrl"),
+        ])
+        self.assertEqual(eval(out[1]), ["enter", 9, "left", 9])
+
+    def test_pynput_backend_converts_names(self):
+        requirepynput()
+        from pynput.keyboard import Key, KeyCode
+        from pynput.mouse import Button
+        backend = PynputBackend()
+        self.assertEqual(backend.button("right"), Button.right)
+        self.assertEqual(backend.key("page_up"), Key.page_up)
+        self.assertEqual(backend.key("a"), "a")
+        self.assertEqual(backend.key(65), KeyCode.from_vk(65))
+        self.assertIs(backend.key("page_up"), backend.key("page_up"))
+        with self.assertRaises(InvalidKeyError):
+            backend.key("ctlr")
+        self.assertEqual(strtokey(KeyCode.from_char("A")), "A")
+        self.assertEqual(strtokey(KeyCode.from_vk(65)), 65)
+        self.assertEqual(strtobtn(Button.middle), "middle")
+
+class TestEventFile(unittest.TestCase):
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix=".rsc")
+        os.close(handle)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_round_trip(self):
+        events = [
+            PauseEvent(.25),
+            PauseEvent([.5, 1.0]),
+            MouseClickEvent("r", releasedelay=[.125, .25]),
+            MouseClickEvent("l", doubleclick=True),
+            MouseMoveEvent(-10, 20, relative=True),
+            KeyEvent("a", hold=.5),
+            KeyEvent("enter"),
+            TypeEvent("Hello, wörld!" * 5),
+            MouseScrollEvent(-3),
+            Loop(KeyEvent("b"), Loop(MouseScrollEvent(1), repeats=2), repeats=3),
+            MouseDownEvent("m"), MouseUpEvent("m"), KeyDownEvent.fromkey("Q"), KeyUpEvent(65),
+        ]
+        self.assertEqual(writeevents(self.path, events), len(events))
+        with open(self.path, "rb") as file:
+            data = file.read()
+        checkheader(data)
+        self.assertEqual((len(data) - HEADER.size) % RECORD.size, 0)
+        decoded = list(iterevents(data))
+        self.assertEqual([type(event) for event in decoded], [type(event) for event in events])
+        self.assertEqual(decoded[1].time, [.5, 1.0])
+        self.assertEqual(decoded[2].button, "right")
+        self.assertEqual(decoded[5].key, "a")
+        self.assertEqual(decoded[5].hold, .5)
+        self.assertEqual(decoded[6].key, "enter")
+        self.assertEqual(decoded[7].str, "Hello, wörld!" * 5)
+        self.assertEqual([decoded[10].button, decoded[12].key, decoded[13].key], ["middle", "Q", 65])
+        self.assertEqual(decoded[9].repeats, 3)
+        self.assertEqual(decoded[9].events[1].repeats, 2)
+
+    def test_from_file(self):
+        writeevents(self.path, [MouseMoveEvent(1, 2), Loop(MouseScrollEvent(1), repeats=2), TypeEvent("x")])
+        backend = RecordingBackend()
+        timeline = TimeLine.from_file(self.path, startpause=0, repeat=False, verbose=False, backend=backend)
+        timeline.start()
+        self.assertIsNone(timeline.ERROR)
+        self.assertEqual(backend.actions(), [("moveto", 1, 2), ("scroll", 0, 1), ("scroll", 0, 1), ("type", "x", None)])
+        self.assertEqual(len(list(timeline.events)), len(list(timeline.events)))
+
+    def test_invalid_file(self):
+        with self.assertRaises(InvalidFileError):
+            checkheader(b"nope")
+        with self.assertRaises(InvalidFileError):
+            checkheader(HEADER.pack(MAGIC, VERSION, RECORDS[1].size))
+
+    def test_full_precision(self):
+        writeevents(self.path, [PauseEvent(.1), KeyEvent("a", releasedelay=[.0824, .223], hold=.1)])
+        pause, key = MappedEvents(self.path)
+        self.assertEqual((pause.time, key.releasedelay, key.hold), (.1, (.0824, .223), .1))
+
+    def test_version1(self):
+        record = RECORDS[1]
+        with open(self.path, "wb") as file:
+            file.write(HEADER.pack(MAGIC, 1, record.size))
+            file.write(record.pack(REC_PAUSE, 0, 0, 0, 0, .5, .5, 0.0))
+            file.write(record.pack(REC_TYPE, 0, 0, 2, 0, 0.0, 0.0, 0.0) + b"hi" + bytes(record.size - 2))
+            file.write(record.pack(REC_KEY, 0, 0, ord("a"), 0, .25, .5, 0.0))
+        pause, text, key = MappedEvents(self.path)
+        self.assertEqual((pause.time, text.str, key.key, key.releasedelay), (.5, "hi", "a", (.25, .5)))
+
+class TestRecorder(unittest.TestCase):
+
+    def test_unstorable_keys_are_skipped(self):
+        handle, path = tempfile.mkstemp(suffix=".rsc")
+        os.close(handle)
+        recorder = Recorder(path, stopkey=None)
+        recorder.writer = EventWriter(path)
+        recorder.last = time.perf_counter()
+        for key in ("media_stop", "media_eject", "numpad1"):
+            recorder.onpress(key)
+            recorder.onrelease(key)
+        time.sleep(.01)
+        recorder.onpress("a")
+        recorder.stop()
+        with open(path, "rb") as file:
+            events = list(iterevents(file.read()))
+        os.remove(path)
+        keys = [(type(event), event.key) for event in events if not isinstance(event, PauseEvent)]
+        self.assertEqual(keys, [(KeyDownEvent, "media_stop"), (KeyUpEvent, "media_stop"), (KeyDownEvent, "media_eject"), (KeyUpEvent, "media_eject"), (KeyDownEvent, "a")])
+        self.assertGreater(sum(event.time for event in events if isinstance(event, PauseEvent)), .009)
+        self.assertEqual(KEYNAMES[-2:], ("media_stop", "media_eject"))
+
+    def test_callbacks_become_events(self):
+        handle, path = tempfile.mkstemp(suffix=".rsc")
+        os.close(handle)
+        recorder = Recorder(path, stopkey=None)
+        recorder.writer = EventWriter(path)
+        recorder.last = time.perf_counter()
+        recorder.onmove(5, 5)
+        recorder.onclick(5, 5, "left", True)
+        recorder.onclick(5, 5, "left", False)
+        recorder.onscroll(5, 5, 0, -1)
+        recorder.onpress("enter")
+        recorder.onrelease("enter")
+        recorder.stop()
+        with open(path, "rb") as file:
+            events = [event for event in iterevents(file.read()) if not isinstance(event, PauseEvent)]
+        os.remove(path)
+        self.assertEqual([type(event) for event in events], [MouseMoveEvent, MouseDownEvent, MouseUpEvent, MouseScrollEvent, KeyDownEvent, KeyUpEvent])
+        self.assertEqual((events[1].button, events[4].key), ("left", "enter"))
+
+    def test_overlapping_inputs_replay_in_order(self):
+        handle, path = tempfile.mkstemp(suffix=".rsc")
+        os.close(handle)
+        recorder = Recorder(path, stopkey=None)
+        recorder.writer = EventWriter(path)
+        recorder.last = time.perf_counter()
+        recorder.onpress("ctrl_l")
+        time.sleep(.02)
+        recorder.onpress("c")
+        recorder.onpress("c")
+        recorder.onrelease("c")
+        recorder.onrelease("ctrl_l")
+        recorder.onclick(5, 5, "left", True)
+        recorder.onmove(50, 60)
+        recorder.onclick(50, 60, "left", False)
+        recorder.onpress("shift")
+        recorder.stop()
+        backend = RecordingBackend()
+        timeline = TimeLine.from_file(path, startpause=0, repeat=False, verbose=False, backend=backend)
+        timeline.start()
+        os.remove(path)
+        self.assertIsNone(timeline.ERROR)
+        self.assertEqual(backend.actions(), [
+            ("keydown", "ctrl_l", None), ("keydown", "c", None), ("keyup", "c", None), ("keyup", "ctrl_l", None),
+            ("press", "left", None), ("moveto", 50, 60), ("release", "left", None),
+            ("keydown", "shift", None), ("keyup", "shift", None),
+        ])
+        stamps = [record[0] for record in backend.records]
+        self.assertGreater(stamps[1] - stamps[0], .015)
+
+class TestOptimizer(unittest.TestCase):
+
+    def pausetotal(self, events) -> float:
+        return sum(event.time for event in events if isinstance(event, PauseEvent))
+
+    def test_simplify_straight_path(self):
+        events = [KeyEvent("a")]
+        for i in range(50):
+            events += [MouseMoveEvent(i, 2 * i), PauseEvent(.01)]
+        events += [MouseMoveEvent(100, 0), TypeEvent("b")]
+        simplified, ratio = simplifypaths(events, tolerance=1.0)
+        moves = [(event.x, event.y) for event in simplified if isinstance(event, MouseMoveEvent)]
+        self.assertEqual(moves, [(0, 0), (49, 98), (100, 0)])
+        self.assertAlmostEqual(self.pausetotal(simplified), self.pausetotal(events))
+        self.assertIsInstance(simplified[-1], TypeEvent)
+        self.assertGreater(ratio, 10)
+
+    def test_simplify_keeps_corners(self):
+        events = [MouseMoveEvent(0, 0), MouseMoveEvent(50, 0), MouseMoveEvent(50, 50), MouseMoveEvent(0, 50)]
+        simplified, ratio = simplifypaths(events)
+        self.assertEqual(len(simplified), 4)
+        self.assertEqual(ratio, 1)
+
+class TestPeephole(unittest.TestCase):
+
+    def test_optimize_preserves_input(self):
+        timeline = TimeLine(
+            PauseEvent(.001),
+            PauseEvent(.002),
+            PauseEvent(0),
+            PauseEvent((0, 0)),
+            MouseMoveEvent(1, 1, relative=True),
+            MouseMoveEvent(2, -1, relative=True),
+            KeyEvent("h", releasedelay=(.02, .02)),
+            KeyEvent("i", releasedelay=(.02, .02)),
+            Loop(MouseScrollEvent(1), repeats=1),
+            Loop(MouseScrollEvent(2), repeats=0),
+            Loop(MouseScrollEvent(3), repeats=2),
+            startpause=0,
+            repeat=False,
+            verbose=False
+        )
+        optimized = optimize(timeline)
+        self.assertEqual([type(event) for event in optimized.events], [PauseEvent, MouseMoveEvent, KeyEvent, KeyEvent, MouseScrollEvent, Loop])
+        self.assertAlmostEqual(optimized.events[0].time, .003)
+        self.assertEqual((optimized.events[1].x, optimized.events[1].y), (3, 0))
+        self.assertIsNot(optimized.scheduler, timeline.scheduler)
+        self.assertIsNot(optimized.random, timeline.random)
+        before, after = RecordingBackend(), RecordingBackend()
+        timeline.backend, optimized.backend = before, after
+        timeline.start()
+        optimized.start()
+        self.assertEqual(after.position(), before.position())
+        self.assertEqual(after.actions()[1:], [action for action in before.actions() if action[0] != "moveby"])
+        for records in (before.records, after.records):
+            keys = [record[0] for record in records if record[1] in ("keydown", "keyup")]
+            self.assertGreater(keys[1] - keys[0], .005)
+            self.assertGreater(keys[3] - keys[2], .005)
+        self.assertAlmostEqual(Simulator(optimized).run()[0], Simulator(timeline).run()[0], places=9)
+        chained = optimize(timeline, typechains=True)
+        self.assertEqual([type(event) for event in chained.events], [PauseEvent, MouseMoveEvent, TypeEvent, MouseScrollEvent, Loop])
+        self.assertEqual(chained.events[2].str, "hi")
+
+    def test_default_pause_is_kept(self):
+        timeline = TimeLine(MouseScrollEvent(1), MouseScrollEvent(1), defaultEventPause=.5)
+        optimized = optimize(timeline, typechains=False)
+        self.assertEqual(optimized.defaulteventpause.getTime(), 0)
+        self.assertEqual([event.time for event in optimized.events if isinstance(event, PauseEvent)], [.5, .5])
+        self.assertEqual(timeline.defaulteventpause.getTime(), .5)
+
+class TestMotion(unittest.TestCase):
+
+    def test_path_reaches_target(self):
+        motion = HumanMotion(rate=500, seed=1)
+        points = motion.generate(300, -120)
+        self.assertEqual(points[0], [0, 0])
+        self.assertEqual(points[-1], [300, -120])
+        self.assertGreater(len(points), 2)
+
+    def test_path_cache(self):
+        motion = HumanMotion(variants=1, cachesize=2, seed=1)
+        first = motion.path(10, 10)
+        self.assertIs(motion.path(10, 10), first)
+        motion.path(20, 20)
+        motion.path(30, 30)
+        self.assertNotIn((10, 10, 0), motion.cache)
+        self.assertEqual((motion.hits, motion.misses), (1, 3))
+
+    def test_path_from_threads(self):
+        import threading
+        motion = HumanMotion(variants=4, cachesize=8, seed=1)
+        errors = []
+
+        def move():
+            try:
+                for i in range(200):
+                    self.assertEqual(motion.path(i % 16 + 1, 5)[-1], [i % 16 + 1, 5])
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=move) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(motion.hits + motion.misses, 800)
+
+    def test_humanized_move(self):
+        backend = RecordingBackend()
+        backend.moveto(100, 100)
+        backend.clear()
+        MouseMoveEvent(160, 40, motion=HumanMotion(rate=1000, mintime=.01, speed=10000, seed=2)).execute(backend=backend)
+        self.assertEqual(backend.position(), (160, 40))
+        self.assertGreater(len(backend.records), 2)
+        MouseMoveEvent(-60, 60, relative=True, motion=True).execute(backend=backend)
+        self.assertEqual(backend.position(), (100, 100))
+
+class TestDelays(unittest.TestCase):
+
+    def draws(self, seed, distribution="uniform") -> list:
+        source = RandomSource(seed, distribution, blocksize=64)
+        first, second = source.stream(.1, .2), source.stream(1, 3)
+        return [first.next() for _ in range(100)] + [second.next() for _ in range(100)]
+
+    def test_seed_replays(self):
+        self.assertEqual(self.draws(7), self.draws(7))
+        self.assertNotEqual(self.draws(7), self.draws(8))
+
+    def test_distributions_stay_in_range(self):
+        for distribution in DISTRIBUTIONS:
+            values = self.draws(3, distribution)
+            self.assertTrue(all(.1 <= value <= .2 for value in values[:100]), distribution)
+            self.assertTrue(all(1 <= value <= 3 for value in values[100:]), distribution)
+
+    def test_timeline_uses_streams(self):
+        timeline = TimeLine(KeyEvent("a"), MouseClickEvent("l"), PauseEvent([.1, .2]), seed=1)
+        plan = timeline.compile()
+        self.assertEqual(sum(1 for instruction in plan.code if instruction[0] == OP_DRAW), 3)
+        self.assertEqual(len(timeline.random.streams), 2)
+
+    def test_invalid_distribution(self):
+        with self.assertRaises(InvalidDistributionError):
+            RandomSource(distribution="cauchy")
+
+class TestAsync(unittest.TestCase):
+
+    def test_timelines_share_a_loop(self):
+        import asyncio
+        first, second = RecordingBackend(), RecordingBackend()
+        timelines = [
+            TimeLine(KeyEvent("a", hold=.02), MouseMoveEvent(1, 2), startpause=0, repeat=False, verbose=False, backend=first),
+            TimeLine(PauseEvent(.01), TypeEvent("b"), startpause=0, repeat=False, verbose=False, backend=second),
+        ]
+
+        async def main():
+            await asyncio.gather(*(timeline.run_async() for timeline in timelines))
+
+        asyncio.run(main())
+        self.assertEqual(first.actions(), [("keydown", "a", None), ("keyup", "a", None), ("moveto", 1, 2)])
+        self.assertEqual(second.actions(), [("type", "b", None)])
+        # The second TimeLine typed while the first one was still holding its key.
+        self.assertLess(second.records[0][0], first.records[1][0])
+        self.assertTrue(all(timeline.ERROR is None for timeline in timelines))
+
+    def test_cancel_releases_held_input(self):
+        import asyncio
+        backend = RecordingBackend()
+        timeline = TimeLine(KeyEvent("a", hold=5.0), startpause=0, repeat=False, verbose=False, backend=backend)
+
+        async def main():
+            task = asyncio.ensure_future(timeline.run_async())
+            await asyncio.sleep(.02)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(main())
+        self.assertEqual(backend.actions(), [("keydown", "a", None), ("keyup", "a", None)])
+
+class TestArbiter(unittest.TestCase):
+
+    def test_holds_are_not_interleaved(self):
+        backend = RecordingBackend()
+        arbiter = Arbiter(backend)
+        arbiter.add(TimeLine(MouseClickEvent("l", hold=.05), startpause=0, repeat=False, verbose=False), priority=1, name="drag")
+        arbiter.add(TimeLine(*[MouseMoveEvent(i, i) for i in range(20)], startpause=.01, repeat=False, verbose=False), name="moves")
+        arbiter.add(TimeLine(KeyEvent("a", hold=.02), startpause=.01, repeat=False, verbose=False), name="keys")
+        arbiter.run()
+        actions = [record[1] for record in backend.records]
+        press, release = actions.index("press"), actions.index("release")
+        self.assertNotIn("moveto", actions[press:release])
+        self.assertEqual(actions.count("moveto"), 20)
+        # The keyboard is independent of the mouse, so the key went down during the hold.
+        self.assertLess(press, actions.index("keydown"))
+        self.assertLess(actions.index("keydown"), release)
+        report = arbiter.report()
+        self.assertGreater(report["queueing"]["moves"]["max"], .02)
+        self.assertLess(report["queueing"]["keys"]["max"], .01)
+        self.assertGreater(report["utilization"]["mouse"], 0.0)
+
+    def test_priority(self):
+        backend = RecordingBackend()
+        arbiter = Arbiter(backend)
+        arbiter.add(TimeLine(MouseClickEvent("l", hold=.05), startpause=0, repeat=False, verbose=False))
+        arbiter.add(TimeLine(MouseMoveEvent(1, 1), startpause=.01, repeat=False, verbose=False), priority=0)
+        arbiter.add(TimeLine(MouseMoveEvent(2, 2), startpause=.02, repeat=False, verbose=False), priority=5)
+        arbiter.run()
+        self.assertEqual(backend.actions()[2:], [("moveto", 2, 2), ("moveto", 1, 1)])
+
+    def test_holds_across_devices_do_not_deadlock(self):
+        backend = RecordingBackend()
+        arbiter = Arbiter(backend)
+        arbiter.add(TimeLine(KeyDownEvent("ctrl_l"), PauseEvent(.1), MouseClickEvent("l", releasedelay=[0, 0]), KeyUpEvent("ctrl_l"), startpause=0, repeat=False, verbose=False), name="ctrl+click")
+        arbiter.add(TimeLine(PauseEvent(.05), MouseDownEvent("l"), PauseEvent(.1), TypeEvent("x"), MouseUpEvent("l"), startpause=0, repeat=False, verbose=False), name="drag and type")
+        arbiter.start()
+        arbiter.join(timeout=5)
+        self.assertEqual(arbiter.threads, [])
+        # The ctrl+click let go of the keyboard while it waited for the mouse, so the drag could type.
+        self.assertEqual([record[1] for record in backend.records], ["keydown", "press", "type", "release", "press", "release", "keyup"])
+
+class TestPrefetch(unittest.TestCase):
+
+    def events(self):
+        return (
+            Loop(KeyEvent("a", releasedelay=[.001, .002]), PauseEvent([.001, .002]), repeats=3),
+            MouseClickEvent("l", releasedelay=[.001, .002]),
+        )
+
+    def test_resolve(self):
+        timeline = TimeLine(*self.events(), verbose=False, seed=3)
+        chunks = list(timeline.compile().resolve(chunksize=1))
+        ops = [op for chunk in chunks for op, a, b in chunk.code]
+        self.assertNotIn(OP_DRAW, ops)
+        self.assertNotIn(OP_LOOP, ops)
+        self.assertEqual(ops.count(OP_KEYDOWN), 3)
+        for chunk in chunks:
+            chunkops = [op for op, a, b in chunk.code]
+            self.assertEqual(chunkops.count(OP_PRESS), chunkops.count(OP_RELEASE))
+            self.assertEqual(chunkops.count(OP_KEYDOWN), chunkops.count(OP_KEYUP))
+
+    def test_prefetch_matches_inline(self):
+        runs = []
+        for prefetch in (0, 2):
+            backend = RecordingBackend()
+            pauses = []
+            timeline = TimeLine(*self.events(), startpause=0, repeat=False, verbose=False, backend=backend, seed=11, prefetch=prefetch)
+            timeline.scheduler.advance = pauses.append
+            timeline.scheduler.waituntil = lambda deadline: None
+            timeline.start()
+            self.assertIsNone(timeline.ERROR)
+            runs.append((backend.actions(), [round(seconds, 9) for seconds in pauses]))
+        self.assertEqual(runs[0], runs[1])
+
+    def test_repeat(self):
+        plan = TimeLine(KeyEvent("a", hold=.001), verbose=False).compile()
+        prefetcher = Prefetcher(plan, repeat=True, depth=2, chunksize=1)
+        chunks = []
+        for chunk in prefetcher:
+            chunks.append(chunk)
+            if len(chunks) == 5:
+                break
+        prefetcher.close()
+        self.assertFalse(prefetcher.thread.is_alive())
+        self.assertEqual([op for op, a, b in chunks[0].code + chunks[1].code], [OP_MARK, OP_KEYDOWN, OP_PAUSE, OP_KEYUP])
+        self.assertEqual(chunks[0].code + chunks[1].code, chunks[2].code + chunks[3].code)
+
+class TestLazyEvents(unittest.TestCase):
+
+    def test_generator_function(self):
+        calls = []
+
+        def rows():
+            calls.append(1)
+            for i in range(3):
+                yield MouseMoveEvent(i, i)
+
+        backend = RecordingBackend()
+        timeline = TimeLine(rows, startpause=0, repeat=False, verbose=False, backend=backend)
+        self.assertIsInstance(timeline.events, EventSource)
+        timeline.start()
+        self.assertIsNone(timeline.ERROR)
+        self.assertEqual(backend.actions(), [("moveto", i, i) for i in range(3)])
+        self.assertEqual(len(calls), 1)
+
+    def test_exhausted_iterator_ends_repeat(self):
+        backend = RecordingBackend()
+        timeline = TimeLine(iter([TypeEvent("a"), TypeEvent("b")]), startpause=0, verbose=False, backend=backend)
+        timeline.start()
+        self.assertEqual(backend.actions(), [("type", "a", None), ("type", "b", None)])
+
+    def test_lazy_loop(self):
+        calls = []
+
+        def keys():
+            calls.append(1)
+            yield TypeEvent("x")
+            yield KeyEvent("a", hold=.001)
+
+        for prefetch in (0, 2):
+            calls.clear()
+            backend = RecordingBackend()
+            loop = Loop(keys, repeats=3)
+            loop.verbose = False
+            TimeLine(loop, TypeEvent("end"), startpause=0, repeat=False, verbose=False, backend=backend, prefetch=prefetch).start()
+            self.assertEqual(backend.actions(), [("type", "x", None), ("keydown", "a", None), ("keyup", "a", None)] * 3 + [("type", "end", None)])
+            self.assertEqual(len(calls), 3)
+
+    def test_lazy_loop_invalid_object(self):
+        timeline = TimeLine(Loop(lambda: iter(["Invalid Object"])), startpause=0, repeat=False, verbose=False, backend=NullBackend())
+        timeline.start()
+        self.assertIsInstance(timeline.ERROR, InvalidEventError)
+
+    def test_constant_memory(self):
+        import tracemalloc
+        backend = RecordingBackend(capacity=1)
+        events = (MouseMoveEvent(i % 100, i % 100) for i in range(50000))
+        tracemalloc.start()
+        TimeLine(events, startpause=0, repeat=False, verbose=False, backend=backend).start()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        self.assertLess(peak, 1 << 20)
+
+class TestEventTable(unittest.TestCase):
+
+    def events(self):
+        return [
+            PauseEvent(.001),
+            PauseEvent([.001, .002]),
+            MouseMoveEvent(10, 20),
+            MouseMoveEvent(-3, 4, relative=True),
+            MouseClickEvent("r", releasedelay=[.001, .002]),
+            MouseClickEvent("l", doubleclick=True),
+            KeyEvent("a", hold=.001),
+            KeyEvent("enter", releasedelay=[.001, .002]),
+            TypeEvent("hello"),
+            MouseScrollEvent(-3),
+            Loop(TypeEvent("x"), Loop(MouseScrollEvent(1), repeats=2), repeats=2),
+            KeyDownEvent("ctrl"), MouseDownEvent("l"), MouseUpEvent("l"), KeyUpEvent("ctrl"),
+        ]
+
+    def test_slots(self):
+        for event in self.events():
+            self.assertFalse(hasattr(event, "__dict__"))
+        self.assertIsInstance(KeyEvent("a").releasedelay, tuple)
+
+    def test_execute(self):
+        runs = []
+        for events in (tuple(self.events()), EventTable(self.events())):
+            backend = RecordingBackend()
+            timeline = TimeLine(events, startpause=0, repeat=False, verbose=False, backend=backend, seed=1)
+            timeline.start()
+            self.assertIsNone(timeline.ERROR)
+            runs.append(backend.actions())
+        self.assertEqual(runs[0], runs[1])
+
+    def test_interning(self):
+        table = EventTable(KeyEvent("a") for _ in range(100))
+        self.assertEqual(len(table), 100)
+        self.assertEqual(table.objects, ["a"])
+
+    def test_memory(self):
+        import tracemalloc
+        count = 20000
+
+        def measure(build):
+            tracemalloc.start()
+            result = build()
+            size = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            return result, size
+
+        events, objects = measure(lambda: [MouseClickEvent("l") if i % 2 else MouseMoveEvent(i, i) for i in range(count)])
+        table, columns = measure(lambda: EventTable(events))
+        self.assertEqual(len(table), count)
+        self.assertLess(columns, objects / 2)
+        self.assertLess(table.nbytes(), count * 40)
+
+class TestChordEvent(unittest.TestCase):
+
+    def test_chord(self):
+        backend = RecordingBackend()
+        TimeLine(ChordEvent("ctrl+shift+t, ctrl+v", hold=.001), startpause=0, repeat=False, verbose=False, backend=backend).start()
+        self.assertEqual(backend.actions(), [
+            ("keydown", "ctrl", None), ("keydown", "shift", None), ("keydown", "t", None),
+            ("keyup", "t", None), ("keyup", "shift", None), ("keyup", "ctrl", None),
+            ("keydown", "ctrl", None), ("keydown", "v", None),
+            ("keyup", "v", None), ("keyup", "ctrl", None),
+        ])
+
+    def test_chord_plan(self):
+        plan = TimeLine(ChordEvent("ctrl+a"), verbose=False).compile()
+        ops = [op for op, a, b in plan.code]
+        self.assertEqual(ops, [OP_MARK, OP_CHORDDOWN, OP_DRAW, OP_CHORDUP])
+
+    def test_storage(self):
+        events = [ChordEvent("ctrl+shift+t", releasedelay=(.001, .002)), ChordEvent("alt+f4", hold=.5)]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "chords.rsc")
+            writeevents(path, events)
+            decoded = list(MappedEvents(path))
+        for copy in (decoded, list(EventTable(events))):
+            self.assertEqual([event.spec for event in copy], ["ctrl+shift+t", "alt+f4"])
+            self.assertEqual(copy[1].hold, .5)
+            self.assertEqual(copy[0].chords, events[0].chords)
+
+class TestTyping(unittest.TestCase):
+
+    def typed(self, backend):
+        return "".join(a for action, a, b in backend.actions() if action == "type")
+
+    def test_throughput(self):
+        backend = RecordingBackend()
+        lines = ["line %d\n" % i for i in range(10000)]
+        event = TypeStreamEvent(lambda: iter(lines), chunksize=1000)
+        TimeLine(event, startpause=0, repeat=False, verbose=False, backend=backend).start()
+        self.assertEqual(self.typed(backend), "".join(lines))
+        self.assertTrue(all(len(a) <= 1000 for action, a, b in backend.actions()))
+        report = event.report()
+        self.assertEqual(report["chars"], len("".join(lines)))
+        self.assertIsNone(report["target"])
+
+    def test_rate_limit(self):
+        event = TypeStreamEvent("x" * 200, cps=2000, chunksize=20)
+        TimeLine(event, startpause=0, repeat=False, verbose=False, backend=NullBackend()).start()
+        self.assertAlmostEqual(event.report()["cps"], 2000, delta=400)
+
+    def test_from_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "text.txt")
+            with open(path, "w", encoding="utf-8") as file:
+                file.write("wörld " * 1000)
+            backend = RecordingBackend()
+            TimeLine(TypeStreamEvent.from_file(path, chunksize=100), startpause=0, repeat=False, verbose=False, backend=backend).start()
+        self.assertEqual(self.typed(backend), "wörld " * 1000)
+
+    def test_humanized(self):
+        backend = RecordingBackend()
+        event = TypeStreamEvent("the quick brown fox " * 10, cadence=Cadence(cps=400, seed=1), chunksize=64)
+        TimeLine(event, startpause=0, repeat=False, verbose=False, backend=backend).start()
+        self.assertEqual([a for action, a, b in backend.actions()], list("the quick brown fox " * 10))
+        report = event.report()
+        self.assertEqual(report["target"], 400)
+        self.assertLess(report["cps"], 440)
+
+    def test_bigram_schedule(self):
+        cadence = Cadence(cps=10, spread=0.0)
+        delays = cadence.schedule("fjfjffjj")
+        self.assertAlmostEqual(sum(delays) / len(delays), .1)
+        self.assertLess(delays[1], delays[5])
+        slower = Cadence(cps=10, spread=0.0, bigrams={"fj" : 2.0}).schedule("fjfjffjj")
+        self.assertGreater(slower[1] / slower[2], delays[1] / delays[2])
+
+class TestMetrics(unittest.TestCase):
+
+    def test_histogram(self):
+        histogram = Histogram((.001, .01, .1))
+        for value in (.0005, .001, .005, .05, 1.0):
+            histogram.observe(value)
+        self.assertEqual(histogram.counts, [2, 1, 1, 1])
+        self.assertEqual(histogram.cumulative(), [2, 3, 4, 5])
+        self.assertEqual(histogram.quantile(.5), .01)
+        self.assertEqual(histogram.quantile(1.0), float("inf"))
+
+    def test_timeline_metrics(self):
+        import json
+        metrics = Metrics()
+        timeline = TimeLine(
+            KeyEvent("a", hold=.001), KeyEvent("b", hold=.001), MouseMoveEvent(1, 1), PauseEvent(.001),
+            startpause=0, repeat=False, verbose=False, backend=RecordingBackend(), metrics=metrics
+        )
+        timeline.start()
+        self.assertIsNone(timeline.ERROR)
+        data = json.loads(metrics.json())
+        self.assertEqual(data["dispatch"]["KeyEvent"]["count"], 2)
+        self.assertEqual(data["dispatch"]["MouseMoveEvent"]["count"], 1)
+        self.assertEqual(data["backend"]["KeyEvent"]["count"], 4)
+        self.assertEqual(data["backend"]["MouseMoveEvent"]["count"], 1)
+        self.assertEqual(data["lateness"]["KeyEvent"]["count"], 2)
+        # The start pause, both holds, and the PauseEvent's start and its wait.
+        self.assertEqual(data["lateness"]["PauseEvent"]["count"], 5)
+        text = metrics.prometheus()
+        self.assertIn("# TYPE rsclick_dispatch_seconds histogram", text)
+        self.assertIn('rsclick_backend_seconds_count{event="KeyEvent"} 4', text)
+        self.assertIn('rsclick_lateness_seconds_bucket{event="KeyEvent",le="+Inf"} 2', text)
+
+    def test_errors(self):
+        metrics = Metrics()
+        TimeLine("Invalid Object", startpause=0, repeat=False, verbose=False, backend=NullBackend(), metrics=metrics).start()
+        self.assertEqual(metrics.errors, {"InvalidEventError" : 1})
+        self.assertIn('rsclick_errors_total{type="InvalidEventError"} 1', metrics.prometheus())
+
+class TestTrace(unittest.TestCase):
+
+    def timeline(self, tracer, backend=None):
+        return TimeLine(
+            Loop(KeyEvent("a", hold=.001), repeats=3), MouseMoveEvent(1, 1),
+            startpause=0, repeat=False, verbose=True, printloops=False, trace=tracer, backend=backend or NullBackend()
+        )
+
+    def test_records(self):
+        import io
+        import contextlib
+        tracer = Tracer()
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output), self.assertNoLogs(level="INFO"):
+            self.timeline(tracer).start()
+        self.assertEqual(output.getvalue(), "")
+        records = tracer.drain()
+        marks = [tracer.labels[label] for event, op, label, stamp, value in records if op == OP_MARK]
+        self.assertEqual(marks, ["Loop", "KeyEvent", "KeyEvent", "KeyEvent", "MouseMoveEvent"])
+        self.assertEqual([op for event, op, label, stamp, value in records].count(OP_KEYDOWN), 3)
+        self.assertIn("Mouse moved to (1, 1)", [tracer.labels[label] for event, op, label, stamp, value in records if op == OP_LOG])
+        stamps = [record[3] for record in records]
+        self.assertEqual(stamps, sorted(stamps))
+        self.assertEqual(tracer.drain(), [])
+
+    def test_ring_buffer(self):
+        tracer = Tracer(capacity=4)
+        for i in range(10):
+            tracer.record(OP_PAUSE, 0, i)
+        self.assertEqual([record[4] for record in tracer.drain()], [6, 7, 8, 9])
+        self.assertEqual(tracer.dropped, 6)
+
+    def test_label_table_is_bounded(self):
+        tracer = Tracer(maxlabels=8)
+        TimeLine(
+            *(MouseMoveEvent(i, i) for i in range(50)),
+            startpause=0, repeat=False, verbose=True, trace=tracer, backend=NullBackend()
+        ).start()
+        records = tracer.drain()
+        self.assertEqual(len(tracer.labels), 8)
+        self.assertEqual(tracer.labels[-1], OVERFLOW)
+        self.assertGreater(tracer.overflowed, 40)
+        self.assertIn("Mouse moved to (0, 0)", tracer.labels)
+        self.assertEqual([tracer.labels[label] for event, op, label, stamp, value in records if op == OP_LOG][-1], OVERFLOW)
+        with self.assertRaises(ValueError):
+            Tracer(maxlabels=1)
+
+    def test_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "run.trace")
+            tracer = Tracer()
+            tracer.start(path, interval=.001)
+            self.timeline(tracer).start()
+            tracer.stop()
+            records, labels = readtrace(path)
+            text = view(path)
+        self.assertEqual(len([record for record in records if record[1] == OP_KEYDOWN]), 3)
+        self.assertIn("KEYDOWN", text)
+        self.assertIn("MouseMoveEvent", text)
+        self.assertEqual(text, render(records, labels))
+
+    def test_queue_handler(self):
+        import queue
+        import logging.handlers
+        messages = queue.Queue()
+        with Tracer() as tracer:
+            tracer.start(logging.handlers.QueueHandler(messages))
+            self.timeline(tracer).start()
+        texts = []
+        while not messages.empty():
+            texts.append(messages.get().getMessage())
+        self.assertIn("event 5: MARK MouseMoveEvent", texts)
+        self.assertIn("event 2: PAUSE 0.001", texts)
+        self.assertIn("event 5: Mouse moved to (1, 1)", texts)
+
+class TestSimulator(unittest.TestCase):
+
+    def timeline(self, *events, **kwargs):
+        return TimeLine(*events, startpause=1, repeat=False, verbose=False, printloops=False, **kwargs)
+
+    def test_dry_run(self):
+        motion = HumanMotion(seed=1)
+        timeline = self.timeline(PauseEvent(1.5), KeyEvent("a", hold=.25), Loop(MouseMoveEvent(5, 5), PauseEvent(2), repeats=3), MouseMoveEvent(305, 405, motion=motion))
+        start = time.perf_counter()
+        duration, backend = Simulator(timeline).run()
+        self.assertLess(time.perf_counter() - start, .5)
+        self.assertAlmostEqual(duration, 8.75 + motion.duration(300, 400))
+        records = list(backend.records)
+        self.assertEqual([(stamp, action) for stamp, action, a, b in records[:5]], [
+            (2.5, "keydown"), (2.75, "keyup"), (2.75, "moveto"), (4.75, "moveto"), (6.75, "moveto")
+        ])
+        self.assertEqual(records[-1][2:], (305, 405))
+        self.assertAlmostEqual(Simulator(timeline).estimate(runs=100)["p99"], duration)
+
+    def test_seeded_run(self):
+        timeline = self.timeline(Loop(KeyEvent("a"), PauseEvent([1, 2]), repeats=10))
+        first, _ = Simulator(timeline).run(seed=3)
+        second, _ = Simulator(timeline).run(seed=3)
+        self.assertEqual(first, second)
+        self.assertTrue(1 + 10 * 1.0824 <= first <= 1 + 10 * 2.223)
+
+    def test_virtual_scheduler(self):
+        scheduler = VirtualScheduler()
+        scheduler.reset()
+        scheduler.sleep(3600)
+        self.assertEqual(scheduler.time(), 3600)
+        self.assertEqual(scheduler.report()["PauseEvent"]["max"], 0)
+
+    def test_estimate_matches_runs(self):
+        timeline = self.timeline(KeyEvent("a"), Loop(PauseEvent([.1, .5]), MouseClickEvent("left"), repeats=40), distribution="truncnormal")
+        estimate = Simulator(timeline).estimate(runs=4000, seed=1)
+        durations = [Simulator(timeline).run(seed=seed)[0] for seed in range(100)]
+        self.assertAlmostEqual(estimate["mean"], sum(durations) / len(durations), delta=.05 * estimate["mean"])
+        self.assertTrue(estimate["min"] <= estimate["p50"] <= estimate["p95"] <= estimate["p99"] <= estimate["max"])
+
+    def test_long_script(self):
+        timeline = self.timeline(Loop(Loop(KeyEvent("a"), PauseEvent([1, 2]), repeats=1000), repeats=100), defaultEventPause=.5)
+        start = time.perf_counter()
+        estimate = Simulator(timeline).estimate(runs=10000, seed=2)
+        self.assertLess(time.perf_counter() - start, 1)
+        expected = 1 + .5 + 100000 * ((.0824 + .223) / 2 + 1.5)
+        self.assertAlmostEqual(estimate["mean"], expected, delta=.001 * expected)
+        self.assertLess(estimate["p50"], estimate["p99"])
+
+class TestTriggers(unittest.TestCase):
+
+    def setUp(self):
+        self.triggers = Triggers(stopkey="q", pausekey="p", workers=2)
+        self.triggers.warm()
+        self.backend = RecordingBackend()
+
+    def tearDown(self):
+        self.triggers.stop()
+
+    def timeline(self, *events, repeat=False):
+        return TimeLine(*events, startpause=5, repeat=repeat, verbose=False, printloops=False, backend=self.backend)
+
+    def actions(self):
+        return [action for action, a, b in self.backend.actions()]
+
+    def test_hotkey_fires_once(self):
+        trigger = self.triggers.add(self.timeline(KeyEvent("a", hold=.01)), hotkey="ctrl+k")
+        self.triggers.onpress("k")
+        self.assertFalse(trigger.running)
+        self.triggers.onpress("ctrl_l")
+        self.triggers.onpress("K")
+        self.triggers.onpress("k")
+        trigger.future.result(1)
+        self.assertEqual(self.actions(), ["keydown", "keyup"])
+        report = self.triggers.report()["ctrl+k"]
+        self.assertEqual(report["count"], 1)
+        self.assertLess(report["max"], .1)
+
+    def test_injected_and_buttons(self):
+        trigger = self.triggers.add(self.timeline(MouseScrollEvent(1)), button="left")
+        self.triggers.onclick(0, 0, "left", True, injected=True)
+        self.triggers.onclick(0, 0, "left", False)
+        self.assertIsNone(trigger.future)
+        self.triggers.onclick(0, 0, "left", True)
+        trigger.future.result(1)
+        self.assertEqual(self.actions(), ["scroll"])
+
+    def test_stop_releases_inputs(self):
+        trigger = self.triggers.add(self.timeline(KeyEvent("a", hold=10), repeat=True), hotkey="k")
+        self.triggers.fire(trigger)
+        while not self.backend.records:
+            time.sleep(.001)
+        start = time.perf_counter()
+        self.triggers.onpress("q")
+        self.assertTrue(self.triggers.stopall(timeout=1))
+        self.assertLess(time.perf_counter() - start, .1)
+        self.assertEqual(self.actions(), ["keydown", "keyup"])
+        self.assertTrue(self.triggers.fire(trigger))
+        self.assertFalse(self.triggers.fire(trigger))
+        trigger.future.result(1)
+        self.assertEqual(self.actions()[-1], "keyup")
+
+    def test_pause_and_resume(self):
+        trigger = self.triggers.add(self.timeline(PauseEvent(.05), MouseScrollEvent(1)), hotkey="k")
+        self.triggers.fire(trigger)
+        self.triggers.onpress("p")
+        time.sleep(.15)
+        self.assertEqual(self.actions(), [])
+        self.triggers.onrelease("p")
+        self.triggers.onpress("p")
+        trigger.future.result(1)
+        self.assertEqual(self.actions(), ["scroll"])
+
+    def test_scheduler_interrupts_wait(self):
+        import threading
+        scheduler = ControlledScheduler()
+        threading.Timer(.02, scheduler.stop).start()
+        start = time.perf_counter()
+        with self.assertRaises(TriggerStopped):
+            scheduler.sleep(10)
+        self.assertLess(time.perf_counter() - start, .5)
+
+class TestAgent(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = RecordingBackend()
+        self.agent = Agent(("127.0.0.1", 0), backend=self.backend, cachesize=2)
+        self.agent.start()
+
+    def tearDown(self):
+        self.agent.stop()
+
+    def test_end_to_end(self):
+        events = [KeyEvent("a", hold=.001), MouseMoveEvent(3, 4)]
+        with Client(self.agent.address, timeout=5) as client:
+            jobs = client.submit(events)
+            states = [status["state"] for status in client.wait(jobs)]
+            self.assertEqual(states, ["queued", "started", "done"])
+            final = client.run(events)[0]
+        self.assertTrue(final["cached"])
+        self.assertEqual(final["events"], 2)
+        self.assertEqual([action for action, a, b in self.backend.actions()], ["keydown", "keyup", "moveto"] * 2)
+        self.assertEqual(self.agent.report(), {"cached" : 1, "hits" : 1, "misses" : 1, "errors" : 0})
+
+    def test_batch(self):
+        first, second = [MouseScrollEvent(1)], [Loop(MouseScrollEvent(2), repeats=3)]
+        with Client(self.agent.address, timeout=5) as client:
+            statuses = client.run(first, second, first, b"not a timeline")
+        self.assertEqual([status["state"] for status in statuses], ["done", "done", "done", "error"])
+        self.assertEqual([status["cached"] for status in statuses[:3]], [False, False, True])
+        self.assertEqual([a for action, a, b in self.backend.actions()], [0, 0, 0, 0, 0])
+        self.assertEqual([b for action, a, b in self.backend.actions()], [1, 2, 2, 2, 1])
+
+    def test_evicted_timeline_is_resent(self):
+        with Client(self.agent.address, timeout=5) as client:
+            client.run([MouseScrollEvent(1)])
+            client.run([MouseScrollEvent(2)], [MouseScrollEvent(3)])
+            status = client.run([MouseScrollEvent(1)])[0]
+        self.assertEqual(status["state"], "done")
+        self.assertFalse(status["cached"])
+
+    @unittest.skipUnless(hasattr(socket, "AF_UNIX"), "Unix sockets are not available")
+    def test_unix_socket(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "agent.sock")
+            with Agent(path, backend=self.backend):
+                self.assertEqual(os.stat(path).st_mode & 0o777, 0o600)
+                with Client(path, timeout=5) as client:
+                    self.assertEqual(client.run([TypeEvent("hi")])[0]["state"], "done")
+            self.assertFalse(os.path.exists(path))
+        self.assertEqual(self.backend.actions(), [("type", "hi", None)])
+
+    def test_token(self):
+        with Agent(("127.0.0.1", 0), backend=self.backend, token="s3cret") as agent:
+            for token in (None, "wrong"):
+                with Client(agent.address, timeout=5, token=token) as client:
+                    with self.assertRaises(ProtocolError):
+                        client.run([MouseScrollEvent(1)])
+            with Client(agent.address, timeout=5, token="s3cret") as client:
+                self.assertEqual(client.run([MouseScrollEvent(1)])[0]["state"], "done")
+        self.assertEqual(self.backend.actions(), [("scroll", 0, 1)])
+
+    def test_remote_bind_is_refused(self):
+        with self.assertRaises(ValueError):
+            Agent(("0.0.0.0", 0), backend=self.backend).start()
+        with self.assertRaises(ValueError):
+            Agent(("", 0), backend=self.backend).start()
+        with self.assertRaises(ValueError):
+            Agent(("0.0.0.0", 0), backend=self.backend, allowremote=True)
+        with Agent(("localhost", 0), backend=self.backend) as agent:
+            self.assertTrue(isloopback(agent.address[0]))
+
+    def test_oversized_frame(self):
+        self.agent.maxframe = 16
+        with Client(self.agent.address, timeout=5) as client:
+            client.socket.sendall(frame(MSG_SUBMIT, 1, bytes(32)))
+            with self.assertRaises(ProtocolError):
+                list(client.wait([1]))
+
+class TestSerialization(unittest.TestCase):
+
+    def timeline(self):
+        return TimeLine(
+            PauseEvent([.1, .2]), MouseClickEvent("right", doubleclick=True), MouseMoveEvent(1, 2, relative=True),
+            MouseMoveEvent(30, 40, motion=True), MouseMoveEvent(5, 6, motion=HumanMotion(rate=250, seed=3)),
+            KeyEvent("a", hold=.5), KeyEvent.fromkey("A"), ChordEvent("ctrl+c, ctrl+v"), TypeEvent("Hi there"),
+            MouseScrollEvent(-3), Loop(KeyEvent("b"), Loop(PauseEvent(1), repeats=2), repeats=4),
+            TypeStreamEvent("typed", cadence=Cadence(cps=12, seed=1)),
+            KeyDownEvent("shift"), MouseDownEvent("m"), MouseUpEvent("m"), KeyUpEvent.fromkey("B"),
+            startpause=[1, 2], repeat=False, seed=7, distribution="lognormal", defaultEventPause=.25, printloops=False
+        )
+
+    def test_round_trip(self):
+        timeline = self.timeline()
+        text = Serialization.dumps(timeline)
+        loaded = Serialization.loads(text)
+        self.assertEqual(Serialization.dumps(loaded), text)
+        self.assertEqual([op for op, a, b in loaded.compile().code], [op for op, a, b in timeline.compile().code])
+        self.assertEqual((loaded.startpause, loaded.random.seed, loaded.random.distribution), ([1, 2], 7, "lognormal"))
+        self.assertIs(loaded.events[3].motion, defaultmotion())
+        self.assertEqual(loaded.events[4].motion.rate, 250)
+        self.assertEqual(loaded.events[6].key, "A")
+        self.assertEqual(json.loads(text)["events"][5], {"type" : "KeyEvent", "key" : "a", "releasedelay" : [.0824, .223], "hold" : .5})
+
+    def test_invalid(self):
+        for text in ("not json", "{}", '{"format" : "rsclick", "version" : 1, "events" : [{"type" : "Nope"}]}',
+                     '{"format" : "rsclick", "version" : 1, "events" : [{"type" : "KeyEvent"}]}'):
+            with self.assertRaises(InvalidFileError):
+                Serialization.loads(text)
+        with self.assertRaises(InvalidEventError):
+            Serialization.dumps(TimeLine(TypeStreamEvent(iter(["a"]))))
+
+    def test_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "script.json")
+            Serialization.save(TimeLine(Loop(KeyEvent("a"), PauseEvent(.5), repeats=3), MouseMoveEvent(1, 2), repeat=False, seed=4), path)
+            cache = TimelineCache(os.path.join(directory, "cache"))
+            first = cache.load(path)
+            second = cache.load(path, startpause=0)
+            self.assertEqual((cache.misses, cache.hits), (1, 1))
+            self.assertIsInstance(second.events, MappedEvents)
+            self.assertEqual((second.startpause, second.repeat, second.random.seed), (0, False, 4))
+            events = list(second.events)
+            self.assertEqual([type(event) for event in events], [Loop, MouseMoveEvent])
+            self.assertEqual(events[0].events[0].releasedelay, Serialization.load(path).events[0].events[0].releasedelay)
+            self.assertEqual(events[0].repeats, 3)
+            self.assertEqual(len(cache.entries()), 1)
+            self.assertFalse([name for name in os.listdir(cache.directory) if name.endswith(".tmp")])
+
+    @unittest.skipUnless(os.path.isdir("/proc/self/fd"), "Open files can not be counted")
+    def test_cache_closes_files(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "script.json")
+            Serialization.save(TimeLine(KeyEvent("a"), PauseEvent(.1), repeat=False), path)
+            cache = TimelineCache(os.path.join(directory, "cache"))
+            cache.load(path)
+            before = len(os.listdir("/proc/self/fd"))
+            for _ in range(20):
+                timeline = cache.load(path)
+                self.assertEqual(list(timeline.events)[1].time, .1)
+            self.assertEqual(len(os.listdir("/proc/self/fd")), before)
+
+    def test_cache_eviction(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = TimelineCache(os.path.join(directory, "cache"), maxbytes=1)
+            for i in range(3):
+                path = os.path.join(directory, f"{i}.json")
+                Serialization.save(TimeLine(MouseScrollEvent(i)), path)
+                cache.load(path)
+            self.assertEqual(len(cache.entries()), 1)
+            path = os.path.join(directory, "stream.json")
+            Serialization.save(TimeLine(TypeStreamEvent("abc", cps=10)), path)
+            timeline = cache.load(path)
+            self.assertIsInstance(timeline.events, tuple)
+            self.assertEqual(len(cache.entries()), 1)
+            for event in (KeyEvent("numpad1"), MouseMoveEvent(10.5, 3)):
+                path = os.path.join(directory, "unstorable.json")
+                Serialization.save(TimeLine(event), path)
+                timeline = cache.load(path)
+                self.assertIsInstance(timeline.events, tuple)
+                self.assertEqual(type(timeline.events[0]), type(event))
+                self.assertEqual(len(cache.entries()), 1)
+                self.assertFalse([name for name in os.listdir(cache.directory) if name.endswith(".tmp")])
+            cache.clear()
+            self.assertEqual(cache.size(), 0)
+
+class TestBenchmarks(unittest.TestCase):
+
+    def test_suite(self):
+        results = suite.run(scale=.002)
+        for name in ("events/s KeyEvent", "events/s Loop depth 4", "lookups/s strtokey", "jitter p99 1ms", "memory per 100k events", "import time"):
+            self.assertGreater(results[name]["value"], 0)
+        self.assertEqual(suite.compare(results, results), [])
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "baseline.json")
+            suite.save(results, path)
+            self.assertEqual(suite.load(path), results)
+
+    def test_compare(self):
+        baseline = {
+            "rate" : suite.result(1000.0, "events/s"),
+            "memory" : suite.result(100.0, "bytes", "lower"),
+            "jitter" : suite.result(.0001, "s", "lower", slack=.001),
+        }
+        results = {
+            "rate" : suite.result(700.0, "events/s"),
+            "memory" : suite.result(110.0, "bytes", "lower"),
+            "jitter" : suite.result(.0005, "s", "lower", slack=.001),
+            "new" : suite.result(1.0, "s", "lower"),
+        }
+        self.assertEqual([name for name, old, new, change in suite.compare(results, baseline)], ["rate"])
+        self.assertEqual(suite.compare(results, baseline, tolerance=.5), [])
+        self.assertIn("-30.0% vs baseline", suite.render(results, baseline))
+
+class TestImportTime(unittest.TestCase):
+
+    # How long the import takes is measured by the benchmarks, which can gate it against a
+    # baseline; here only the modules it loads are checked, which does not depend on load.
+    def test_import_is_light(self):
+        seconds, loaded = suite.measureimport()
+        self.assertEqual(loaded, ())
+
+class TestTimeLine(DeviceTestCase):
 
     def test_time_line(self):
         TimeLine(
@@ -20,10 +20,47 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import functools
+
+
+class LazyModule:
+    """Stands in for a module and imports it the first time one of its attributes is used.
+
+    Args:
+        name (str): The name of the module to import.
+    """
+
+
+    def __init__(self, name : str):
+        self.__name = name
+
+
+    def __getattr__(self, attr : str) -> object:
+        import importlib
+        value = getattr(importlib.import_module(self.__name), attr)
+        setattr(self, attr, value)
+        return value
+
+
+random = LazyModule("random")
+
+
+# Names of pynput's Key members and mouse buttons. Events hold keys and buttons by these names,
+# and only the PynputBackend turns them into pynput objects. Their positions are used as stable
+# ids in binary timeline files, so new names must only ever be appended.
+KEYNAMES = (
+    "alt", "alt_l", "alt_r", "alt_gr", "backspace", "caps_lock", "cmd", "cmd_l", "cmd_r",
+    "ctrl", "ctrl_l", "ctrl_r", "delete", "down", "end", "enter", "esc",
+    "f1", "f2", "f3", "f4", "f5", "f6", "f7", "f8", "f9", "f10", "f11", "f12",
+    "f13", "f14", "f15", "f16", "f17", "f18", "f19", "f20",
+    "home", "left", "page_down", "page_up", "right", "shift", "shift_l", "shift_r",
+    "space", "tab", "up", "media_play_pause", "media_volume_mute", "media_volume_down",
+    "media_volume_up", "media_previous", "media_next", "insert", "menu", "num_lock",
+    "pause", "print_screen", "scroll_lock", "f21", "f22", "f23", "f24",
+    "media_stop", "media_eject",
+)
+BUTTONNAMES = ("left", "right", "middle")
 
-import random
-from pynput.mouse import Button
-from pynput.keyboard import Key
 
 def rfloatrange(lower : float, upper : float) -> float:
     """Generate a randomized float within the provided range. 
@@ -77,7 +114,7 @@ class InvalidButtonError(Exception):
 
 
     def __init__(self):
-        self.message = "Invalid button, options are \"l\" \"left\" \"r\" or \"right\""
+        self.message = "Invalid button, options are \"l\" \"left\" \"r\" \"right\" \"m\" or \"middle\""
         super().__init__(self.message)
 
 class InvalidEventError(Exception):
@@ -88,69 +125,130 @@ class InvalidEventError(Exception):
         super().__init__(self.message)
 
 
-def strtobtn(str : str) -> object:
+# Alternative spellings accepted for key names, on top of the names in KEYNAMES with or without
+# their underscores.
+KEYALIASES = {
+    "command" : "cmd", "win" : "cmd", "super" : "cmd", "control" : "ctrl", "option" : "alt",
+    "altgr" : "alt_gr", "return" : "enter", "escape" : "esc", "del" : "delete", "ins" : "insert",
+    "pgup" : "page_up", "pgdn" : "page_down", "capslock" : "caps_lock", "prtsc" : "print_screen",
+    "playpause" : "media_play_pause", "mute" : "media_volume_mute", "volumeup" : "media_volume_up",
+    "volumedown" : "media_volume_down", "nexttrack" : "media_next", "prevtrack" : "media_previous",
+    "plus" : "+", "comma" : ",",
+}
+BUTTONALIASES = {"l" : "left", "r" : "right", "m" : "middle"}
+
+_KEYTABLE = None
+_BUTTONTABLE = None
+
+
+def keytable() -> dict:
+    """Returns the table mapping every accepted key name to its name in KEYNAMES, building it on first use.
+
+    Returns:
+        dict: Maps lowercase names without spaces to key names, or to a character for "plus" and "comma".
+    """
+    global _KEYTABLE
+    if _KEYTABLE is None:
+        table = {}
+        for name in KEYNAMES:
+            table[name] = name
+            table.setdefault(name.replace("_", ""), name)
+        for alias, name in KEYALIASES.items():
+            table[alias] = table.get(name, name)
+        _KEYTABLE = table
+    return _KEYTABLE
+
+
+def buttontable() -> dict:
+    """Returns the table mapping every accepted button name to its name in BUTTONNAMES, building it on first use.
+
+    Returns:
+        dict: Maps lowercase names to button names.
+    """
+    global _BUTTONTABLE
+    if _BUTTONTABLE is None:
+        table = {name : name for name in BUTTONNAMES}
+        for alias, name in BUTTONALIASES.items():
+            table[alias] = name
+        _BUTTONTABLE = table
+    return _BUTTONTABLE
+
+
+class InvalidKeyError(Exception):
+    """Exception raised when a key spec can not be parsed."""
+
+
+    def __init__(self, spec : str = ""):
+        self.message = f"Invalid key spec {spec!r}, chords are keys joined with \"+\" and separated by \",\"."
+        super().__init__(self.message)
+
+
+def strtobtn(str : str) -> str:
     """Converts a string to the button representation.
 
     Args:
-        str (str): The string to be converted. 
+        str (str): The string to be converted. pynput Buttons are converted by their name.
 
     Raises:
         InvalidButtonError: Raised if the string passed in is invalid.
 
     Returns:
-        object: Returns the Button object. 
+        str: Returns the button's name, "left", "right" or "middle".
     """
-    
-    str = str.lower().strip().replace(" " , "")
-    dict = {
-        "l" : Button.left,
-        "left" : Button.left,
-        "r" : Button.right,
-        "right" : Button.right
-    }
-    if str not in dict:
+    str = getattr(str, "name", str)
+    if not hasattr(str, "lower"):
+        raise InvalidButtonError
+    button = buttontable().get(str.lower().strip().replace(" " , ""))
+    if button is None:
         raise InvalidButtonError
-    return dict[str]
+    return button
 
 
 def strtokey(str : str) -> object:
-    """Converts a string to the key representation.
+    """Converts a string to the key representation. Keys are held as the name of a pynput Key,
+    a single character or a virtual key code, so creating events never needs pynput.
 
     Args:
-        str (str): The string to be converted. 
+        str (str): The string to be converted, the name of any pynput Key or a single character. pynput Key and KeyCode objects are converted to their name, character or virtual key code.
 
     Returns:
-        Key: Returns the key object or string required by the controller. 
+        object: Returns the key name, character or virtual key code. 
     """
-    
+    if not hasattr(str, "lower"):
+        if isinstance(str, int):
+            return str
+        name = getattr(str, "name", None)
+        if name is not None:
+            return name
+        char = getattr(str, "char", None)
+        if char is not None:
+            return char
+        return getattr(str, "vk", None) or str
     str = str.lower().strip().replace(" ", "")
-    dict = {
-        "tab" : Key.tab,
-        "alt" : Key.alt,
-        "backspace" : Key.backspace,
-        "capslock" : Key.caps_lock,
-        "command" : Key.cmd,
-        "win" : Key.cmd,
-        "ctrl" : Key.ctrl,
-        "delete" : Key.delete,
-        "up": Key.up,
-        "left" : Key.left,
-        "right" : Key.right,
-        "down" : Key.down,
-        "end" : Key.end,
-        "enter" : Key.enter,
-        "esc" : Key.esc,
-        "f1" : Key.f1,
-        "f2" : Key.f2,
-        "f3" : Key.f3, 
-        "f4" : Key.f4,
-        "f5" : Key.f5,
-        "f6" : Key.f6,
-        "f7" : Key.f7,
-        "f8" : Key.f8,
-        "f9" : Key.f9,
-        "home" : Key.home,
-        "shift" : Key.shift,
-        "space" : Key.space,
-    }
-    return dict[str] if str in dict else str
+    return keytable().get(str, str)
+
+
+@functools.lru_cache(maxsize=1024)
+def parsekeys(spec : str) -> tuple:
+    """Compiles a key spec into keys. The most recently used specs are cached.
+
+    A spec is a sequence of chords separated by commas, and a chord is a list of keys joined
+    with "+", pressed in order and released in reverse, e.g. "ctrl+shift+t" or "ctrl+c, ctrl+v".
+    Use "plus" and "comma" for those characters.
+
+    Args:
+        spec (str): The key spec.
+
+    Raises:
+        InvalidKeyError: Raised if the spec or one of its chords is empty, or names an unknown key.
+
+    Returns:
+        tuple: One tuple of keys per chord.
+    """
+    chords = []
+    for chord in spec.split(","):
+        keys = tuple(strtokey(key) for key in chord.split("+"))
+        if not all(keys) or any(len(key) > 1 and key not in KEYNAMES for key in keys):
+            raise InvalidKeyError(spec)
+        chords.append(keys)
+    return tuple(chords)